@@ -0,0 +1,193 @@
+import argparse
+import contextlib
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from multiprocessing import get_context
+from typing import Dict, List, Optional
+
+from gerar_extrato_sintetico import gerar_extrato
+
+TAMANHOS_PADRAO = (10_000, 100_000, 1_000_000)
+
+# Tempo máximo (mediana) de "python mexc_to_koinly.py --help" em um processo novo
+ORCAMENTO_INICIALIZACAO_S = 0.25
+MODULOS_PESADOS = ("pandas", "numpy", "openpyxl")
+
+def rss_pico_mb() -> Optional[float]:
+    """
+    Retorna o pico de memória residente (RSS) do processo até agora, em MB.
+    Retorna None em sistemas sem o módulo resource (Windows).
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux informa em KB, macOS em bytes
+    return pico / (1024 * 1024) if sys.platform == "darwin" else pico / 1024
+
+def medir_estagios(input_file: str, output_file: str) -> Dict[str, dict]:
+    """
+    Executa o pipeline de conversão estágio por estágio (detect, read, dates,
+    amounts, classify, match, write, reconcile), medindo tempo de
+    parede e pico de RSS (acumulado do processo) ao final de cada estágio.
+    Os estágios de converter_dataframe, da escrita e da conciliação vêm da
+    Instrumentacao da conversão, que lê o pico de RSS ao sair de cada um.
+    Deve rodar em um processo novo para que o pico de RSS seja significativo.
+    """
+    import mexc_to_koinly as conversor
+
+    estagios = {}
+
+    @contextlib.contextmanager
+    def estagio(nome):
+        inicio = time.perf_counter()
+        yield
+        estagios[nome] = {"tempo_s": round(time.perf_counter() - inicio, 4), "rss_pico_mb": rss_pico_mb()}
+
+    with estagio("detect"):
+        formato, planilha = conversor.detectar_formato_arquivo(input_file)
+    with estagio("read"):
+        df = conversor.read_mexc_file(input_file, planilha)
+    mapeamento = conversor.FORMATOS[formato]
+    instrumentacao = conversor.Instrumentacao(memoria=rss_pico_mb)
+    partes = conversor.converter_dataframe(df, mapeamento, instrumentacao)
+    with conversor.EscritorKoinly(output_file, instrumentacao=instrumentacao) as escritor:
+        escritor.escrever_partes(partes)
+    conversor.conciliar_koinly(output_file, instrumentacao)
+    for nome, tempo in instrumentacao.estagios.items():
+        estagios[nome] = {"tempo_s": round(tempo, 4), "rss_pico_mb": instrumentacao.rss_pico_mb[nome]}
+
+    estagios["total"] = {
+        "tempo_s": round(sum(e["tempo_s"] for e in estagios.values()), 4),
+        "rss_pico_mb": rss_pico_mb()
+    }
+    return estagios
+
+def medir_inicializacao(repeticoes: int = 7) -> dict:
+    """
+    Mede a inicialização a frio da linha de comando (--help) e verifica que
+    importar mexc_to_koinly não carrega pandas, numpy nem openpyxl.
+    """
+    pasta = os.path.dirname(os.path.abspath(__file__))
+    script = os.path.join(pasta, "mexc_to_koinly.py")
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        subprocess.run([sys.executable, script, "--help"], check=True, capture_output=True)
+        tempos.append(time.perf_counter() - inicio)
+
+    verificacao = (
+        "import sys, mexc_to_koinly; "
+        f"print(','.join(m for m in {MODULOS_PESADOS!r} if m in sys.modules))"
+    )
+    saida = subprocess.run([sys.executable, "-c", verificacao], check=True, capture_output=True, text=True, cwd=pasta)
+    carregados = [m for m in saida.stdout.strip().split(",") if m]
+
+    mediana = statistics.median(tempos)
+    return {
+        "mediana_s": round(mediana, 4),
+        "orcamento_s": ORCAMENTO_INICIALIZACAO_S,
+        "modulos_pesados_no_import": carregados,
+        "ok": mediana <= ORCAMENTO_INICIALIZACAO_S and not carregados
+    }
+
+def executar_benchmark(tamanhos=TAMANHOS_PADRAO, extensao: str = "xlsx", pasta: str = "benchmark_dados",
+                       semente: int = 42, formato: str = "FORMATO_2") -> dict:
+    """
+    Gera (ou reaproveita) extratos sintéticos de cada tamanho e mede o
+    pipeline em um processo separado por tamanho.
+
+    Returns:
+        dict: Resultado serializável em JSON, com metadados do ambiente
+    """
+    import pandas as pd
+    from mexc_to_koinly import VERSAO
+
+    os.makedirs(pasta, exist_ok=True)
+    execucoes = []
+    for linhas in tamanhos:
+        sufixo = "" if formato == "FORMATO_2" else f"_{formato.lower()}"
+        entrada = os.path.join(pasta, f"mexc_{linhas}_{semente}{sufixo}.{extensao}")
+        if not os.path.exists(entrada):
+            print(f"Gerando {entrada}...")
+            gerar_extrato(entrada, formato=formato, linhas=linhas, semente=semente)
+        saida = os.path.join(pasta, f"koinly_{linhas}.csv")
+
+        print(f"Medindo {linhas} linhas...")
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+            estagios = executor.submit(medir_estagios, entrada, saida).result()
+        execucoes.append({"linhas": linhas, "arquivo": entrada, "estagios": estagios})
+
+    return {
+        "versao": VERSAO,
+        "data": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "plataforma": platform.platform(),
+        "formato": formato,
+        "inicializacao": medir_inicializacao(),
+        "execucoes": execucoes
+    }
+
+def comparar_resultados(anterior: dict, atual: dict) -> List[str]:
+    """
+    Compara dois resultados de benchmark e retorna uma linha por tamanho e
+    estágio, com o tempo anterior, o atual e a razão atual/anterior.
+    """
+    anteriores = {e["linhas"]: e["estagios"] for e in anterior["execucoes"]}
+    linhas = []
+    for execucao in atual["execucoes"]:
+        base = anteriores.get(execucao["linhas"])
+        if base is None:
+            continue
+        for nome, medida in execucao["estagios"].items():
+            if nome not in base or not base[nome]["tempo_s"]:
+                continue
+            razao = medida["tempo_s"] / base[nome]["tempo_s"]
+            linhas.append(
+                f"{execucao['linhas']:>9} {nome:<9} {base[nome]['tempo_s']:>9.3f}s -> "
+                f"{medida['tempo_s']:>9.3f}s ({razao:.2f}x)"
+            )
+    return linhas
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark do conversor MEXC -> Koinly por estágio.")
+    parser.add_argument("--tamanhos", type=int, nargs="+", default=list(TAMANHOS_PADRAO))
+    parser.add_argument("--extensao", choices=("xlsx", "csv"), default="xlsx")
+    parser.add_argument("--pasta", default="benchmark_dados", help="Pasta dos extratos sintéticos")
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument("--formato", choices=("FORMATO_1", "FORMATO_2"), default="FORMATO_2",
+                        help="Layout dos extratos sintéticos")
+    parser.add_argument("--saida", default="benchmark_resultado.json", help="Arquivo JSON com os resultados")
+    parser.add_argument("--comparar", help="JSON de uma execução anterior para comparação")
+    parser.add_argument("--inicializacao", action="store_true",
+                        help="Só verifica o orçamento de inicialização; sai com código 1 se for excedido")
+    args = parser.parse_args()
+
+    if args.inicializacao:
+        medida = medir_inicializacao()
+        print(json.dumps(medida, ensure_ascii=False))
+        sys.exit(0 if medida["ok"] else 1)
+
+    resultado = executar_benchmark(args.tamanhos, args.extensao, args.pasta, args.semente, args.formato)
+    with open(args.saida, 'w', encoding='utf-8') as f:
+        json.dump(resultado, f, ensure_ascii=False, indent=2)
+    print(f"Resultados salvos em {args.saida}")
+
+    for execucao in resultado["execucoes"]:
+        for nome, medida in execucao["estagios"].items():
+            print(f"{execucao['linhas']:>9} {nome:<9} {medida['tempo_s']:>9.3f}s  {medida['rss_pico_mb']} MB")
+
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as f:
+            anterior = json.load(f)
+        print("\nComparação com", args.comparar)
+        print("\n".join(comparar_resultados(anterior, resultado)))
@@ -0,0 +1,201 @@
+import argparse
+import csv
+import os
+import random
+from datetime import datetime, timedelta
+from typing import Iterator, List, Optional, Tuple
+
+from mexc_to_koinly import FORMATOS
+
+# Moedas usadas primeiro na geração dos pares; depois vêm tokens sintéticos
+MOEDAS_CONHECIDAS = [
+    "BTC", "ETH", "SOL", "XRP", "DOGE", "PEPE", "MX", "ADA", "TRX", "LINK",
+    "AVAX", "SHIB", "DOT", "TON", "LTC", "KAS", "SUI", "APT", "ARB", "OP"
+]
+
+def gerar_pares(quantidade: int) -> List[Tuple[str, str]]:
+    """
+    Gera quantidade pares (base, cotação). A maioria é cotada em USDT,
+    com alguns pares cotados em BTC, como nos extratos reais.
+    """
+    pares = []
+    for i in range(quantidade):
+        base = MOEDAS_CONHECIDAS[i] if i < len(MOEDAS_CONHECIDAS) else f"TOKEN{i}"
+        cotacao = "BTC" if i % 10 == 9 and base != "BTC" else "USDT"
+        pares.append((base, cotacao))
+    return pares
+
+def _formatar_valor(valor: float, decimal: str) -> str:
+    texto = f"{valor:.8f}".rstrip('0').rstrip('.')
+    return texto.replace('.', decimal) if decimal != '.' else texto
+
+def gerar_transacoes_formato_2(linhas: int, pares: int = 20, fills_por_segundo: int = 3,
+                               proporcao_depositos: float = 0.05, proporcao_airdrops: float = 0.02,
+                               semente: int = 42, inicio: Optional[datetime] = None,
+                               pares_por_segundo: int = 1) -> Iterator[tuple]:
+    """
+    Gera linhas no FORMATO_2 (histórico de transações): depósitos, airdrops e
+    trades spot com várias execuções (fills) no mesmo segundo. Cada fill gera
+    uma perna de entrada, uma de saída e uma taxa na moeda de cotação. Com
+    pares_por_segundo > 1, um segundo pode ter trades de vários pares
+    diferentes, um depois do outro, cada um com as suas taxas.
+
+    Args:
+        linhas (int): Número aproximado de linhas a gerar
+        pares (int): Número de pares negociados
+        fills_por_segundo (int): Máximo de execuções de um par no mesmo segundo
+        proporcao_depositos (float): Fração dos eventos que são depósitos
+        proporcao_airdrops (float): Fração dos eventos que são airdrops
+        semente (int): Semente do gerador aleatório, para resultados reprodutíveis
+        inicio (datetime): Data/hora da primeira transação
+        pares_por_segundo (int): Máximo de pares diferentes negociados no mesmo segundo
+
+    Yields:
+        tuple: (data, cripto, tipo, direção, quantidade) na ordem de FORMATOS["FORMATO_2"]
+    """
+    rng = random.Random(semente)
+    lista_pares = gerar_pares(pares)
+    momento = inicio or datetime(2024, 1, 1)
+    geradas = 0
+    while geradas < linhas:
+        momento += timedelta(seconds=rng.choice((1, 1, 2, 5, 60, 3600)))
+        data = momento.strftime("%Y-%m-%d %H:%M:%S")
+        sorteio = rng.random()
+        if sorteio < proporcao_depositos:
+            cripto = rng.choice(("USDT", "BTC", "ETH"))
+            yield (data, cripto, "Depositar", "Fluxo de entrada", round(rng.uniform(10, 5000), 6))
+            geradas += 1
+        elif sorteio < proporcao_depositos + proporcao_airdrops:
+            base, _ = rng.choice(lista_pares)
+            yield (data, base, "Airdrop", "Fluxo de entrada", round(rng.uniform(1, 1000), 4))
+            geradas += 1
+        else:
+            # Sem pares simultâneos, um único sorteio, como nos extratos já gerados com a mesma semente
+            if pares_por_segundo > 1:
+                negociados = rng.sample(lista_pares, min(rng.randint(1, pares_por_segundo), len(lista_pares)))
+            else:
+                negociados = [rng.choice(lista_pares)]
+            for base, cotacao in negociados:
+                compra = rng.random() < 0.5
+                preco = rng.uniform(0.0001, 100)
+                for _ in range(rng.randint(1, fills_por_segundo)):
+                    qtd_base = round(rng.uniform(0.001, 50), 8)
+                    qtd_cotacao = round(qtd_base * preco, 8)
+                    taxa = round(qtd_cotacao * 0.001, 8)
+                    if compra:
+                        yield (data, base, "Negociação Spot", "Fluxo de entrada", qtd_base)
+                        yield (data, cotacao, "Negociação Spot", "Fluxo de saída", -qtd_cotacao)
+                    else:
+                        yield (data, base, "Negociação Spot", "Fluxo de saída", -qtd_base)
+                        yield (data, cotacao, "Negociação Spot", "Fluxo de entrada", qtd_cotacao)
+                    yield (data, cotacao, "Taxas de Negociação Spot", "Fluxo de saída", -taxa)
+                    geradas += 3
+
+def gerar_ordens_formato_1(linhas: int, pares: int = 20, fills_por_segundo: int = 3,
+                           semente: int = 42, inicio: Optional[datetime] = None) -> Iterator[tuple]:
+    """
+    Gera linhas no FORMATO_1 (histórico de ordens), uma por ordem.
+    fills_por_segundo controla quantas ordens podem ser criadas no mesmo segundo.
+
+    Yields:
+        tuple: Valores na ordem das colunas de FORMATOS["FORMATO_1"]
+    """
+    rng = random.Random(semente)
+    lista_pares = gerar_pares(pares)
+    momento = inicio or datetime(2024, 1, 1)
+    geradas = 0
+    while geradas < linhas:
+        momento += timedelta(seconds=rng.choice((1, 1, 2, 5, 60, 3600)))
+        hora = momento.strftime("%Y-%m-%d %H:%M:%S")
+        for _ in range(rng.randint(1, fills_por_segundo)):
+            base, cotacao = rng.choice(lista_pares)
+            preco = round(rng.uniform(0.0001, 100), 8)
+            qtd_ordem = round(rng.uniform(0.001, 50), 8)
+            status = rng.choices(("Preenchido", "Cancelado", "Parcialmente Preenchido"), (85, 10, 5))[0]
+            qtd_preenchida = {"Preenchido": qtd_ordem, "Cancelado": 0.0}.get(status, round(qtd_ordem / 2, 8))
+            yield (
+                f"{base}_{cotacao}",
+                hora,
+                rng.choice(("Limite", "Mercado")),
+                rng.choice(("Comprar", "Vender")),
+                preco,
+                preco,
+                qtd_preenchida,
+                qtd_ordem,
+                round(qtd_preenchida * preco, 8),
+                status
+            )
+            geradas += 1
+
+def gerar_extrato(caminho: str, formato: str = "FORMATO_2", linhas: int = 10_000, pares: int = 20,
+                  fills_por_segundo: int = 3, proporcao_depositos: float = 0.05,
+                  proporcao_airdrops: float = 0.02, semente: int = 42, decimal: str = '.',
+                  pares_por_segundo: int = 1) -> int:
+    """
+    Gera um extrato sintético do MEXC em .xlsx ou em .csv separado por ';'.
+
+    Args:
+        caminho (str): Arquivo de saída; a extensão define o tipo (.xlsx ou .csv)
+        formato (str): "FORMATO_1" ou "FORMATO_2"
+        linhas (int): Número aproximado de linhas
+        decimal (str): Separador decimal no CSV ('.' ou ',')
+        pares_por_segundo (int): No FORMATO_2, máximo de pares negociados no mesmo segundo
+
+    Returns:
+        int: Número de linhas geradas
+    """
+    if formato == "FORMATO_2":
+        geradas = gerar_transacoes_formato_2(linhas, pares, fills_por_segundo,
+                                             proporcao_depositos, proporcao_airdrops, semente,
+                                             pares_por_segundo=pares_por_segundo)
+    elif formato == "FORMATO_1":
+        geradas = gerar_ordens_formato_1(linhas, pares, fills_por_segundo, semente)
+    else:
+        raise ValueError(f"Formato não suportado: {formato}")
+    cabecalho = list(FORMATOS[formato].values())
+
+    total = 0
+    ext = os.path.splitext(caminho)[1].lower()
+    if ext == ".xlsx":
+        from openpyxl import Workbook
+
+        # write_only mantém a memória constante mesmo com milhões de linhas
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet()
+        ws.append(cabecalho)
+        for linha in geradas:
+            ws.append(linha)
+            total += 1
+        wb.save(caminho)
+    elif ext == ".csv":
+        with open(caminho, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f, delimiter=';')
+            writer.writerow(cabecalho)
+            for linha in geradas:
+                writer.writerow([
+                    _formatar_valor(valor, decimal) if isinstance(valor, float) else valor
+                    for valor in linha
+                ])
+                total += 1
+    else:
+        raise ValueError(f"Extensão não suportada: {ext}")
+    return total
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Gera extratos sintéticos do MEXC para testes e benchmarks.")
+    parser.add_argument("saida", help="Arquivo de saída (.xlsx ou .csv)")
+    parser.add_argument("--formato", choices=sorted(FORMATOS), default="FORMATO_2")
+    parser.add_argument("--linhas", type=int, default=10_000)
+    parser.add_argument("--pares", type=int, default=20)
+    parser.add_argument("--fills-por-segundo", type=int, default=3)
+    parser.add_argument("--pares-por-segundo", type=int, default=1,
+                        help="Máximo de pares diferentes negociados no mesmo segundo (FORMATO_2)")
+    parser.add_argument("--depositos", type=float, default=0.05, help="Fração de depósitos")
+    parser.add_argument("--airdrops", type=float, default=0.02, help="Fração de airdrops")
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument("--decimal", choices=('.', ','), default='.', help="Separador decimal no CSV")
+    args = parser.parse_args()
+
+    total = gerar_extrato(args.saida, args.formato, args.linhas, args.pares, args.fills_por_segundo,
+                          args.depositos, args.airdrops, args.semente, args.decimal, args.pares_por_segundo)
+    print(f"{total} linhas geradas em {args.saida}")
@@ -1,33 +1,69 @@
-import sys
-import subprocess
-import pandas as pd
+from __future__ import annotations
+
+import argparse
+import contextlib
+import importlib
+import time
+import hashlib
+import json
+import pickle
+import re
 import csv
+import gzip
+import io
 import os
-from datetime import datetime
-from typing import Dict, List, Optional, Tuple
+import glob
+import heapq
+import shutil
+import tempfile
+import zipfile
+import posixpath
+import sys
+from xml.etree import ElementTree
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
 import logging
 import traceback
+from collections import Counter, deque
+from importlib.util import find_spec
+from itertools import islice
+from decimal import Decimal, InvalidOperation
 
-# Configuração de logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
 logger = logging.getLogger(__name__)
 
+# Versão do conversor; também invalida o cache de leitura e os checkpoints quando muda
+VERSAO = "1.2.3"
+
 ##############################################################################
-# 1) Funções para checar e instalar dependências
+# 1) Importação tardia das dependências pesadas
 ##############################################################################
-def check_and_install(package_name):
-    try:
-        __import__(package_name)
-    except ImportError:
-        logger.info(f"Pacote '{package_name}' não encontrado. Instalando agora...")
-        subprocess.check_call([sys.executable, "-m", "pip", "install", package_name])
-        logger.info(f"Pacote '{package_name}' instalado com sucesso!")
+class _ImportacaoTardia:
+    """
+    Representa um módulo que só é importado no primeiro acesso a um atributo.
+    Assim, importar este arquivo (ou rodar --help) não carrega pandas e numpy,
+    que só são necessários quando a conversão começa de fato.
+    """
 
-check_and_install("pandas")
-check_and_install("openpyxl")
+    def __init__(self, nome: str):
+        self._nome = nome
+        self._modulo = None
+
+    def __getattr__(self, atributo: str):
+        if self._modulo is None:
+            try:
+                self._modulo = importlib.import_module(self._nome)
+            except ImportError as e:
+                raise ImportError(
+                    f"Pacote '{self._nome}' não encontrado. Instale as dependências com: "
+                    f"pip install -r requirements.txt"
+                ) from e
+        valor = getattr(self._modulo, atributo)
+        # Guarda o atributo no próprio objeto; os próximos acessos não passam por aqui
+        setattr(self, atributo, valor)
+        return valor
+
+pd = _ImportacaoTardia("pandas")
+np = _ImportacaoTardia("numpy")
 
 ##############################################################################
 # 2) Definição dos formatos suportados e mapeamento de colunas
@@ -56,6 +92,60 @@ FORMATOS = {
     }
 }
 
+# Fuso horário dos extratos quando não dá para deduzi-lo do nome da coluna de data.
+# O MEXC exporta no fuso da conta ("UTC+-3" = UTC-3 para contas brasileiras).
+FUSO_ORIGEM_PADRAO_HORAS = -3
+FORMATO_DATA_MEXC = "%Y-%m-%d %H:%M:%S"
+# A mesma data como expressão regular, para validar o texto sem convertê-lo
+_DATA_MEXC = r"\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}"
+FORMATO_DATA_KOINLY = "%Y-%m-%d %H:%M:%S UTC"
+
+# Número de linhas por bloco na leitura em streaming
+TAMANHO_BLOCO_PADRAO = 50_000
+
+# Linhas acumuladas pelo EscritorKoinly antes de cada escrita no arquivo
+TAMANHO_BUFFER_ESCRITA = 10_000
+
+# Conversão paralela de um extrato (ver converter_em_particoes): partições por
+# processo, para equilibrar a carga, e tamanho mínimo que compensa despachar uma partição
+PARTICOES_POR_PROCESSO = 4
+TAMANHO_MINIMO_PARTICAO = 20_000
+
+# Separadores de campo aceitos em CSV, em ordem de preferência (o MEXC usa ';')
+DELIMITADORES_CSV = ";,\t|"
+# Caracteres do início do CSV usados para descobrir separador e decimal
+TAMANHO_AMOSTRA_CSV = 64 * 1024
+# Colunas numéricas dos formatos, lidas como float já na leitura do CSV
+CHAVES_NUMERICAS = (
+    "COL_QUANTIDADE", "COL_PRECO_MEDIO", "COL_PRECO_ORDEM",
+    "COL_QTD_PREENCHIDA", "COL_QTD_ORDEM", "COL_MONTANTE_ORDEM"
+)
+
+# Cache de arquivos já lidos (ver ler_mexc_com_cache)
+DIRETORIO_CACHE_PADRAO = os.path.join(os.path.expanduser("~"), ".cache", "mexc_to_koinly")
+TAMANHO_MAXIMO_CACHE = 512 * 1024 * 1024
+# Nomes das entradas gravadas no cache: "<versão>-<sha256>.pkl" (extratos) e
+# "<versão>-precos-<sha256>.pkl" (tabelas de preços); outros arquivos da pasta não são tocados
+_ENTRADA_CACHE = re.compile(r"(\d+(?:\.\d+)*)-(?:precos-)?[0-9a-f]{64}\.pkl")
+
+# Tabela de preços local (carregar_precos / preencher_net_worth)
+MOEDA_REFERENCIA_PADRAO = "USD"
+# Idade máxima, em segundos, de um preço usado para preencher o Net Worth
+IDADE_MAXIMA_PRECO_S = 24 * 3600
+# Nomes aceitos para as colunas da tabela de preços, comparados em minúsculas e na ordem de preferência
+COLUNAS_PRECOS = {
+    "moeda": ("moeda", "cripto", "asset", "symbol", "coin", "currency", "ticker"),
+    "data": ("data", "date", "datetime", "timestamp", "time", "open_time"),
+    "preco": ("preco", "preço", "price", "close", "fechamento")
+}
+# Espaço de cada moeda nas chaves de TabelaPrecos: segundos UTC até o ano 2514
+_ESPACO_TEMPO_PRECOS = 2 ** 34
+
+# Quantas pernas sem par são listadas no relatório do --profile (o contador tem o total)
+LIMITE_PERNAS_SEM_PAR_RELATORIO = 1000
+# Quantas linhas com taxa divergente são listadas no relatório de conciliação (o total vem à parte)
+LIMITE_TAXAS_DIVERGENTES_RELATORIO = 100
+
 COLUNAS_KOINLY = [
     'Date',
     'Sent Amount',
@@ -71,30 +161,352 @@ COLUNAS_KOINLY = [
     'TxHash'
 ]
 
+class LinhaKoinly(NamedTuple):
+    """
+    Uma linha do CSV do Koinly, com os campos na ordem de COLUNAS_KOINLY.
+    É uma tupla (sem dicionário por instância), escrita diretamente pelo
+    csv.writer do EscritorKoinly; use _asdict() para obter um dicionário.
+    """
+    date: str
+    sent_amount: str
+    sent_currency: str
+    received_amount: str
+    received_currency: str
+    fee_amount: str
+    fee_currency: str
+    net_worth_amount: str
+    net_worth_currency: str
+    label: str
+    description: str
+    txhash: str
+
+# Colunas da tabela de transações do banco local (BancoTransacoes), na ordem de COLUNAS_KOINLY
+COLUNAS_BANCO = list(LinhaKoinly._fields)
+
+# Colunas do CSV do Koinly lidas pela conciliação de saldos (conciliar_koinly)
+COLUNAS_CONCILIACAO = [
+    'Date',
+    'Sent Amount',
+    'Sent Currency',
+    'Received Amount',
+    'Received Currency',
+    'Fee Amount',
+    'Fee Currency',
+    'Label'
+]
+
+class Instrumentacao:
+    """
+    Acumula o tempo gasto em cada estágio do pipeline (read, detect, classify,
+    match, write) e contadores da conversão, como linhas lidas, grupos de
+    trades, pernas sem par e linhas escritas.
+
+    Args:
+        memoria (callable): Função que retorna o pico de RSS do processo em
+            MB, chamada ao final de cada estágio (padrão: não mede memória)
+    """
+
+    def __init__(self, memoria: Optional[Callable[[], Optional[float]]] = None):
+        self.estagios: Dict[str, float] = {}
+        self.memoria = memoria
+        # Pico de RSS do processo ao final da última execução de cada estágio
+        self.rss_pico_mb: Dict[str, Optional[float]] = {}
+        self.contadores: Counter = Counter()
+        self.pernas_sem_par: List[dict] = []
+        self.totais_sem_par: Dict[Tuple[str, str], Decimal] = {}
+
+    @contextlib.contextmanager
+    def estagio(self, nome: str):
+        """Mede o bloco como parte do estágio nome (tempos são somados)."""
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.estagios[nome] = self.estagios.get(nome, 0.0) + time.perf_counter() - inicio
+            if self.memoria is not None:
+                self.rss_pico_mb[nome] = self.memoria()
+
+    def contar(self, nome: str, quantidade: int = 1):
+        self.contadores[nome] += quantidade
+
+    def registrar_perna_sem_par(self, timestamp, moeda: str, lado: str, quantidade: str):
+        """Conta uma perna de trade (entrada, saída ou taxa) que não pôde ser pareada."""
+        self.contar("pernas_sem_par")
+        chave = (moeda, lado)
+        self.totais_sem_par[chave] = self.totais_sem_par.get(chave, Decimal(0)) + Decimal(quantidade or 0)
+        if len(self.pernas_sem_par) < LIMITE_PERNAS_SEM_PAR_RELATORIO:
+            self.pernas_sem_par.append(
+                {"timestamp": str(timestamp), "moeda": moeda, "lado": lado, "quantidade": quantidade}
+            )
+
+    def juntar(self, outra: "Instrumentacao"):
+        """
+        Acrescenta os contadores e as pernas sem par de outra instrumentação
+        (de um processo do pool). Os tempos não são somados: o processo
+        principal mede o estágio que engloba o trabalho dos processos.
+        """
+        self.contadores.update(outra.contadores)
+        espaco = LIMITE_PERNAS_SEM_PAR_RELATORIO - len(self.pernas_sem_par)
+        self.pernas_sem_par.extend(outra.pernas_sem_par[:max(espaco, 0)])
+        for chave, total in outra.totais_sem_par.items():
+            self.totais_sem_par[chave] = self.totais_sem_par.get(chave, Decimal(0)) + total
+
+    def relatorio(self) -> dict:
+        return {
+            "versao": VERSAO,
+            "estagios_s": {nome: round(tempo, 6) for nome, tempo in self.estagios.items()},
+            "total_s": round(sum(self.estagios.values()), 6),
+            "contadores": dict(self.contadores),
+            "pernas_sem_par": self.pernas_sem_par
+        }
+
+    def salvar_relatorio(self, caminho: str):
+        with open(caminho, 'w', encoding='utf-8') as f:
+            json.dump(self.relatorio(), f, ensure_ascii=False, indent=2)
+
+# Índices do registro de formatos (mantidos por registrar_formato)
+_FORMATOS_POR_COLUNA: Dict[str, List[str]] = {}
+_DETECCOES: Dict[frozenset, Optional[str]] = {}
+
+def registrar_formato(nome: str, mapeamento: Dict[str, str]):
+    """
+    Registra (ou substitui) um layout de extrato MEXC.
+    O formato fica indexado por coluna, então a detecção continua rápida
+    mesmo com muitos layouts (futuros, earn, outros idiomas...).
+    
+    Args:
+        nome (str): Nome do formato (ex.: "FORMATO_2")
+        mapeamento (dict): Mapeamento de chaves internas (COL_*) para nomes de coluna
+    """
+    for formatos in _FORMATOS_POR_COLUNA.values():
+        if nome in formatos:
+            formatos.remove(nome)
+    FORMATOS[nome] = mapeamento
+    for coluna in set(mapeamento.values()):
+        _FORMATOS_POR_COLUNA.setdefault(coluna, []).append(nome)
+    _DETECCOES.clear()
+
+for _nome, _mapeamento in list(FORMATOS.items()):
+    registrar_formato(_nome, _mapeamento)
+
+def detectar_formato_colunas(colunas) -> Optional[str]:
+    """
+    Detecta o formato a partir apenas dos nomes de coluna.
+    Cada coluna presente conta um acerto para os formatos que a usam; um formato
+    casa quando todas as suas colunas estão presentes. Se mais de um casar, vence
+    o mais específico (mais colunas) e, em caso de empate, o registrado primeiro.
+    O resultado é memorizado pela impressão digital (conjunto) das colunas.
+    """
+    impressao = frozenset(str(coluna).strip() for coluna in colunas if coluna is not None)
+    if impressao in _DETECCOES:
+        return _DETECCOES[impressao]
+
+    acertos = Counter()
+    for coluna in impressao:
+        for formato in _FORMATOS_POR_COLUNA.get(coluna, ()):
+            acertos[formato] += 1
+    ordem = list(FORMATOS)
+    candidatos = [
+        formato for formato, total in acertos.items()
+        if total == len(set(FORMATOS[formato].values()))
+    ]
+    formato = min(candidatos, key=lambda f: (-acertos[f], ordem.index(f)), default=None)
+    _DETECCOES[impressao] = formato
+    return formato
+
 def detectar_formato(df: pd.DataFrame) -> Optional[str]:
     """
     Detecta qual formato de extrato está sendo usado baseado nas colunas presentes.
     Retorna o nome do formato ou None se não reconhecer.
     """
-    for formato, mapeamento in FORMATOS.items():
-        colunas_necessarias = set(mapeamento.values())
-        colunas_presentes = set(df.columns)
-        if colunas_necessarias.issubset(colunas_presentes):
-            return formato
-    return None
+    return detectar_formato_colunas(df.columns)
+
+_NS_PLANILHA = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+_NS_RELACOES = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+_NS_PACOTE = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+
+def _ler_cabecalhos_xlsx(input_file: str, planilha: Optional[str] = None) -> List[Tuple[Optional[str], List[str]]]:
+    """
+    Lê a primeira linha de cada planilha direto do XML do .xlsx.
+    Ao contrário do openpyxl, não carrega a tabela inteira de strings
+    compartilhadas: ela é lida só até o maior índice usado no cabeçalho.
+    """
+    with zipfile.ZipFile(input_file) as arquivo:
+        planilhas = [
+            (folha.get("name"), folha.get(f"{_NS_RELACOES}id"))
+            for folha in ElementTree.fromstring(arquivo.read("xl/workbook.xml")).iter(f"{_NS_PLANILHA}sheet")
+        ]
+        alvos = {
+            relacao.get("Id"): relacao.get("Target")
+            for relacao in ElementTree.fromstring(arquivo.read("xl/_rels/workbook.xml.rels")).iter(f"{_NS_PACOTE}Relationship")
+        }
+        if planilha is not None:
+            planilhas = [(nome, rid) for nome, rid in planilhas if nome == planilha]
+            if not planilhas:
+                raise ValueError(f"Planilha não encontrada: {planilha}")
+
+        # Primeira linha de cada planilha: (tipo, valor) de cada célula preenchida
+        primeiras_linhas = []
+        for nome, rid in planilhas:
+            alvo = alvos[rid]
+            caminho = alvo.lstrip("/") if alvo.startswith("/") else posixpath.normpath(posixpath.join("xl", alvo))
+            celulas = []
+            with arquivo.open(caminho) as xml:
+                tipo = valor = None
+                for evento, elemento in ElementTree.iterparse(xml, events=("start", "end")):
+                    tag = elemento.tag
+                    if evento == "start":
+                        if tag == f"{_NS_PLANILHA}c":
+                            tipo, valor = elemento.get("t"), None
+                        continue
+                    if tag in (f"{_NS_PLANILHA}v", f"{_NS_PLANILHA}t"):
+                        valor = (valor or "") + (elemento.text or "")
+                    elif tag == f"{_NS_PLANILHA}c" and valor is not None:
+                        celulas.append((tipo, valor))
+                    elif tag == f"{_NS_PLANILHA}row":
+                        break
+            primeiras_linhas.append((nome, celulas))
+
+        indices = {int(valor) for _, celulas in primeiras_linhas for tipo, valor in celulas if tipo == "s"}
+        compartilhadas = {}
+        if indices:
+            maior = max(indices)
+            with arquivo.open("xl/sharedStrings.xml") as xml:
+                indice = 0
+                for _, elemento in ElementTree.iterparse(xml):
+                    if elemento.tag != f"{_NS_PLANILHA}si":
+                        continue
+                    if indice in indices:
+                        compartilhadas[indice] = "".join(t.text or "" for t in elemento.iter(f"{_NS_PLANILHA}t"))
+                    indice += 1
+                    if indice > maior:
+                        break
+                    elemento.clear()
+
+    return [
+        (nome, [compartilhadas[int(valor)] if tipo == "s" else valor for tipo, valor in celulas])
+        for nome, celulas in primeiras_linhas
+    ]
+
+def ler_cabecalhos(input_file: str, planilha: Optional[str] = None) -> List[Tuple[Optional[str], List[str]]]:
+    """
+    Lê apenas a linha de cabeçalho do arquivo, sem carregar os dados.
+    Para .xlsx, retorna o cabeçalho de cada planilha (ou só da planilha
+    informada); para .csv, uma única entrada com planilha None.
+    
+    Returns:
+        list: Pares (nome da planilha, colunas)
+    """
+    ext = os.path.splitext(input_file)[1].lower()
+    if ext == ".csv":
+        with open(input_file, encoding='utf-8-sig', newline='') as f:
+            amostra = f.read(TAMANHO_AMOSTRA_CSV)
+        delimitador, _ = farejar_csv(amostra)
+        return [(None, next(csv.reader(io.StringIO(amostra), delimiter=delimitador), []))]
+    if ext == ".xlsx":
+        try:
+            return _ler_cabecalhos_xlsx(input_file, planilha)
+        except (KeyError, ElementTree.ParseError, zipfile.BadZipFile) as e:
+            # Estrutura fora do padrão: usa o openpyxl, mais lento porém mais tolerante
+            logger.debug("Leitura direta do cabeçalho falhou (%s), usando openpyxl", e)
+
+        from openpyxl import load_workbook
+
+        wb = load_workbook(input_file, read_only=True, data_only=True)
+        try:
+            nomes = [planilha] if planilha is not None else wb.sheetnames
+            cabecalhos = []
+            for nome in nomes:
+                primeira = next(wb[nome].iter_rows(max_row=1, values_only=True), ())
+                cabecalhos.append((nome, [c for c in primeira if c is not None]))
+            return cabecalhos
+        finally:
+            wb.close()
+    if ext == ".xls":
+        # openpyxl não lê .xls; o pandas lê só o cabeçalho com nrows=0
+        planilhas = pd.read_excel(input_file, sheet_name=planilha, nrows=0)
+        if planilha is not None:
+            return [(planilha, list(planilhas.columns))]
+        return [(nome, list(df.columns)) for nome, df in planilhas.items()]
+    raise ValueError(f"Formato de arquivo não suportado: {ext}")
+
+def detectar_formato_arquivo(input_file: str, planilha: Optional[str] = None) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Detecta o formato lendo só os cabeçalhos, antes de qualquer leitura completa.
+    Em arquivos com várias planilhas, descobre qual delas contém as transações.
+    
+    Returns:
+        tuple: (formato ou None, nome da planilha com as transações ou None para CSV)
+    """
+    for nome, colunas in ler_cabecalhos(input_file, planilha):
+        formato = detectar_formato_colunas(colunas)
+        if formato is not None:
+            return formato, nome
+    return None, planilha
+
+def fuso_da_coluna(nome_coluna: str) -> float:
+    """
+    Deduz o fuso (em horas) a partir do nome da coluna de data, ex.:
+    'Data de criação(UTC+-3)' -> -3, 'Time(UTC+8)' -> 8.
+    Sem indicação no nome, retorna FUSO_ORIGEM_PADRAO_HORAS.
+    """
+    encontrado = re.search(r"UTC\s*([+-]+)\s*(\d+(?:[.,]\d+)?)", nome_coluna)
+    if not encontrado:
+        return FUSO_ORIGEM_PADRAO_HORAS
+    horas = float(encontrado.group(2).replace(',', '.'))
+    return -horas if '-' in encontrado.group(1) else horas
 
-def parse_datetime_to_koinly(date_str: str) -> str:
+def coluna_data(mapeamento: Dict[str, str]) -> str:
+    """Coluna com a data/hora de cada linha: COL_DATA (FORMATO_2) ou COL_HORA (FORMATO_1)."""
+    return mapeamento.get("COL_DATA") or mapeamento["COL_HORA"]
+
+def parse_datetime_to_koinly(date_str: str, fuso_horas: float = FUSO_ORIGEM_PADRAO_HORAS) -> str:
     """
-    Converte 'YYYY-MM-DD HH:MM:SS' -> 'YYYY-MM-DD HH:MM:SS UTC'.
+    Converte 'YYYY-MM-DD HH:MM:SS' no fuso fuso_horas -> 'YYYY-MM-DD HH:MM:SS UTC'.
     Se falhar, retorna 'Invalid Date'.
     """
     try:
-        dt = datetime.strptime(date_str.strip(), "%Y-%m-%d %H:%M:%S")
-        return dt.strftime("%Y-%m-%d %H:%M:%S UTC")
+        dt = datetime.strptime(str(date_str).strip(), FORMATO_DATA_MEXC) - timedelta(hours=fuso_horas)
+        return dt.strftime(FORMATO_DATA_KOINLY)
     except ValueError:
         logger.warning(f"Falha ao converter data: {date_str}")
         return "Invalid Date"
 
+def datas_para_koinly(datas: pd.Series, fuso_horas: float = FUSO_ORIGEM_PADRAO_HORAS) -> pd.Series:
+    """
+    Versão vetorizada de parse_datetime_to_koinly para uma coluna inteira.
+    Cada timestamp distinto é convertido uma única vez (fills do mesmo segundo
+    se repetem muito), com formato explícito, deslocado do fuso de origem para
+    UTC e formatado em bloco; o deslocamento trata viradas de dia e de ano.
+    
+    Args:
+        datas (pd.Series): Datas como texto 'YYYY-MM-DD HH:MM:SS' ou datetime
+        fuso_horas (float): Fuso da origem em horas (ex.: -3 para UTC-3)
+        
+    Returns:
+        pd.Series: Datas no formato do Koinly, com o mesmo índice; 'Invalid Date' se inválidas
+    """
+    # As funções de np.char falham em arrays vazios (extrato só com cabeçalho, incremental sem novidades)
+    if len(datas) == 0:
+        return pd.Series([], index=datas.index, dtype=object)
+    codigos, unicos = pd.factorize(datas)
+    if pd.api.types.is_datetime64_any_dtype(unicos.dtype):
+        convertidas = pd.Series(unicos)
+    else:
+        texto = pd.Series(unicos, dtype=object).astype(str).str.strip()
+        convertidas = pd.to_datetime(texto, format=FORMATO_DATA_MEXC, errors='coerce')
+        invalidas = int(convertidas.isna().sum())
+        if invalidas:
+            logger.warning(f"Falha ao converter {invalidas} datas distintas")
+    convertidas = convertidas - pd.Timedelta(hours=fuso_horas)
+    # O mesmo que strftime(FORMATO_DATA_KOINLY), mas formatado em C pelo numpy
+    segundos = convertidas.to_numpy(dtype='datetime64[ns]').astype('datetime64[s]')
+    formatadas = np.char.add(np.char.replace(np.datetime_as_string(segundos, unit='s'), 'T', ' '), ' UTC')
+    formatadas = np.where(convertidas.isna().to_numpy(), "Invalid Date", formatadas).astype(object)
+    # Código -1 (data vazia) aponta para a posição extra 'Invalid Date'
+    formatadas = np.append(formatadas, "Invalid Date")
+    return pd.Series(formatadas[codigos], index=datas.index, dtype=object)
+
 def parse_float(value) -> float:
     """
     Converte valor numérico em float, tratando vírgulas decimais.
@@ -111,17 +523,315 @@ def parse_float(value) -> float:
         logger.warning(f"Falha ao converter valor numérico: {value}")
         return 0.0
 
-def read_mexc_file(input_file: str) -> pd.DataFrame:
+# Maior quantidade de dígitos de uma mantissa guardada em int64
+_MAX_DIGITOS_INT64 = 18
+
+# Dígitos significativos que sempre voltam exatos de um float64
+_MAX_DIGITOS_FLOAT = 15
+
+def _decimal_exato(texto: str) -> Optional[Tuple[int, int]]:
+    """
+    Converte um texto em (mantissa, casas) pelo módulo decimal, para os
+    casos que a conversão vetorizada não cobre (notação científica).
+    Retorna None se o texto não for um número finito.
+    """
+    try:
+        valor = Decimal(texto)
+    except InvalidOperation:
+        return None
+    if not valor.is_finite():
+        return None
+    sinal, digitos, expoente = valor.as_tuple()
+    mantissa = int(''.join(map(str, digitos)) or 0)
+    casas = max(0, -expoente)
+    if expoente > 0:
+        mantissa *= 10 ** expoente
+    while casas and mantissa % 10 == 0:
+        mantissa //= 10
+        casas -= 1
+    return (-mantissa if sinal else mantissa), casas
+
+def _quantidades_de_floats(numeros: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Encontra, para cada float, a menor quantidade de casas decimais c em que
+    round(x * 10**c) / 10**c volta exatamente a x, sem formatar texto. Com
+    até 15 dígitos significativos esse é o mesmo decimal curto de repr; com
+    mais, o produto em float pode inventar dígitos (123456789.12345679 daria
+    123456789.123456784), então a busca para em 15 dígitos. Cada passada
+    trata só os valores ainda não resolvidos. Retorna (mantissas, casas,
+    resolvidos); os não resolvidos (infinitos ou mais de 15 dígitos) ficam
+    para a conversão pelo texto de repr.
+    """
+    mantissas = np.zeros(len(numeros), dtype=np.int64)
+    casas = np.zeros(len(numeros), dtype=np.int64)
+    resolvidos = np.zeros(len(numeros), dtype=bool)
+    pendentes = np.flatnonzero(np.isfinite(numeros))
+    for c in range(_MAX_DIGITOS_INT64):
+        if not len(pendentes):
+            break
+        fator = 10.0 ** c
+        with np.errstate(over='ignore', invalid='ignore'):
+            candidatos = np.round(numeros[pendentes] * fator)
+            exatos = (candidatos / fator == numeros[pendentes]) & (np.abs(candidatos) < 10.0 ** _MAX_DIGITOS_FLOAT)
+        resolvidas = pendentes[exatos]
+        mantissas[resolvidas] = candidatos[exatos].astype(np.int64)
+        casas[resolvidas] = c
+        resolvidos[resolvidas] = True
+        pendentes = pendentes[~exatos]
+    return mantissas, casas, resolvidos
+
+def parse_quantidades_exatas(serie: pd.Series) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Converte a coluna de quantidades em inteiros escalados, sem passar por
+    float: cada valor vale mantissa / 10**casas. Números vindos do Excel usam
+    a menor representação decimal que os identifica (a mesma de repr), e
+    textos aceitam vírgula decimal. Valores vazios ou inválidos viram 0.
+    
+    Args:
+        serie (pd.Series): Coluna de quantidades
+        
+    Returns:
+        tuple: (mantissas, casas); mantissas é int64, ou object com ints do
+            Python quando algum valor não cabe em 18 dígitos
+    """
+    if not len(serie):
+        # np.char.replace falha em vetores vazios (numpy 2.x)
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    if pd.api.types.is_integer_dtype(serie):
+        texto = serie.to_numpy().astype(str)
+    elif pd.api.types.is_numeric_dtype(serie):
+        numeros = serie.astype(float).fillna(0.0).to_numpy()
+        mantissas, casas, resolvidos = _quantidades_de_floats(numeros)
+        if resolvidos.all():
+            return mantissas, casas
+        # Poucos valores (infinitos, mais de 15 dígitos) seguem pelo texto de repr
+        restantes_mantissas, restantes_casas = parse_quantidades_exatas(
+            pd.Series(numeros[~resolvidos].astype(str), dtype=object)
+        )
+        if restantes_mantissas.dtype == object:
+            mantissas = mantissas.astype(object)
+        mantissas[~resolvidos] = restantes_mantissas
+        casas[~resolvidos] = restantes_casas
+        return mantissas, casas
+    else:
+        # np.char trabalha no vetor de texto inteiro, sem uma chamada do Python por valor
+        texto = np.char.replace(np.char.strip(serie.fillna('').to_numpy(dtype=str)), ',', '.')
+
+    negativo = np.char.startswith(texto, '-')
+    partes = np.char.partition(np.char.lstrip(texto, '+-'), '.')
+    inteiro, fracao = partes[:, 0], np.char.rstrip(partes[:, 2], '0')
+    vazios = (inteiro == '') & (partes[:, 1] == '')
+    validos = (
+        (np.char.isdigit(inteiro) | (inteiro == ''))
+        & (np.char.isdigit(fracao) | (fracao == ''))
+        & ((inteiro != '') | (partes[:, 1] != ''))
+    )
+
+    digitos = np.where(validos, np.char.lstrip(np.char.add(inteiro, fracao), '0'), '')
+    casas = np.where(validos, np.char.str_len(fracao), 0).astype(np.int64)
+    if (np.char.str_len(digitos) > _MAX_DIGITOS_INT64).any():
+        mantissas = np.array([int(d) if d else 0 for d in digitos.tolist()], dtype=object)
+    else:
+        mantissas = np.where(digitos == '', '0', digitos).astype(np.int64)
+    mantissas = np.where(negativo, -mantissas, mantissas)
+
+    # Notação científica e textos inválidos: um a um, pelo módulo decimal
+    invalidos = 0
+    for i in np.flatnonzero(~validos & ~vazios):
+        convertido = _decimal_exato(texto[i])
+        if convertido is None:
+            invalidos += 1
+            continue
+        mantissa, casas[i] = convertido
+        if mantissas.dtype != object and abs(mantissa) >= 10 ** _MAX_DIGITOS_INT64:
+            mantissas = mantissas.astype(object)
+        mantissas[i] = mantissa
+    if invalidos:
+        logger.warning(f"Falha ao converter {invalidos} valores numéricos")
+    return mantissas, casas
+
+def escalar_por_moeda(mantissas: np.ndarray, casas: np.ndarray, moedas) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Leva os valores de cada moeda à mesma escala (a maior quantidade de casas
+    decimais vista para ela), para que somas por grupo sejam somas de
+    inteiros: exatas e vetorizadas.
+    
+    Args:
+        mantissas (np.ndarray): Mantissas de parse_quantidades_exatas
+        casas (np.ndarray): Casas decimais de parse_quantidades_exatas
+        moedas: Moeda de cada linha (Series, de preferência category, ou sequência)
+        
+    Returns:
+        tuple: (valores, escalas) por linha; valores é int64 enquanto qualquer
+            soma da coluna couber nele, e object (ints do Python) caso contrário
+    """
+    if not isinstance(moedas, pd.Series):
+        moedas = pd.Series(np.asarray(moedas, dtype=object))
+    codigos = texto_categorico(moedas).cat.codes.to_numpy()
+    maximas = np.zeros(codigos.max() + 1 if len(codigos) else 0, dtype=np.int64)
+    np.maximum.at(maximas, codigos, casas)
+    escalas = maximas[codigos]
+    deslocamento = escalas - casas
+    if mantissas.dtype != object:
+        # A soma dos módulos limita qualquer soma parcial da coluna
+        if (np.abs(mantissas) * 10.0 ** deslocamento).sum() < 2 ** 62:
+            return mantissas * 10 ** deslocamento, escalas
+        mantissas = mantissas.astype(object)
+    return mantissas * 10 ** deslocamento.astype(object), escalas
+
+def formatar_escalado(valor: int, escala: int) -> str:
+    """
+    Formata valor / 10**escala como decimal exato, sem zeros à direita nem
+    notação científica. Zero vira string vazia, como em processar_linha.
+    """
+    if valor == 0:
+        return ''
+    sinal = '-' if valor < 0 else ''
+    digitos = str(abs(valor)).rjust(escala + 1, '0')
+    corte = len(digitos) - escala
+    fracao = digitos[corte:].rstrip('0')
+    return f"{sinal}{digitos[:corte]}.{fracao}" if fracao else f"{sinal}{digitos[:corte]}"
+
+def formatar_quantidades_exatas(valores: np.ndarray, escalas: np.ndarray) -> np.ndarray:
+    """Aplica formatar_escalado a colunas de valores e escalas."""
+    return np.array(
+        [formatar_escalado(v, e) for v, e in zip(valores.tolist(), escalas.tolist())],
+        dtype=object
+    )
+
+# Números com vírgula ou com ponto decimal, como aparecem nos campos do CSV
+_NUMERO_VIRGULA = re.compile(r"[+-]?\d+,\d+")
+_NUMERO_PONTO = re.compile(r"[+-]?\d*\.\d+")
+
+def farejar_csv(amostra: str) -> Tuple[str, str]:
+    """
+    Descobre o separador de campos e o separador decimal de um CSV a partir
+    do início do arquivo. O separador é o de DELIMITADORES_CSV com que o
+    cabeçalho casa com um formato conhecido (ou, se nenhum casar, o que gera
+    mais colunas); o decimal é ',' quando os números da amostra usam vírgula
+    mais vezes que ponto.
+    
+    Args:
+        amostra (str): Início do arquivo, com o cabeçalho e algumas linhas
+        
+    Returns:
+        tuple: (separador de campos, separador decimal)
+    """
+    linhas = amostra.splitlines()
+    if linhas and not amostra.endswith(('\n', '\r')):
+        # A última linha da amostra pode ter sido cortada no meio
+        linhas = linhas[:-1] or linhas
+    cabecalho = linhas[:1]
+
+    def pontuacao(delimitador: str) -> Tuple[bool, int]:
+        colunas = next(csv.reader(cabecalho, delimiter=delimitador), [])
+        return detectar_formato_colunas(colunas) is not None, len(colunas)
+
+    # Em caso de empate, max fica com o primeiro de DELIMITADORES_CSV
+    delimitador = max(DELIMITADORES_CSV, key=pontuacao)
+    if delimitador == ',':
+        return delimitador, '.'
+    campos = [campo.strip() for linha in csv.reader(linhas[1:], delimiter=delimitador) for campo in linha]
+    virgulas = sum(1 for campo in campos if _NUMERO_VIRGULA.fullmatch(campo))
+    pontos = sum(1 for campo in campos if _NUMERO_PONTO.fullmatch(campo))
+    return delimitador, ',' if virgulas > pontos else '.'
+
+def motor_csv() -> str:
+    """
+    Retorna o motor do pd.read_csv para leituras completas: o pyarrow
+    (colunar e multithread) quando está instalado, senão o motor C do pandas.
+    """
+    return "pyarrow" if find_spec("pyarrow") is not None else "c"
+
+def opcoes_leitura_csv(input_file: str, motor: str = "c", categorias: bool = True) -> dict:
+    """
+    Monta os parâmetros do pd.read_csv para um extrato em CSV: separador e
+    decimal farejados no início do arquivo, só as colunas do formato
+    detectado no cabeçalho e o tipo de cada uma definido na leitura (texto
+    como category). As colunas de CHAVES_NUMERICAS são lidas como texto e
+    seguem pelo caminho exato de parse_quantidades_exatas, que aceita
+    vírgula decimal: um float64 perderia dígitos de quantidades com 16 a 18
+    casas em qualquer ponto do arquivo, não só na amostra. Com formato
+    desconhecido, todas as colunas são lidas e os tipos ficam por conta do
+    pandas.
+    
+    Args:
+        input_file (str): Caminho do CSV
+        motor (str): Motor do pd.read_csv ("c" ou "pyarrow"; o pyarrow não lê em blocos)
+        categorias (bool): Lê o texto como category; a leitura em blocos usa str,
+            pois blocos com categorias diferentes não se concatenam como category
+        
+    Returns:
+        dict: Parâmetros nomeados para pd.read_csv
+    """
+    with open(input_file, encoding='utf-8-sig', newline='') as f:
+        amostra = f.read(TAMANHO_AMOSTRA_CSV)
+    delimitador, decimal = farejar_csv(amostra)
+    opcoes = {"sep": delimitador, "decimal": decimal, "encoding": 'utf-8-sig', "engine": motor}
+
+    cabecalho = next(csv.reader(io.StringIO(amostra), delimiter=delimitador), [])
+    formato = detectar_formato_colunas(cabecalho)
+    if formato is None:
+        return opcoes
+
+    mapeamento = FORMATOS[formato]
+    necessarias = {coluna.strip() for coluna in mapeamento.values()}
+    numericas = {mapeamento[chave].strip() for chave in CHAVES_NUMERICAS if chave in mapeamento}
+    opcoes["usecols"] = [coluna for coluna in cabecalho if coluna.strip() in necessarias]
+    tipo_texto = 'category' if categorias else str
+    opcoes["dtype"] = {
+        coluna: tipo_texto if coluna.strip() not in numericas else str
+        for coluna in opcoes["usecols"]
+    }
+    return opcoes
+
+def compactar_colunas(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Converte as colunas de texto do formato detectado (moedas, tipos,
+    direções, datas em texto...) em category: cada valor distinto é
+    guardado uma vez e cada linha só guarda um código inteiro, o que reduz
+    a memória do extrato em cerca de dez vezes. Colunas numéricas e datas
+    já tipadas ficam como estão.
+    """
+    formato = detectar_formato(df)
+    if formato is None:
+        return df
+    mapeamento = FORMATOS[formato]
+    numericas = {mapeamento[chave] for chave in CHAVES_NUMERICAS if chave in mapeamento}
+    texto = [
+        coluna for coluna in dict.fromkeys(mapeamento.values())
+        if coluna not in numericas and coluna in df.columns
+        and (pd.api.types.is_object_dtype(df[coluna]) or pd.api.types.is_string_dtype(df[coluna]))
+    ]
+    return df.astype({coluna: 'category' for coluna in texto}) if texto else df
+
+def texto_categorico(serie: pd.Series) -> pd.Series:
+    """
+    Normaliza uma coluna de texto (vazios viram '' e os espaços das pontas
+    são removidos) e a devolve como category, com o mesmo índice. O
+    trabalho é feito uma vez por valor distinto; se a coluna já for
+    category, nenhum texto é criado por linha.
+    """
+    codigos, unicos = pd.factorize(serie)
+    normalizados = pd.Index(np.asarray(unicos, dtype=object)).astype(str).str.strip()
+    # Código -1 (vazio) aponta para a posição extra ''
+    novos, categorias = pd.factorize(np.append(normalizados.to_numpy(dtype=object), ''))
+    return pd.Series(pd.Categorical.from_codes(novos[codigos], categorias), index=serie.index)
+
+def read_mexc_file(input_file: str, planilha: Optional[str] = None) -> pd.DataFrame:
     """
     Detecta extensão do arquivo e lê o conteúdo.
-    Suporta .xlsx, .xls e .csv.
+    Suporta .xlsx, .xls e .csv. Para Excel, lê a planilha informada
+    (ou a primeira, se planilha for None); CSVs são lidos com as opções
+    de opcoes_leitura_csv e, se disponível, com o motor pyarrow. As
+    colunas de texto do formato ficam como category (compactar_colunas).
     """
     ext = os.path.splitext(input_file)[1].lower()
     try:
         if ext in [".xlsx", ".xls"]:
-            df = pd.read_excel(input_file)
+            df = compactar_colunas(pd.read_excel(input_file, sheet_name=planilha if planilha is not None else 0))
         elif ext == ".csv":
-            df = pd.read_csv(input_file, delimiter=';')
+            df = pd.read_csv(input_file, **opcoes_leitura_csv(input_file, motor_csv()))
         else:
             raise ValueError(f"Formato de arquivo não suportado: {ext}")
         return df
@@ -129,10 +839,165 @@ def read_mexc_file(input_file: str) -> pd.DataFrame:
         logger.error(f"Erro ao ler arquivo {input_file}: {str(e)}")
         raise
 
+def hash_arquivo(caminho: str) -> str:
+    """
+    Calcula o SHA-256 do conteúdo do arquivo, lendo em pedaços de 1 MB.
+    """
+    sha = hashlib.sha256()
+    with open(caminho, 'rb') as f:
+        for pedaco in iter(lambda: f.read(1024 * 1024), b''):
+            sha.update(pedaco)
+    return sha.hexdigest()
+
+def limpar_cache(diretorio_cache: str, tamanho_maximo: int = TAMANHO_MAXIMO_CACHE):
+    """
+    Remove entradas de versões antigas do conversor e, se o cache passar de
+    tamanho_maximo bytes, apaga as entradas usadas há mais tempo. Só arquivos
+    com o nome de uma entrada do cache (_ENTRADA_CACHE) são considerados.
+    """
+    entradas = []
+    for nome in os.listdir(diretorio_cache):
+        caminho = os.path.join(diretorio_cache, nome)
+        encontrado = _ENTRADA_CACHE.fullmatch(nome)
+        if not encontrado:
+            continue
+        if encontrado.group(1) != VERSAO:
+            os.remove(caminho)
+            continue
+        estado = os.stat(caminho)
+        entradas.append((estado.st_mtime, estado.st_size, caminho))
+
+    total = sum(tamanho for _, tamanho, _ in entradas)
+    for _, tamanho, caminho in sorted(entradas):
+        if total <= tamanho_maximo:
+            break
+        os.remove(caminho)
+        total -= tamanho
+
+def ler_mexc_com_cache(input_file: str, diretorio_cache: str = DIRETORIO_CACHE_PADRAO,
+                       tamanho_maximo: int = TAMANHO_MAXIMO_CACHE) -> Tuple[pd.DataFrame, Optional[str]]:
+    """
+    Lê o arquivo usando um cache em disco endereçado pelo conteúdo.
+    A chave é o SHA-256 do arquivo mais a VERSAO do conversor, então qualquer
+    alteração no arquivo ou no conversor invalida a entrada automaticamente.
+    O DataFrame já tipado é guardado em pickle (blocos numpy por coluna),
+    que carrega muito mais rápido que reprocessar o Excel.
+    
+    Args:
+        input_file (str): Caminho do arquivo de entrada
+        diretorio_cache (str): Pasta onde ficam as entradas do cache
+        tamanho_maximo (int): Tamanho máximo do cache em bytes
+        
+    Returns:
+        tuple: (DataFrame, formato detectado ou None)
+    """
+    os.makedirs(diretorio_cache, exist_ok=True)
+    caminho = os.path.join(diretorio_cache, f"{VERSAO}-{hash_arquivo(input_file)}.pkl")
+
+    if os.path.exists(caminho):
+        try:
+            with open(caminho, 'rb') as f:
+                entrada = pickle.load(f)
+            # Atualiza o mtime, que é usado para escolher o que remover primeiro
+            os.utime(caminho)
+            logger.info(f"Arquivo {input_file} carregado do cache")
+            return entrada["df"], entrada["formato"]
+        except Exception as e:
+            logger.warning(f"Entrada de cache inválida, lendo o arquivo novamente: {str(e)}")
+            os.remove(caminho)
+
+    formato, planilha = detectar_formato_arquivo(input_file)
+    df = read_mexc_file(input_file, planilha)
+    _gravar_no_cache(caminho, {"df": df, "formato": formato}, diretorio_cache, tamanho_maximo)
+    return df, formato
+
+def _gravar_no_cache(caminho: str, entrada: dict, diretorio_cache: str, tamanho_maximo: int):
+    """Grava uma entrada do cache em pickle e aplica o limite de tamanho do cache."""
+    # Escreve em um temporário e renomeia, para nunca deixar uma entrada pela metade
+    fd, temporario = tempfile.mkstemp(dir=diretorio_cache, suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(entrada, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporario, caminho)
+    except Exception:
+        os.remove(temporario)
+        raise
+    limpar_cache(diretorio_cache, tamanho_maximo)
+
+def ler_mexc_em_blocos(input_file: str, tamanho_bloco: int = TAMANHO_BLOCO_PADRAO,
+                       planilha: Optional[str] = None) -> Iterator[pd.DataFrame]:
+    """
+    Lê o arquivo em blocos de até tamanho_bloco linhas, sem carregar tudo na memória.
+    Arquivos .xlsx são lidos com openpyxl em modo read-only (linha a linha);
+    arquivos .csv usam o chunksize do pandas, com as opções de opcoes_leitura_csv.
+    
+    Args:
+        input_file (str): Caminho do arquivo de entrada
+        tamanho_bloco (int): Número máximo de linhas por bloco
+        planilha (str): Planilha do .xlsx a ler (padrão: a primeira)
+        
+    Yields:
+        pd.DataFrame: Blocos consecutivos do extrato, com as colunas do cabeçalho
+    """
+    ext = os.path.splitext(input_file)[1].lower()
+    if ext == ".csv":
+        yield from pd.read_csv(input_file, chunksize=tamanho_bloco,
+                               **opcoes_leitura_csv(input_file, categorias=False))
+        return
+    if ext != ".xlsx":
+        raise ValueError(f"Formato de arquivo não suportado para leitura em blocos: {ext}")
+
+    from openpyxl import load_workbook
+
+    wb = load_workbook(input_file, read_only=True, data_only=True)
+    try:
+        ws = wb[planilha] if planilha is not None else wb.worksheets[0]
+        linhas = ws.iter_rows(values_only=True)
+        cabecalho = next(linhas, None)
+        if cabecalho is None:
+            return
+        bloco = []
+        for linha in linhas:
+            # Linhas totalmente vazias são ignoradas, como no pd.read_excel
+            if all(valor is None for valor in linha):
+                continue
+            bloco.append(linha)
+            if len(bloco) >= tamanho_bloco:
+                yield pd.DataFrame(bloco, columns=cabecalho)
+                bloco = []
+        if bloco:
+            yield pd.DataFrame(bloco, columns=cabecalho)
+    finally:
+        wb.close()
+
+def blocos_sem_cortar_timestamp(blocos: Iterator[pd.DataFrame], coluna_data: str) -> Iterator[pd.DataFrame]:
+    """
+    Reajusta uma sequência de blocos para que nenhum timestamp fique dividido
+    entre dois blocos: as linhas finais com o último timestamp de cada bloco
+    são guardadas e passadas para o início do bloco seguinte.
+    Pressupõe que linhas com o mesmo timestamp sejam contíguas no extrato.
+    """
+    pendente = None
+    for bloco in blocos:
+        if pendente is not None:
+            bloco = pd.concat([pendente, bloco], ignore_index=True)
+        if bloco.empty:
+            continue
+        datas = bloco[coluna_data].to_numpy()
+        diferentes = datas != datas[-1]
+        # Início da sequência final de linhas com o mesmo timestamp
+        corte = len(datas) - int(np.argmax(diferentes[::-1])) if diferentes.any() else 0
+        pendente = bloco.iloc[corte:]
+        if corte > 0:
+            yield bloco.iloc[:corte]
+    if pendente is not None and not pendente.empty:
+        yield pendente
+
 def processar_linha(row: pd.Series, mapeamento: Dict[str, str]) -> List[str]:
     """
     Processa uma linha do DataFrame de acordo com o mapeamento de colunas.
     Retorna uma linha no formato Koinly.
+    Extratos no FORMATO_2 são classificados em bloco por classificar_formato_2.
     """
     # Inicializa todas as variáveis necessárias
     sent_amount = ""
@@ -146,9 +1011,8 @@ def processar_linha(row: pd.Series, mapeamento: Dict[str, str]) -> List[str]:
     label = ""
     description = ""
 
-    # Verifica qual formato está sendo usado
+    # Formato 1 (antigo)
     if "COL_PARES" in mapeamento:
-        # Formato 1 (antigo)
         pares = str(row[mapeamento["COL_PARES"]]).strip()
         hora = str(row[mapeamento["COL_HORA"]]).strip()
         tipo = str(row[mapeamento["COL_TIPO"]]).strip()
@@ -184,61 +1048,7 @@ def processar_linha(row: pd.Series, mapeamento: Dict[str, str]) -> List[str]:
             received_currency = quote_asset
 
     else:
-        # Formato 2 (novo)
-        data = str(row[mapeamento["COL_DATA"]]).strip()
-        cripto = str(row[mapeamento["COL_CRIPTO"]]).strip()
-        tipo = str(row[mapeamento["COL_TIPO"]]).strip()
-        direcao = str(row[mapeamento["COL_DIRECAO"]]).strip()
-        quantidade = parse_float(row[mapeamento["COL_QUANTIDADE"]])
-
-        # Converte a data para o formato Koinly
-        date_koinly = parse_datetime_to_koinly(data)
-
-        # Determina se é entrada ou saída
-        is_entrada = "entrada" in direcao.lower()
-
-        # Configura os valores baseado no tipo de transação
-        if tipo == "Depositar":
-            label = "Deposit"
-            description = f"Depósito de {cripto}"
-            if is_entrada:
-                received_amount = abs(quantidade)
-                received_currency = cripto
-            else:
-                sent_amount = abs(quantidade)
-                sent_currency = cripto
-
-        elif tipo == "Airdrop":
-            label = "Airdrop"
-            description = f"Airdrop de {cripto}"
-            received_amount = abs(quantidade)
-            received_currency = cripto
-
-        elif "Negociação Spot" in tipo:
-            label = "Trade"
-            description = f"Negociação Spot de {cripto}"
-            if is_entrada:
-                received_amount = abs(quantidade)
-                received_currency = cripto
-            else:
-                sent_amount = abs(quantidade)
-                sent_currency = cripto
-
-        elif "Taxas" in tipo:
-            label = "Fee"
-            description = f"Taxa de {tipo}"
-            sent_amount = abs(quantidade)
-            sent_currency = cripto
-
-        else:
-            label = "Other"
-            description = f"{tipo} de {cripto}"
-            if is_entrada:
-                received_amount = abs(quantidade)
-                received_currency = cripto
-            else:
-                sent_amount = abs(quantidade)
-                sent_currency = cripto
+        raise ValueError("processar_linha só suporta o FORMATO_1; use classificar_formato_2")
 
     # Garante que os valores numéricos sejam strings vazias se não definidos
     sent_amount = str(sent_amount) if sent_amount else ""
@@ -259,15 +1069,132 @@ def processar_linha(row: pd.Series, mapeamento: Dict[str, str]) -> List[str]:
         ""
     ]
 
-def parse_float_value(value):
+def converter_formato_1(df: pd.DataFrame, mapeamento: Dict[str, str] = FORMATOS["FORMATO_1"],
+                        instrumentacao: Optional[Instrumentacao] = None) -> pd.DataFrame:
+    """
+    Converte um extrato no FORMATO_1 (histórico de ordens) de uma só vez,
+    com as mesmas regras de processar_linha, mas por coluna: Pares é
+    separado em base e cotação, e uma compra envia o Montante da Ordem na
+    cotação e recebe a Quantidade Preenchida na base (a venda, o contrário).
+    
+    Ordens sem execução (canceladas ou ainda abertas, com Quantidade
+    Preenchida zero) não movimentam saldo e ficam de fora. Vale a quantidade
+    preenchida e não só o Status, pois uma ordem cancelada depois de
+    parcialmente executada tem execuções reais.
+    
+    Args:
+        df (pd.DataFrame): DataFrame com as ordens
+        mapeamento (dict): Mapeamento de colunas do FORMATO_1
+        instrumentacao (Instrumentacao): Recebe os tempos e o contador de ordens sem execução
+        
+    Returns:
+        pd.DataFrame: Linhas no formato Koinly (COLUNAS_KOINLY), uma por ordem executada
+    """
+    instrumentacao = instrumentacao or Instrumentacao()
+    with instrumentacao.estagio("dates"):
+        datas_koinly = datas_para_koinly(df[mapeamento["COL_HORA"]], fuso_da_coluna(mapeamento["COL_HORA"]))
+
+    with instrumentacao.estagio("amounts"):
+        qtd_preenchida, casas_qtd = parse_quantidades_exatas(df[mapeamento["COL_QTD_PREENCHIDA"]])
+        montante, casas_montante = parse_quantidades_exatas(df[mapeamento["COL_MONTANTE_ORDEM"]])
+
+    with instrumentacao.estagio("classify"):
+        executadas = qtd_preenchida != 0
+        instrumentacao.contar("ordens_sem_execucao", int((~executadas).sum()))
+        df = df[executadas]
+        datas_koinly = datas_koinly[executadas]
+
+        texto = {
+            chave: df[mapeamento[chave]].fillna('').astype(str).str.strip()
+            for chave in ("COL_PARES", "COL_TIPO", "COL_DIRECAO", "COL_STATUS")
+        }
+        pares = texto["COL_PARES"].str.partition('_')
+        base, cotacao = pares[0], pares[2]
+        direcao = texto["COL_DIRECAO"].str.lower()
+        compra = (direcao == "comprar").to_numpy()
+        venda = (direcao == "vender").to_numpy()
+
+        quantidade = formatar_quantidades_exatas(np.abs(qtd_preenchida[executadas]), casas_qtd[executadas])
+        valor = formatar_quantidades_exatas(np.abs(montante[executadas]), casas_montante[executadas])
+        vazio = pd.Series('', index=df.index)
+
+        ordens = pd.DataFrame({
+            'Date': datas_koinly,
+            'Sent Amount': np.select([compra, venda], [valor, quantidade], default=''),
+            'Sent Currency': np.select([compra, venda], [cotacao, base], default=''),
+            'Received Amount': np.select([compra, venda], [quantidade, valor], default=''),
+            'Received Currency': np.select([compra, venda], [base, cotacao], default=''),
+            'Fee Amount': vazio,
+            'Fee Currency': vazio,
+            'Net Worth Amount': vazio,
+            'Net Worth Currency': vazio,
+            'Label': 'Trade',
+            'Description': (texto["COL_DIRECAO"] + " (" + texto["COL_TIPO"] + ") de " + texto["COL_PARES"]
+                            + " - Status: " + texto["COL_STATUS"]),
+            'TxHash': vazio
+        }, index=df.index, columns=COLUNAS_KOINLY)
+    instrumentacao.contar("trades", len(ordens))
+    return ordens
+
+def classificar_formato_2(df: pd.DataFrame, mapeamento: Dict[str, str] = FORMATOS["FORMATO_2"],
+                          datas_koinly: Optional[pd.Series] = None,
+                          quantidades: Optional[Tuple[np.ndarray, np.ndarray]] = None) -> pd.DataFrame:
     """
-    Converte um valor para float, seja ele string ou float.
+    Classifica todas as linhas de um extrato no FORMATO_2 de uma só vez,
+    usando operações por coluna em vez de iterrows.
+    Cobre os casos Depositar, Airdrop, Negociação Spot, Taxas e Other.
+    
+    Args:
+        df (pd.DataFrame): DataFrame com as transações
+        mapeamento (dict): Mapeamento de colunas do FORMATO_2
+        datas_koinly (pd.Series): Datas já convertidas por datas_para_koinly (opcional)
+        quantidades (tuple): (valores, escalas) de escalar_por_moeda (opcional)
+        
+    Returns:
+        pd.DataFrame: Linhas no formato Koinly (COLUNAS_KOINLY), com o mesmo índice de df
     """
-    if isinstance(value, float):
-        return value
-    elif isinstance(value, str):
-        return float(value.replace(',', '.'))
-    return 0.0
+    if datas_koinly is None:
+        datas_koinly = datas_para_koinly(df[mapeamento["COL_DATA"]], fuso_da_coluna(mapeamento["COL_DATA"]))
+    cripto = df[mapeamento["COL_CRIPTO"]].fillna('').astype(str).str.strip()
+    tipo = df[mapeamento["COL_TIPO"]].fillna('').astype(str).str.strip()
+    direcao = df[mapeamento["COL_DIRECAO"]].fillna('').astype(str).str.lower()
+    if quantidades is None:
+        quantidades = escalar_por_moeda(*parse_quantidades_exatas(df[mapeamento["COL_QUANTIDADE"]]), cripto)
+    valores, escalas = quantidades
+    quantidade = pd.Series(formatar_quantidades_exatas(np.abs(valores), escalas), index=df.index)
+
+    is_deposito = tipo == "Depositar"
+    is_airdrop = tipo == "Airdrop"
+    # Taxas vêm antes de "Negociação Spot", pois "Taxas de Negociação Spot" contém as duas
+    is_taxa = ~is_deposito & ~is_airdrop & tipo.str.contains("Taxas", regex=False)
+    is_spot = ~is_taxa & tipo.str.contains("Negociação Spot", regex=False)
+    condicoes = [is_deposito, is_airdrop, is_taxa, is_spot]
+
+    label = np.select(condicoes, ["Deposit", "Airdrop", "Fee", "Trade"], default="Other")
+    description = np.select(
+        condicoes,
+        ["Depósito de " + cripto, "Airdrop de " + cripto, "Taxa de " + tipo, "Negociação Spot de " + cripto],
+        default=tipo + " de " + cripto
+    )
+
+    # Airdrops são sempre recebidos e taxas sempre enviadas; o resto segue a direção
+    recebido = is_airdrop | (~is_taxa & direcao.str.contains("entrada", regex=False))
+    vazio = pd.Series('', index=df.index)
+
+    return pd.DataFrame({
+        'Date': datas_koinly,
+        'Sent Amount': quantidade.where(~recebido, ''),
+        'Sent Currency': cripto.where(~recebido, ''),
+        'Received Amount': quantidade.where(recebido, ''),
+        'Received Currency': cripto.where(recebido, ''),
+        'Fee Amount': vazio,
+        'Fee Currency': vazio,
+        'Net Worth Amount': vazio,
+        'Net Worth Currency': vazio,
+        'Label': label,
+        'Description': description,
+        'TxHash': vazio
+    }, index=df.index, columns=COLUNAS_KOINLY)
 
 def processar_trades_relacionados(df, timestamp):
     """
@@ -278,270 +1205,1973 @@ def processar_trades_relacionados(df, timestamp):
         timestamp (str): Timestamp a ser processado
         
     Returns:
-        list: Lista de dicionários no formato Koinly
+        list: Linhas Koinly (LinhaKoinly)
     """
     # Initialize list to store Koinly entries
     linhas_koinly = []
 
-    # Process deposits
-    depositos = df[
-        (df['Data de criação(UTC+-3)'] == timestamp) & 
-        (df['Tipo de transação'] == 'Depositar')
-    ]
-    for _, deposito in depositos.iterrows():
-        linha_koinly = {
-            'Date': f"{timestamp} UTC",
-            'Sent Amount': '',
-            'Sent Currency': '',
-            'Received Amount': str(abs(parse_float_value(deposito['Quantidade']))),
-            'Received Currency': deposito['Cripto'],
-            'Fee Amount': '',
-            'Fee Currency': '',
-            'Net Worth Amount': '',
-            'Net Worth Currency': '',
-            'Label': 'Deposit',
-            'Description': f"Depósito de {deposito['Cripto']}",
-            'TxHash': ''
-        }
-        linhas_koinly.append(linha_koinly)
-
-    # Process airdrops
-    airdrops = df[
-        (df['Data de criação(UTC+-3)'] == timestamp) & 
-        (df['Tipo de transação'] == 'Airdrop')
-    ]
-    for _, airdrop in airdrops.iterrows():
-        linha_koinly = {
-            'Date': f"{timestamp} UTC",
-            'Sent Amount': '',
-            'Sent Currency': '',
-            'Received Amount': str(abs(parse_float_value(airdrop['Quantidade']))),
-            'Received Currency': airdrop['Cripto'],
-            'Fee Amount': '',
-            'Fee Currency': '',
-            'Net Worth Amount': '',
-            'Net Worth Currency': '',
-            'Label': 'Airdrop',
-            'Description': f"Airdrop de {airdrop['Cripto']}",
-            'TxHash': ''
-        }
-        linhas_koinly.append(linha_koinly)
+    # Process deposits and airdrops
+    classificadas = classificar_formato_2(df[df['Data de criação(UTC+-3)'] == timestamp])
+    for label in ('Deposit', 'Airdrop'):
+        linhas = classificadas[classificadas['Label'] == label]
+        linhas_koinly.extend(map(LinhaKoinly._make, linhas.itertuples(index=False, name=None)))
 
     # Process trades
     trades = df[
         (df['Data de criação(UTC+-3)'] == timestamp) & 
         (df['Tipo de transação'].isin(['Negociação Spot', 'Taxas de Negociação Spot']))
     ]
+    linhas_koinly.extend(processar_grupo_trades(trades, timestamp))
 
-    if len(trades) > 0:
-        # Get spot trades (excluding fees)
-        spot_trades = trades[trades['Tipo de transação'] == 'Negociação Spot']
-        print(f"  Número de spot trades: {len(spot_trades)}")
-        
-        # Group trades by crypto
-        trades_por_cripto = {}
-        for _, trade in spot_trades.iterrows():
-            cripto = trade['Cripto']
-            if cripto not in trades_por_cripto:
-                trades_por_cripto[cripto] = {'entrada': [], 'saida': []}
-            
-            if trade['Direção'] == 'Fluxo de entrada':
-                trades_por_cripto[cripto]['entrada'].append(trade)
-            else:
-                trades_por_cripto[cripto]['saida'].append(trade)
-        
-        print(f"  Moedas encontradas: {list(trades_por_cripto.keys())}")
-        
-        # Find pairs of trades (one entrada and one saída)
-        moedas = list(trades_por_cripto.keys())
-        for i in range(0, len(moedas), 2):
-            moeda1 = moedas[i]
-            moeda2 = moedas[i + 1] if i + 1 < len(moedas) else None
-            
-            if moeda2 is None:
-                continue
-                
-            print(f"  Processando par {moeda1}/{moeda2}:")
-            
-            # Get the entrada and saída trades
-            trades1 = trades_por_cripto[moeda1]
-            trades2 = trades_por_cripto[moeda2]
-            
-            # Calculate total amounts for each currency
-            total1_entrada = sum(abs(parse_float_value(t['Quantidade'])) for t in trades1['entrada'])
-            total1_saida = sum(abs(parse_float_value(t['Quantidade'])) for t in trades1['saida'])
-            total2_entrada = sum(abs(parse_float_value(t['Quantidade'])) for t in trades2['entrada'])
-            total2_saida = sum(abs(parse_float_value(t['Quantidade'])) for t in trades2['saida'])
-            
-            print(f"    {moeda1} - Entrada: {total1_entrada}, Saída: {total1_saida}")
-            print(f"    {moeda2} - Entrada: {total2_entrada}, Saída: {total2_saida}")
-            
-            # Find associated fee
-            fee = trades[
-                (trades['Tipo de transação'] == 'Taxas de Negociação Spot') & 
-                (trades['Cripto'] == 'USDT')
-            ]
-            fee_amount = str(abs(parse_float_value(fee['Quantidade'].sum()))) if not fee.empty else ''
-            print(f"    Taxa: {fee_amount}")
-            
-            # Create the trade entry
-            if total1_entrada > 0 and total2_saida > 0:
-                # moeda1 was received, moeda2 was sent
-                linha_koinly = {
-                    'Date': f"{timestamp} UTC",
-                    'Sent Amount': str(total2_saida),
-                    'Sent Currency': moeda2,
-                    'Received Amount': str(total1_entrada),
-                    'Received Currency': moeda1,
-                    'Fee Amount': fee_amount,
-                    'Fee Currency': 'USDT' if fee_amount else '',
-                    'Net Worth Amount': '',
-                    'Net Worth Currency': '',
-                    'Label': 'Trade',
-                    'Description': f"Trade: {moeda2} -> {moeda1}",
-                    'TxHash': ''
-                }
-                linhas_koinly.append(linha_koinly)
-                print(f"    Linha gerada: {linha_koinly}")
-            elif total1_saida > 0 and total2_entrada > 0:
-                # moeda1 was sent, moeda2 was received
-                linha_koinly = {
-                    'Date': f"{timestamp} UTC",
-                    'Sent Amount': str(total1_saida),
-                    'Sent Currency': moeda1,
-                    'Received Amount': str(total2_entrada),
-                    'Received Currency': moeda2,
-                    'Fee Amount': fee_amount,
-                    'Fee Currency': 'USDT' if fee_amount else '',
-                    'Net Worth Amount': '',
-                    'Net Worth Currency': '',
-                    'Label': 'Trade',
-                    'Description': f"Trade: {moeda1} -> {moeda2}",
-                    'TxHash': ''
-                }
-                linhas_koinly.append(linha_koinly)
-                print(f"    Linha gerada: {linha_koinly}")
+    return linhas_koinly
 
+def _linhas_de_pares(data_koinly: str, pares: Dict[Tuple[str, str], list], escala_por_moeda: Dict[str, int],
+                     timestamp, instrumentacao: Instrumentacao) -> List[LinhaKoinly]:
+    """
+    Gera uma linha Trade por par (moeda recebida, moeda enviada) de um
+    timestamp, como LinhaKoinly. Cada par leva só as taxas que foram associadas a ele; como o
+    Koinly aceita uma moeda de taxa por linha, taxas em outras moedas do
+    mesmo par são registradas como pernas sem par.
+    """
+    linhas_koinly = []
+    for (recebida, enviada), (total_recebido, total_enviado, taxas) in pares.items():
+        fee_amount, fee_currency = '', ''
+        for moeda_taxa, total_taxa in taxas.items():
+            if not fee_currency:
+                fee_amount = formatar_escalado(total_taxa, escala_por_moeda[moeda_taxa])
+                fee_currency = moeda_taxa if fee_amount else ''
+            else:
+                instrumentacao.registrar_perna_sem_par(
+                    timestamp, moeda_taxa, "taxa", formatar_escalado(total_taxa, escala_por_moeda[moeda_taxa])
+                )
+        linhas_koinly.append(LinhaKoinly(
+            data_koinly,
+            formatar_escalado(total_enviado, escala_por_moeda[enviada]),
+            enviada,
+            formatar_escalado(total_recebido, escala_por_moeda[recebida]),
+            recebida,
+            fee_amount,
+            fee_currency,
+            '',
+            '',
+            'Trade',
+            f"Trade: {enviada} -> {recebida}",
+            ''
+        ))
     return linhas_koinly
 
-def converter_mexc_para_koinly(input_file: str, output_file: str = "mexc_koinly.csv"):
+def parear_pernas(pernas: List[Tuple[str, bool, bool, int]], timestamp, escala_por_moeda: Dict[str, int],
+                  instrumentacao: Instrumentacao) -> Dict[Tuple[str, str], list]:
     """
-    Converte um arquivo Excel do MEXC para o formato CSV do Koinly.
+    Pareia as pernas de um timestamp na ordem do extrato, para grupos com
+    vários pares ou execuções no mesmo segundo. Pernas de entrada e de saída
+    à espera de par ficam indexadas por moeda: cada perna nova é pareada com
+    a mais antiga pendente do lado oposto em outra moeda. Cada taxa vai para
+    o par mais recente que envolve a moeda dela (ou, se nenhum envolver, para
+    o par mais recente do timestamp). O que sobra é registrado como sem par.
     
     Args:
-        input_file (str): Caminho do arquivo Excel de entrada
-        output_file (str): Caminho do arquivo CSV de saída
-    """
-    try:
-        # Ler o arquivo Excel
-        df = pd.read_excel(input_file)
+        pernas (list): [(moeda, é taxa, é entrada, valor absoluto escalado), ...] na ordem do extrato
+        timestamp: Timestamp do grupo, para o registro de pernas sem par
+        escala_por_moeda (dict): Escala dos valores de cada moeda
+        instrumentacao (Instrumentacao): Recebe as pernas sem par
         
-        # Verificar o formato e obter o mapeamento
-        formato = detectar_formato(df)
-        if formato not in FORMATOS:
-            raise ValueError(f"Formato não suportado: {formato}")
-            
-        logging.info(f"Formato detectado: {formato}")
+    Returns:
+        dict: {(moeda recebida, moeda enviada): [total recebido, total enviado, {moeda da taxa: total}]}
+    """
+    pendentes = {True: {}, False: {}}
+    taxas_pendentes: Dict[str, int] = {}
+    pares: Dict[Tuple[str, str], list] = {}
+    par_por_moeda: Dict[str, Tuple[str, str]] = {}
+    ultimo_par = None
+
+    for moeda, is_taxa, entrada, valor in pernas:
+        if is_taxa:
+            chave = par_por_moeda.get(moeda, ultimo_par)
+            if chave is None:
+                taxas_pendentes[moeda] = taxas_pendentes.get(moeda, 0) + valor
+            else:
+                taxas = pares[chave][2]
+                taxas[moeda] = taxas.get(moeda, 0) + valor
+            continue
+
+        opostas = pendentes[not entrada]
+        contraparte = next((m for m in opostas if m != moeda), None)
+        if contraparte is None:
+            pendentes[entrada].setdefault(moeda, deque()).append(valor)
+            continue
+        fila = opostas[contraparte]
+        valor_contraparte = fila.popleft()
+        if not fila:
+            del opostas[contraparte]
+
+        if entrada:
+            chave, recebido, enviado = (moeda, contraparte), valor, valor_contraparte
+        else:
+            chave, recebido, enviado = (contraparte, moeda), valor_contraparte, valor
+        par = pares.setdefault(chave, [0, 0, {}])
+        par[0] += recebido
+        par[1] += enviado
+        par_por_moeda[moeda] = par_por_moeda[contraparte] = ultimo_par = chave
+        # Taxas que chegaram antes do primeiro par da sua moeda
+        for moeda_par in chave:
+            if moeda_par in taxas_pendentes:
+                par[2][moeda_par] = par[2].get(moeda_par, 0) + taxas_pendentes.pop(moeda_par)
+
+    for moeda, total in taxas_pendentes.items():
+        chave = par_por_moeda.get(moeda, ultimo_par)
+        if chave is None:
+            instrumentacao.registrar_perna_sem_par(timestamp, moeda, "taxa",
+                                                   formatar_escalado(total, escala_por_moeda[moeda]))
+        else:
+            pares[chave][2][moeda] = pares[chave][2].get(moeda, 0) + total
+    for entrada, filas in pendentes.items():
+        for moeda, fila in filas.items():
+            for valor in fila:
+                instrumentacao.registrar_perna_sem_par(timestamp, moeda, "entrada" if entrada else "saida",
+                                                       formatar_escalado(valor, escala_por_moeda[moeda]))
+    return pares
+
+def parear_trades(df: pd.DataFrame, quantidades: Tuple[np.ndarray, np.ndarray], datas_koinly: pd.Series,
+                  mapeamento: Dict[str, str] = FORMATOS["FORMATO_2"],
+                  instrumentacao: Optional[Instrumentacao] = None) -> Iterator[LinhaKoinly]:
+    """
+    Gera, sob demanda, as linhas Trade de um extrato no FORMATO_2. As pernas de trades spot
+    e as taxas são indexadas por (timestamp, moeda) com somas exatas e
+    vetorizadas. O caso comum (um par por timestamp: uma moeda só entra e a
+    outra só sai, com qualquer número de execuções) sai direto desses totais,
+    com todas as taxas do timestamp. Os demais timestamps (vários pares no
+    mesmo segundo, compra e venda da mesma moeda) são resolvidos perna a
+    perna por parear_pernas, em tempo linear. As moedas são agrupadas pelos
+    códigos de texto_categorico; o texto só é usado nas linhas geradas.
+    
+    Args:
+        df (pd.DataFrame): DataFrame com as transações (FORMATO_2)
+        quantidades (tuple): (valores, escalas) de escalar_por_moeda, por linha de df
+        datas_koinly (pd.Series): Datas de df já convertidas por datas_para_koinly
+        mapeamento (dict): Mapeamento de colunas do FORMATO_2
+        instrumentacao (Instrumentacao): Recebe os contadores de grupos e de pernas sem par
+        
+    Yields:
+        LinhaKoinly: Linhas Trade; os timestamps saem na ordem da sua primeira ocorrência
+    """
+    instrumentacao = instrumentacao or Instrumentacao()
+    debug = logger.isEnabledFor(logging.DEBUG)
+    valores, escalas = quantidades
+    tipo = df[mapeamento["COL_TIPO"]]
+    cripto = texto_categorico(df[mapeamento["COL_CRIPTO"]])
+    moedas = cripto.cat.codes.to_numpy()
+    nomes = np.asarray(cripto.cat.categories, dtype=object)
+    codigos, timestamps = pd.factorize(df[mapeamento["COL_DATA"]])
+    is_spot = (tipo == 'Negociação Spot').to_numpy() & (codigos >= 0)
+    is_taxa = (tipo == 'Taxas de Negociação Spot').to_numpy() & (codigos >= 0)
+    is_trade = is_spot | is_taxa
+    entrada = (df[mapeamento["COL_DIRECAO"]] == 'Fluxo de entrada').to_numpy()
+    absolutos = np.abs(valores)
+    moedas_trade, primeiras_moedas = np.unique(moedas[is_trade], return_index=True)
+    escala_por_moeda = dict(zip(nomes[moedas_trade].tolist(), escalas[is_trade][primeiras_moedas].tolist()))
+
+    # Totais por (timestamp, moeda): entradas e saídas das pernas spot, e taxas
+    pernas = pd.DataFrame({
+        'codigo': codigos[is_spot],
+        'cripto': moedas[is_spot],
+        'entrada': np.where(entrada, absolutos, 0)[is_spot],
+        'saida': np.where(entrada, 0, absolutos)[is_spot]
+    }).groupby(['codigo', 'cripto'], sort=False).sum()
+    taxas = pd.DataFrame({
+        'codigo': codigos[is_taxa], 'cripto': moedas[is_taxa], 'valor': absolutos[is_taxa]
+    }).groupby(['codigo', 'cripto'], sort=False)['valor'].sum()
+
+    # Timestamps simples: exatamente duas moedas, uma só com entradas e outra só com saídas
+    so_entrada = ((pernas['entrada'] > 0) & (pernas['saida'] == 0)).to_numpy()
+    so_saida = ((pernas['saida'] > 0) & (pernas['entrada'] == 0)).to_numpy()
+    resumo = pd.DataFrame(
+        {'moedas': 1, 'so_entrada': so_entrada, 'so_saida': so_saida},
+        index=pernas.index.get_level_values(0)
+    ).groupby(level=0).sum()
+    simples = resumo.index[(resumo['moedas'] == 2) & (resumo['so_entrada'] == 1) & (resumo['so_saida'] == 1)]
+    is_simples = np.zeros(len(timestamps), dtype=bool)
+    is_simples[simples.to_numpy()] = True
+
+    nomes_moedas = nomes.tolist()
+    pares_simples: Dict[int, list] = {}
+    for codigo, moeda, total_entrada, total_saida in zip(
+            pernas.index.get_level_values(0).tolist(), pernas.index.get_level_values(1).tolist(),
+            pernas['entrada'].tolist(), pernas['saida'].tolist()):
+        if is_simples[codigo]:
+            pares_simples.setdefault(codigo, []).append((nomes_moedas[moeda], total_entrada, total_saida))
+    taxas_por_codigo: Dict[int, Dict[str, int]] = {}
+    for codigo, moeda, total in zip(taxas.index.get_level_values(0).tolist(),
+                                    taxas.index.get_level_values(1).tolist(), taxas.tolist()):
+        taxas_por_codigo.setdefault(codigo, {})[nomes_moedas[moeda]] = total
+
+    # Pernas, uma a uma, dos timestamps que precisam de pareamento completo
+    posicoes = np.flatnonzero(is_trade & ~is_simples[codigos])
+    pernas_por_codigo: Dict[int, list] = {}
+    for codigo, moeda, taxa, perna_entrada, valor in zip(
+            codigos[posicoes].tolist(), nomes[moedas[posicoes]].tolist(), is_taxa[posicoes].tolist(),
+            entrada[posicoes].tolist(), absolutos[posicoes].tolist()):
+        pernas_por_codigo.setdefault(codigo, []).append((moeda, taxa, perna_entrada, valor))
+
+    posicoes = np.flatnonzero(is_trade)
+    primeiras = np.full(len(timestamps), -1)
+    unicos, indices = np.unique(codigos[posicoes], return_index=True)
+    primeiras[unicos] = posicoes[indices]
+    # Listas do Python: o acesso por grupo não passa pelo pandas (timestamps pode ser um Categorical)
+    datas_por_codigo = datas_koinly.to_numpy(dtype=object)[primeiras].tolist()
+    timestamps = timestamps.tolist()
+
+    for codigo in pd.unique(codigos[posicoes]).tolist():
+        timestamp = timestamps[codigo]
+        instrumentacao.contar("grupos")
+        if is_simples[codigo]:
+            (moeda1, entrada1, saida1), (moeda2, entrada2, saida2) = pares_simples[codigo]
+            if entrada1:
+                pares = {(moeda1, moeda2): [entrada1, saida2, taxas_por_codigo.get(codigo, {})]}
+            else:
+                pares = {(moeda2, moeda1): [entrada2, saida1, taxas_por_codigo.get(codigo, {})]}
+        else:
+            instrumentacao.contar("grupos_com_varios_pares")
+            pares = parear_pernas(pernas_por_codigo[codigo], timestamp, escala_por_moeda, instrumentacao)
+        if debug:
+            logger.debug("Timestamp %s: pares %s", timestamp, list(pares))
+        yield from _linhas_de_pares(datas_por_codigo[codigo], pares, escala_por_moeda,
+                                    timestamp, instrumentacao)
+
+def processar_grupo_trades(trades, timestamp, instrumentacao: Optional[Instrumentacao] = None,
+                           data_koinly: Optional[str] = None):
+    """
+    Processa um grupo de trades e taxas que já pertencem a um mesmo timestamp.
+    Diferente de processar_trades_relacionados, não filtra o DataFrame
+    novamente: o grupo deve vir pronto.
+    
+    Args:
+        trades (pd.DataFrame): Trades e taxas spot de um único timestamp
+        timestamp (str): Timestamp do grupo
+        instrumentacao (Instrumentacao): Recebe as pernas sem par
+        data_koinly (str): Data do grupo já convertida para UTC (padrão: converte timestamp)
         
-        # Print available columns and unique transaction types
-        print("\nColunas disponíveis:")
-        print(df.columns.tolist())
-        print("\nTipos de transações únicos:")
-        print(df['Tipo de transação'].unique())
-        print("\nDireções únicas:")
-        print(df['Direção'].unique())
+    Returns:
+        list: Linhas Koinly (LinhaKoinly)
+    """
+    if data_koinly is None:
+        data_koinly = parse_datetime_to_koinly(timestamp, fuso_da_coluna('Data de criação(UTC+-3)'))
+    quantidades = escalar_por_moeda(*parse_quantidades_exatas(trades['Quantidade']), trades['Cripto'])
+    datas_koinly = pd.Series(data_koinly, index=trades.index)
+    return list(parear_trades(trades, quantidades, datas_koinly, instrumentacao=instrumentacao))
+
+def converter_dataframe(df: pd.DataFrame, mapeamento: Dict[str, str],
+                        instrumentacao: Optional[Instrumentacao] = None) -> Tuple[pd.DataFrame, pd.DataFrame, Iterator[List[LinhaKoinly]]]:
+    """
+    Converte um DataFrame (ou um bloco dele) em linhas Koinly. O FORMATO_1
+    (histórico de ordens) só tem trades, convertidos por converter_formato_1.
+    
+    Args:
+        df (pd.DataFrame): DataFrame com as transações
+        mapeamento (dict): Mapeamento de colunas do formato detectado
+        instrumentacao (Instrumentacao): Recebe os tempos de classify/match e os contadores
         
-        # Aplicar o mapeamento de colunas
+    Returns:
+        tuple: (depósitos, airdrops, trades). Depósitos e airdrops são
+            DataFrames com as colunas de COLUNAS_KOINLY; trades é um iterador
+            de listas de até TAMANHO_BUFFER_ESCRITA linhas (LinhaKoinly),
+            pareadas à medida que são consumidas
+    """
+    instrumentacao = instrumentacao or Instrumentacao()
+    if "COL_PARES" in mapeamento:
+        ordens = converter_formato_1(df, mapeamento, instrumentacao)
+        vazio = pd.DataFrame(columns=COLUNAS_KOINLY)
+        linhas = map(LinhaKoinly._make, ordens.itertuples(index=False, name=None))
+        return vazio, vazio, _em_listas(linhas, TAMANHO_BUFFER_ESCRITA)
+    
+    # Converter todas as datas para UTC de uma vez, reaproveitadas por depósitos, airdrops e trades
+    with instrumentacao.estagio("dates"):
+        datas_koinly = datas_para_koinly(df[mapeamento["COL_DATA"]], fuso_da_coluna(mapeamento["COL_DATA"]))
+    
+    # Converter as quantidades uma única vez em inteiros escalados por moeda
+    with instrumentacao.estagio("amounts"):
+        quantidades = escalar_por_moeda(
+            *parse_quantidades_exatas(df[mapeamento["COL_QUANTIDADE"]]), df[mapeamento["COL_CRIPTO"]]
+        )
+    
+    # Classificar de uma vez as linhas que não são trades nem taxas; depósitos e airdrops saem prontos
+    with instrumentacao.estagio("classify"):
+        outras = ~df[mapeamento["COL_TIPO"]].isin(['Negociação Spot', 'Taxas de Negociação Spot']).to_numpy()
+        classificadas = classificar_formato_2(
+            df[outras], mapeamento, datas_koinly[outras], (quantidades[0][outras], quantidades[1][outras])
+        )
+        depositos = classificadas[classificadas['Label'] == 'Deposit']
+        airdrops = classificadas[classificadas['Label'] == 'Airdrop']
+    instrumentacao.contar("depositos", len(depositos))
+    instrumentacao.contar("airdrops", len(airdrops))
+    
+    # Processar trades: pernas indexadas por timestamp e moeda, pareadas à medida que a saída é escrita
+    linhas = parear_trades(df, quantidades, datas_koinly, mapeamento, instrumentacao)
+    trades = _medir_blocos(_em_listas(linhas, TAMANHO_BUFFER_ESCRITA), instrumentacao, "match", "trades")
+    
+    return depositos, airdrops, trades
+
+def trades_para_dataframe(trades: Iterator[List[LinhaKoinly]]) -> pd.DataFrame:
+    """Junta os blocos de trades de converter_dataframe em um DataFrame."""
+    return pd.DataFrame([linha for bloco in trades for linha in bloco], columns=COLUNAS_KOINLY)
+
+def _em_listas(linhas: Iterator, tamanho: int) -> Iterator[list]:
+    """Agrupa um iterador em listas de até tamanho itens."""
+    linhas = iter(linhas)
+    while True:
+        bloco = list(islice(linhas, tamanho))
+        if not bloco:
+            return
+        yield bloco
+
+def _medir_blocos(blocos: Iterator, instrumentacao: Instrumentacao, estagio: str, contador: str) -> Iterator:
+    """
+    Repassa os blocos de um iterador, contando o tempo gasto para produzi-los
+    no estágio indicado e o número de linhas no contador.
+    """
+    while True:
+        with instrumentacao.estagio(estagio):
+            bloco = next(blocos, None)
+        if bloco is None:
+            return
+        instrumentacao.contar(contador, len(bloco))
+        yield bloco
+
+def caminho_checkpoint(output_file: str) -> str:
+    """
+    Retorna o caminho do checkpoint do modo incremental, ao lado do CSV de saída.
+    """
+    return f"{output_file}.checkpoint.json"
+
+def carregar_checkpoint(caminho: str) -> Optional[dict]:
+    """
+    Lê o checkpoint do modo incremental. Retorna None se não existir ou se
+    tiver sido gerado por outra versão do conversor.
+    """
+    if not os.path.exists(caminho):
+        return None
+    with open(caminho, encoding='utf-8') as f:
+        checkpoint = json.load(f)
+    if checkpoint.get("versao") != VERSAO:
+        logger.info(f"Checkpoint de outra versão ({checkpoint.get('versao')}), reconvertendo tudo")
+        return None
+    return checkpoint
+
+def salvar_checkpoint(caminho: str, checkpoint: dict):
+    """
+    Grava o checkpoint de forma atômica (arquivo temporário + rename).
+    """
+    temporario = f"{caminho}.tmp"
+    with open(temporario, 'w', encoding='utf-8') as f:
+        json.dump(checkpoint, f, ensure_ascii=False, indent=2)
+    os.replace(temporario, caminho)
+
+def _datas_distintas(df: pd.DataFrame, mapeamento: Dict[str, str]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Retorna o código de cada linha e o texto de cada data distinta do
+    extrato ('' se não for uma data válida), com um '' extra no final para o
+    código -1 (data vazia): filtros por data comparam cada data uma vez.
+    """
+    codigos, unicos = pd.factorize(df[coluna_data(mapeamento)])
+    textos = pd.Series(np.asarray(unicos, dtype=object), dtype=object).astype(str).str.strip()
+    textos = textos.where(textos.str.fullmatch(_DATA_MEXC).fillna(False).astype(bool), '')
+    return codigos, np.append(textos.to_numpy(dtype=object), '')
+
+def contar_transacoes_em(df: pd.DataFrame, mapeamento: Dict[str, str], timestamp: str) -> int:
+    """Número de transações do extrato no timestamp (texto no formato do extrato)."""
+    codigos, textos = _datas_distintas(df, mapeamento)
+    return int(np.count_nonzero((textos == timestamp)[codigos]))
+
+def filtrar_novas_transacoes(df: pd.DataFrame, mapeamento: Dict[str, str], ultimo: str,
+                             incluir_ultimo: bool = True) -> pd.DataFrame:
+    """
+    Mantém apenas as transações posteriores a ultimo e, com incluir_ultimo,
+    também as do próprio ultimo, que são convertidas de novo por inteiro: um
+    trade cujas pernas chegaram em exportações diferentes é pareado com todas
+    elas. Linhas sem data válida só entram na primeira conversão.
+    """
+    codigos, textos = _datas_distintas(df, mapeamento)
+    novas = (textos >= ultimo) if incluir_ultimo else (textos > ultimo)
+    return df[novas.astype(bool)[codigos]]
+
+def separar_ultimo_timestamp(df: pd.DataFrame, mapeamento: Dict[str, str]) -> Tuple[pd.DataFrame, pd.DataFrame, Optional[str]]:
+    """
+    Separa as transações do último timestamp (entre as de data válida) das
+    anteriores. Como os trades são pareados por timestamp, converter as duas
+    partes separadamente produz as mesmas linhas que convertê-las juntas.
+    
+    Returns:
+        tuple: (anteriores, do último timestamp, último timestamp ou None)
+    """
+    codigos, textos = _datas_distintas(df, mapeamento)
+    ultimo = max(textos.tolist())
+    if not ultimo:
+        return df, df.iloc[:0], None
+    ultimas = (textos == ultimo).astype(bool)[codigos]
+    return df[~ultimas], df[ultimas], ultimo
+
+def _inicio_linhas_finais(caminho: str, data: Optional[str]) -> int:
+    """
+    Posição (em bytes) do início do trecho final de um CSV sem compressão
+    formado só por linhas com Date igual a data, lendo o arquivo de trás
+    para a frente em janelas que crescem até cobrir o trecho.
+    """
+    with open(caminho, 'rb') as f:
+        tamanho = f.seek(0, os.SEEK_END)
+        if data is None:
+            return tamanho
+        prefixo = f"{data},".encode('utf-8')
+        janela = TAMANHO_AMOSTRA_CSV
+        while True:
+            inicio = max(tamanho - janela, 0)
+            f.seek(inicio)
+            linhas = f.read().split(b'\n')
+            if linhas[-1] == b'':
+                linhas.pop()
+            # Sem o começo do arquivo, a primeira linha da janela pode estar cortada
+            completas = linhas if inicio == 0 else linhas[1:]
+            posicao = tamanho
+            for linha in reversed(completas):
+                if not linha.startswith(prefixo):
+                    return posicao
+                posicao -= len(linha) + 1
+            if inicio == 0:
+                return posicao
+            janela *= 4
+
+def localizar_fronteira(caminho: str, checkpoint: dict) -> Optional[Tuple[int, int]]:
+    """
+    Localiza em output_file as linhas do último timestamp do checkpoint.
+    Se o arquivo não mudou desde a conversão, valem as posições gravadas no
+    checkpoint; se foi regravado sem compressão (por exemplo, com o Net Worth
+    preenchido), as linhas são procuradas no final dele.
+    
+    Returns:
+        tuple: (início das linhas do último timestamp, fim do conteúdo válido),
+            em bytes, ou None se não for possível localizá-las sem ler o
+            arquivo inteiro (CSV com gzip regravado depois da conversão)
+    """
+    if not os.path.exists(caminho) or checkpoint.get("tamanho_saida") is None:
+        return None
+    tamanho = os.path.getsize(caminho)
+    if checkpoint.get("escrevendo"):
+        # Uma escrita no próprio arquivo foi interrompida: o que passa de tamanho_saida é descartado
+        if tamanho < checkpoint["tamanho_saida"]:
+            return None
+        return checkpoint["inicio_fronteira"], checkpoint["tamanho_saida"]
+    if tamanho == checkpoint["tamanho_saida"]:
+        return checkpoint["inicio_fronteira"], tamanho
+    if compressao_arquivo(caminho) == 'gzip':
+        return None
+    return _inicio_linhas_finais(caminho, checkpoint["data_fronteira"]), tamanho
+
+def _permissoes_padrao() -> int:
+    """Permissões de um arquivo novo segundo a umask do processo."""
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+class EscritorKoinly:
+    """
+    Escreve o CSV do Koinly (colunas de COLUNAS_KOINLY) à medida que as linhas
+    são produzidas, acumulando até tamanho_buffer linhas por escrita, de modo
+    que a memória da saída não cresce com o número de linhas.
+    
+    Tudo é gravado em um arquivo temporário na pasta do destino, que só o
+    substitui (rename atômico) quando o bloco with termina sem erro: uma
+    falha no meio da conversão nunca deixa um CSV pela metade. Com
+    acrescentar e inicio, o destino é escrito no próprio arquivo, sem copiar
+    o que vem antes de inicio; se o bloco with falhar, o final original é
+    restaurado.
+    
+    Args:
+        caminho (str): CSV de destino
+        acrescentar (bool): Mantém o conteúdo atual do destino e escreve as
+            novas linhas depois dele, sem cabeçalho
+        comprimir (bool): Grava com gzip (padrão: destino terminado em .gz)
+        tamanho_buffer (int): Linhas acumuladas antes de cada escrita
+        instrumentacao (Instrumentacao): Recebe o tempo de escrita no estágio "write"
+        inicio (int): Com acrescentar, mantém só os primeiros inicio bytes do
+            destino (um início de linha ou, com gzip, de membro) e escreve
+            depois deles no próprio arquivo
+        descartar_final (str): Com acrescentar e sem inicio, não copia as
+            linhas do final do destino cuja Date é este texto
+    """
+
+    def __init__(self, caminho: str, acrescentar: bool = False, comprimir: Optional[bool] = None,
+                 tamanho_buffer: int = TAMANHO_BUFFER_ESCRITA, instrumentacao: Optional[Instrumentacao] = None,
+                 inicio: Optional[int] = None, descartar_final: Optional[str] = None):
+        self.caminho = caminho
+        self.acrescentar = acrescentar and os.path.exists(caminho)
+        self.comprimir = caminho.endswith('.gz') if comprimir is None else comprimir
+        self.tamanho_buffer = tamanho_buffer
+        self.instrumentacao = instrumentacao or Instrumentacao()
+        self.inicio = inicio if self.acrescentar else None
+        self.descartar_final = descartar_final
+        self.linhas_escritas = 0
+        # Posição (em bytes do arquivo) onde começam as linhas desta escrita
+        self.inicio_novas = 0
+        self._pendentes: List[tuple] = []
+
+    def __enter__(self) -> "EscritorKoinly":
+        with self.instrumentacao.estagio("write"):
+            self._compactado = None
+            self._texto = None
+            if self.inicio is not None:
+                self._bruto = open(self.caminho, 'r+b')
+                self._bruto.seek(self.inicio)
+                self._final_original = self._bruto.read()
+                self._bruto.seek(self.inicio)
+                self._bruto.truncate()
+            else:
+                pasta = os.path.dirname(os.path.abspath(self.caminho))
+                fd, self._temporario = tempfile.mkstemp(
+                    dir=pasta, prefix=f".{os.path.basename(self.caminho)}.", suffix=".tmp"
+                )
+                self._bruto = os.fdopen(fd, 'wb')
+            try:
+                if self.acrescentar and self.inicio is None:
+                    if self.descartar_final is None:
+                        with open(self.caminho, 'rb') as atual:
+                            shutil.copyfileobj(atual, self._bruto)
+                    else:
+                        self._copiar_sem_final()
+                self.inicio_novas = self._bruto.tell()
+                self._abrir_texto(com_bom=not self.acrescentar)
+                if not self.acrescentar:
+                    self._writer.writerow(COLUNAS_KOINLY)
+            except BaseException:
+                self._descartar()
+                raise
+        return self
+
+    def _abrir_texto(self, com_bom: bool = False):
+        if self.comprimir:
+            # Ao acrescentar, o gzip ganha um novo membro, que os leitores concatenam
+            self._compactado = gzip.GzipFile(filename='', mode='wb', fileobj=self._bruto, mtime=0)
+        self._texto = io.TextIOWrapper(
+            self._compactado or self._bruto, encoding='utf-8-sig' if com_bom else 'utf-8', newline=''
+        )
+        self._writer = csv.writer(self._texto, lineterminator='\n')
+
+    def _fechar_texto(self):
+        self._descarregar()
+        self._texto.flush()
+        self._texto.detach()
+        if self._compactado is not None:
+            self._compactado.close()
+            self._compactado = None
+
+    def _copiar_sem_final(self):
+        """Copia o destino (descompactado, se for o caso) sem as linhas finais com Date descartar_final."""
+        prefixo = f"{self.descartar_final},".encode('utf-8')
+        final: List[bytes] = []
+        self._abrir_texto()
+        saida = self._texto.buffer
+        with (gzip.open if compressao_arquivo(self.caminho) == 'gzip' else open)(self.caminho, 'rb') as atual:
+            for linha in atual:
+                if linha.startswith(prefixo):
+                    final.append(linha)
+                    continue
+                saida.writelines(final)
+                final = []
+                saida.write(linha)
+        self._pendentes = []
+        self._fechar_texto()
+
+    def marcar_fronteira(self) -> int:
+        """
+        Grava as linhas pendentes e retorna a posição (em bytes do arquivo)
+        onde começam as próximas; com gzip, elas vão para um novo membro.
+        """
+        with self.instrumentacao.estagio("write"):
+            self._fechar_texto()
+            posicao = self._bruto.tell()
+            self._abrir_texto()
+        return posicao
+
+    def escrever_linhas(self, linhas):
+        """Acrescenta linhas (LinhaKoinly ou outras sequências na ordem de COLUNAS_KOINLY) à saída."""
+        with self.instrumentacao.estagio("write"):
+            for linha in linhas:
+                self._pendentes.append(linha)
+                if len(self._pendentes) >= self.tamanho_buffer:
+                    self._descarregar()
+
+    def escrever_dataframe(self, df: pd.DataFrame):
+        """Acrescenta as linhas de um DataFrame com as colunas de COLUNAS_KOINLY."""
+        with self.instrumentacao.estagio("write"):
+            self._descarregar()
+            df.to_csv(self._texto, columns=COLUNAS_KOINLY, header=False, index=False, lineterminator='\n')
+            self.linhas_escritas += len(df)
+
+    def escrever_partes(self, partes: Tuple[pd.DataFrame, pd.DataFrame, Iterator[List[LinhaKoinly]]]):
+        """Escreve o resultado de converter_dataframe: depósitos, airdrops e trades, nessa ordem."""
+        depositos, airdrops, trades = partes
+        self.escrever_dataframe(depositos)
+        self.escrever_dataframe(airdrops)
+        for bloco in trades:
+            self.escrever_linhas(bloco)
+
+    def copiar_csv(self, arquivo, linhas: int = 0):
+        """
+        Acrescenta o conteúdo de um arquivo texto já no formato do CSV, sem
+        cabeçalho; linhas (se conhecido) é somado a linhas_escritas.
+        """
+        with self.instrumentacao.estagio("write"):
+            self._descarregar()
+            shutil.copyfileobj(arquivo, self._texto)
+            self.linhas_escritas += linhas
+
+    def _descarregar(self):
+        self._writer.writerows(self._pendentes)
+        self.linhas_escritas += len(self._pendentes)
+        self._pendentes = []
+
+    def _descartar(self):
+        if self.inicio is not None:
+            with contextlib.suppress(Exception):
+                if self._texto is not None:
+                    self._texto.detach()
+            with contextlib.suppress(Exception):
+                if self._compactado is not None:
+                    self._compactado.close()
+            # Devolve ao arquivo o final que estava depois de inicio
+            self._bruto.seek(self.inicio)
+            self._bruto.truncate()
+            self._bruto.write(self._final_original)
+            self._bruto.close()
+            return
+        for arquivo in (self._compactado, self._bruto):
+            with contextlib.suppress(Exception):
+                if arquivo is not None:
+                    arquivo.close()
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self._temporario)
+
+    def __exit__(self, tipo, valor, rastreamento):
+        if tipo is not None:
+            self._descartar()
+            return False
+        with self.instrumentacao.estagio("write"):
+            try:
+                self._fechar_texto()
+                self._bruto.flush()
+                os.fsync(self._bruto.fileno())
+                self._bruto.close()
+                if self.inicio is not None:
+                    return False
+                if os.path.exists(self.caminho):
+                    shutil.copymode(self.caminho, self._temporario)
+                else:
+                    os.chmod(self._temporario, _permissoes_padrao())
+                os.replace(self._temporario, self.caminho)
+            except BaseException:
+                self._descartar()
+                raise
+        return False
+
+def _avisar_pernas_sem_par(instrumentacao: Instrumentacao):
+    total = instrumentacao.contadores["pernas_sem_par"]
+    if total:
+        logger.warning(f"{total} pernas de trade ficaram sem par e não entraram no CSV (detalhes no relatório do --profile)")
+
+def _converter_em_blocos(input_file: str, output_file: str, tamanho_bloco: int,
+                         instrumentacao: Instrumentacao, comprimir: Optional[bool] = None) -> int:
+    """
+    Converte o arquivo bloco a bloco, com memória limitada ao tamanho do bloco.
+    Depósitos, airdrops e trades de cada bloco vão para arquivos temporários
+    separados, concatenados no final para manter a mesma ordem da conversão completa.
+    Retorna o número de linhas escritas.
+    """
+    total = 0
+    pasta_saida = os.path.dirname(os.path.abspath(output_file))
+    temporarios = [tempfile.TemporaryFile(mode='w+', encoding='utf-8', newline='', dir=pasta_saida) for _ in range(3)]
+    try:
+        with instrumentacao.estagio("detect"):
+            formato, planilha = detectar_formato_arquivo(input_file)
+        if formato not in FORMATOS:
+            raise ValueError(f"Formato não suportado: {formato}")
+        logger.info(f"Formato detectado: {formato}")
         mapeamento = FORMATOS[formato]
+
+        escritor_trades = csv.writer(temporarios[2], lineterminator='\n')
+        blocos = _medir_blocos(ler_mexc_em_blocos(input_file, tamanho_bloco, planilha), instrumentacao,
+                               "read", "linhas_lidas")
+        for bloco in blocos_sem_cortar_timestamp(blocos, coluna_data(mapeamento)):
+            depositos, airdrops, trades = converter_dataframe(bloco, mapeamento, instrumentacao)
+            with instrumentacao.estagio("write"):
+                for parte, temporario in ((depositos, temporarios[0]), (airdrops, temporarios[1])):
+                    parte.to_csv(temporario, index=False, header=False, lineterminator='\n')
+                    total += len(parte)
+            for linhas in trades:
+                with instrumentacao.estagio("write"):
+                    escritor_trades.writerows(linhas)
+                    total += len(linhas)
+
+        with EscritorKoinly(output_file, comprimir=comprimir, instrumentacao=instrumentacao) as saida:
+            for temporario in temporarios:
+                temporario.seek(0)
+                saida.copiar_csv(temporario)
+    finally:
+        for temporario in temporarios:
+            temporario.close()
+    return total
+
+def cortes_particoes(datas: pd.Series, quantidade: int) -> List[int]:
+    """
+    Divide as linhas em até quantidade faixas contíguas de tamanho parecido,
+    sem separar as linhas de um mesmo timestamp: cortar antes da linha i só
+    é válido se nenhum timestamp das linhas anteriores aparece de novo a
+    partir de i. Em extratos ordenados por data (em qualquer sentido, como
+    os do MEXC), toda troca de timestamp é um corte válido e as faixas são
+    intervalos de tempo.
+    
+    Args:
+        datas (pd.Series): Coluna de data do extrato
+        quantidade (int): Número desejado de faixas
         
-        # Inicializar lista para armazenar as linhas do Koinly
-        linhas_koinly = []
+    Returns:
+        list: Início de cada faixa e, no final, len(datas)
+    """
+    total = len(datas)
+    if quantidade < 2 or total < 2:
+        return [0, total]
+    codigos, _ = pd.factorize(datas)
+    posicoes = np.arange(total)
+    # Última linha de cada timestamp; linhas sem data não prendem nenhum corte
+    ultimas = np.zeros(codigos.max() + 1, dtype=np.int64)
+    com_data = codigos >= 0
+    np.maximum.at(ultimas, codigos[com_data], posicoes[com_data])
+    alcance = np.maximum.accumulate(np.where(com_data, ultimas[np.maximum(codigos, 0)], posicoes))
+    validos = np.flatnonzero(alcance[:-1] < posicoes[1:]) + 1
+    alvos = np.searchsorted(validos, (np.arange(1, quantidade) * total) // quantidade)
+    cortes = np.unique(validos[alvos[alvos < len(validos)]])
+    return [0, *cortes.tolist(), total]
+
+# Extrato e mapeamento dos processos da conversão paralela; cada tarefa só
+# recebe os limites da sua faixa (ver _contexto_particoes)
+_PARTICOES: dict = {}
+
+def _iniciar_particoes(df: pd.DataFrame, mapeamento: Dict[str, str]):
+    _PARTICOES["df"] = df
+    _PARTICOES["mapeamento"] = mapeamento
+
+def _contexto_particoes():
+    """
+    Método de início dos processos da conversão paralela. Com fork (Linux),
+    os initargs não são serializados: cada processo herda o DataFrame do
+    processo principal, com as páginas compartilhadas até serem escritas.
+    Onde fork não existe ou não é seguro (Windows, macOS), spawn envia uma
+    cópia serializada do extrato a cada processo, que ocupa a sua memória.
+    """
+    import multiprocessing
+
+    if sys.platform.startswith("linux") and "fork" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("fork")
+    return multiprocessing.get_context("spawn")
+
+def _converter_particao(faixa: Tuple[int, int]) -> Tuple[List[str], List[int], Instrumentacao]:
+    """
+    Converte as linhas [início, fim) do extrato (executado em um processo do
+    pool). Depósitos, airdrops e trades voltam já formatados como texto CSV,
+    que é barato de transferir entre processos e só precisa ser copiado.
+    
+    Returns:
+        tuple: ([depósitos, airdrops, trades] em CSV, linhas de cada parte,
+            instrumentação com os contadores e as pernas sem par da faixa)
+    """
+    inicio, fim = faixa
+    instrumentacao = Instrumentacao()
+    depositos, airdrops, trades = converter_dataframe(
+        _PARTICOES["df"].iloc[inicio:fim], _PARTICOES["mapeamento"], instrumentacao
+    )
+    textos = [
+        parte.to_csv(columns=COLUNAS_KOINLY, header=False, index=False, lineterminator='\n')
+        for parte in (depositos, airdrops)
+    ]
+    linhas = [len(depositos), len(airdrops), 0]
+    saida = io.StringIO()
+    escritor = csv.writer(saida, lineterminator='\n')
+    for bloco in trades:
+        escritor.writerows(bloco)
+        linhas[2] += len(bloco)
+    textos.append(saida.getvalue())
+    return textos, linhas, instrumentacao
+
+def converter_em_particoes(df: pd.DataFrame, mapeamento: Dict[str, str], escritor: "EscritorKoinly",
+                           processos: Optional[int] = None, instrumentacao: Optional[Instrumentacao] = None):
+    """
+    Converte um extrato em paralelo e escreve o resultado em escritor, com
+    a mesma saída da conversão serial. As linhas são divididas em faixas
+    contíguas que nunca separam um timestamp (cortes_particoes); cada faixa
+    é convertida em um processo do pool e os resultados são juntados em
+    ordem: os depósitos de todas as faixas, depois os airdrops e depois os
+    trades, como em converter_dataframe.
+    
+    Args:
+        df (pd.DataFrame): Extrato já lido
+        mapeamento (dict): Mapeamento de colunas do formato detectado
+        escritor (EscritorKoinly): Destino das linhas, já aberto
+        processos (int): Número de processos (padrão: número de CPUs)
+        instrumentacao (Instrumentacao): Recebe o tempo de conversão e os contadores das faixas
+    """
+    instrumentacao = instrumentacao or Instrumentacao()
+    processos = processos or os.cpu_count() or 1
+    quantidade = min(processos * PARTICOES_POR_PROCESSO, len(df) // TAMANHO_MINIMO_PARTICAO)
+    cortes = cortes_particoes(df[coluna_data(mapeamento)], quantidade)
+    faixas = list(zip(cortes[:-1], cortes[1:]))
+    instrumentacao.contar("particoes", len(faixas))
+    if processos < 2 or len(faixas) < 2:
+        escritor.escrever_partes(converter_dataframe(df, mapeamento, instrumentacao))
+        return
+    logger.info(f"Convertendo {len(faixas)} partições em {processos} processos")
+
+    # Importado aqui para não pesar na inicialização dos outros modos
+    from concurrent.futures import ProcessPoolExecutor
+
+    # Depósitos e airdrops esperam em memória; os trades, que são a maior parte, vão para o disco
+    secoes: Tuple[List[str], List[str]] = ([], [])
+    totais = [0, 0, 0]
+    pasta_saida = os.path.dirname(os.path.abspath(escritor.caminho))
+    with tempfile.TemporaryFile(mode='w+', encoding='utf-8', newline='', dir=pasta_saida) as trades:
+        with instrumentacao.estagio("convert"):
+            with ProcessPoolExecutor(max_workers=processos, mp_context=_contexto_particoes(),
+                                     initializer=_iniciar_particoes, initargs=(df, mapeamento)) as executor:
+                for textos, linhas, da_particao in executor.map(_converter_particao, faixas):
+                    secoes[0].append(textos[0])
+                    secoes[1].append(textos[1])
+                    trades.write(textos[2])
+                    totais = [total + quantidade for total, quantidade in zip(totais, linhas)]
+                    instrumentacao.juntar(da_particao)
+        for secao, total in zip(secoes, totais):
+            escritor.copiar_csv(io.StringIO(''.join(secao)), total)
+        trades.seek(0)
+        escritor.copiar_csv(trades, totais[2])
+
+def _escrever_conversao(escritor: EscritorKoinly, df: pd.DataFrame, mapeamento: Dict[str, str],
+                        processos: Optional[int], instrumentacao: Instrumentacao):
+    """Converte df e escreve depósitos, airdrops e trades em escritor, em série ou em partições."""
+    if processos == 1:
+        escritor.escrever_partes(converter_dataframe(df, mapeamento, instrumentacao))
+    else:
+        converter_em_particoes(df, mapeamento, escritor, processos, instrumentacao)
+
+def _converter_incremental(df: pd.DataFrame, mapeamento: Dict[str, str], output_file: str,
+                           arquivo_delta: Optional[str], comprimir: Optional[bool], processos: Optional[int],
+                           instrumentacao: Instrumentacao) -> Tuple[str, int]:
+    """
+    Modo incremental de converter_mexc_para_koinly. O checkpoint guarda o
+    último timestamp convertido, e as linhas dele ficam no final de
+    output_file: a execução seguinte as regrava junto com as do mesmo
+    timestamp que a nova exportação trouxer, então um trade cujas pernas
+    chegam em exportações diferentes é pareado por inteiro. Com
+    arquivo_delta, cujas linhas não podem ser corrigidas depois, as
+    transações do último timestamp esperam a próxima exportação (também na
+    primeira execução, que grava output_file).
+    
+    O custo acompanha as linhas novas: elas são escritas no próprio
+    output_file, a partir do último timestamp, sem copiar o resto, e o
+    estado da conciliação até esse ponto fica no checkpoint, de onde
+    conciliar_koinly(incremental=True) continua lendo só o final. Se a
+    escrita for interrompida, o checkpoint marcado com "escrevendo" indica
+    o trecho a descartar na execução seguinte.
+    
+    Returns:
+        tuple: (CSV gravado, linhas escritas)
+    """
+    caminho = caminho_checkpoint(output_file)
+    checkpoint = None
+    if arquivo_delta or os.path.exists(output_file):
+        checkpoint = carregar_checkpoint(caminho)
+    posicoes = None
+    incluir_ultimo = True
+    if checkpoint is not None:
+        posicoes = localizar_fronteira(output_file, checkpoint)
+        if checkpoint.get("escrevendo") and posicoes is None:
+            logger.warning(f"{output_file} foi alterado depois de uma escrita interrompida, reconvertendo tudo")
+            checkpoint = None
+    if checkpoint is not None:
+        ultimo = checkpoint["ultimo_timestamp"]
+        incluir_ultimo = checkpoint["incluir_ultimo"]
+        # Linhas do último timestamp já gravadas em output_file só são regravadas se a
+        # exportação trouxer todas elas de novo; senão ficam como estão
+        if checkpoint["linhas_fronteira"]:
+            presentes = contar_transacoes_em(df, mapeamento, ultimo)
+            if arquivo_delta and presentes > checkpoint["linhas_fronteira"]:
+                logger.warning(f"{presentes - checkpoint['linhas_fronteira']} transações de {ultimo} chegaram depois "
+                               f"da conversão dessa data em {output_file} e não entram no delta")
+            elif not arquivo_delta and presentes < checkpoint["linhas_fronteira"]:
+                logger.warning(f"A exportação tem {presentes} transações em {ultimo}, de "
+                               f"{checkpoint['linhas_fronteira']} já convertidas; as linhas gravadas são mantidas")
+            incluir_ultimo = not arquivo_delta and presentes >= checkpoint["linhas_fronteira"]
+        df = filtrar_novas_transacoes(df, mapeamento, ultimo, incluir_ultimo)
+        logger.info(f"Modo incremental: {len(df)} transações novas desde {ultimo}")
+    anteriores, ultimas, novo_ultimo = separar_ultimo_timestamp(df, mapeamento)
+
+    if checkpoint is not None and arquivo_delta:
+        with EscritorKoinly(arquivo_delta, instrumentacao=instrumentacao) as escritor:
+            _escrever_conversao(escritor, anteriores, mapeamento, processos, instrumentacao)
+        novo = dict(checkpoint, incluir_ultimo=incluir_ultimo)
+        if checkpoint["linhas_fronteira"]:
+            # As linhas do último timestamp em output_file passam a ser histórico
+            novo.update(linhas_fronteira=0, data_fronteira=None, conciliacao=None, tamanho_saida=None)
+            if posicoes is not None:
+                inicio, fim = posicoes
+                with instrumentacao.estagio("reconcile"):
+                    if checkpoint["conciliacao"] is not None:
+                        novo["conciliacao"] = _estado_conciliacao(
+                            ler_trecho_koinly(output_file, inicio, fim), checkpoint["conciliacao"]
+                        )
+                novo.update(inicio_fronteira=fim, tamanho_saida=fim)
+        if novo_ultimo is not None:
+            novo.update(ultimo_timestamp=novo_ultimo, incluir_ultimo=True)
+        salvar_checkpoint(caminho, novo)
+        return arquivo_delta, escritor.linhas_escritas
+
+    base = None
+    if checkpoint is None:
+        escritor = EscritorKoinly(output_file, comprimir=comprimir, instrumentacao=instrumentacao)
+        leitura = 0
+    elif posicoes is not None:
+        inicio, fim = posicoes
+        base = checkpoint["conciliacao"]
+        salvar_checkpoint(caminho, dict(checkpoint, inicio_fronteira=inicio, tamanho_saida=fim, escrevendo=True))
+        escritor = EscritorKoinly(output_file, acrescentar=True, comprimir=comprimir, instrumentacao=instrumentacao,
+                                  inicio=inicio if incluir_ultimo else fim)
+        # Linhas mantidas do último timestamp também entram no estado da conciliação
+        leitura = inicio
+    else:
+        # gzip regravado: o histórico é copiado, sem as linhas que serão regravadas
+        regravar = incluir_ultimo and checkpoint["linhas_fronteira"]
+        if regravar or not checkpoint["linhas_fronteira"]:
+            base = checkpoint["conciliacao"]
+        escritor = EscritorKoinly(output_file, acrescentar=True, comprimir=comprimir, instrumentacao=instrumentacao,
+                                  descartar_final=checkpoint["data_fronteira"] if regravar else None)
+        leitura = None
+    with escritor:
+        _escrever_conversao(escritor, anteriores, mapeamento, processos, instrumentacao)
+        inicio_fronteira = escritor.marcar_fronteira()
+        linhas_anteriores = escritor.linhas_escritas
+        if arquivo_delta:
+            ultimas = ultimas.iloc[:0]
+        _escrever_conversao(escritor, ultimas, mapeamento, 1, instrumentacao)
+
+    # Estado da conciliação até o novo último timestamp, lido só do trecho escrito agora
+    with instrumentacao.estagio("reconcile"):
+        if base is None:
+            leitura = 0
+        elif leitura is None:
+            leitura = escritor.inicio_novas
+        trecho = ler_trecho_koinly(output_file, leitura)
+        corte = len(trecho) - (escritor.linhas_escritas - linhas_anteriores)
+        estado = _estado_conciliacao(trecho.iloc[:corte], base)
+        data_fronteira = trecho['Date'].iloc[corte] if corte < len(trecho) else None
+
+    ultimo = novo_ultimo or (checkpoint or {}).get("ultimo_timestamp")
+    if ultimo is not None:
+        salvar_checkpoint(caminho, {
+            "versao": VERSAO,
+            "ultimo_timestamp": ultimo,
+            "incluir_ultimo": True if novo_ultimo is not None else incluir_ultimo,
+            "linhas_fronteira": len(ultimas),
+            "data_fronteira": data_fronteira if isinstance(data_fronteira, str) else None,
+            "inicio_fronteira": inicio_fronteira,
+            "tamanho_saida": os.path.getsize(output_file),
+            "conciliacao": estado
+        })
+    return output_file, escritor.linhas_escritas
+
+def converter_mexc_para_koinly(input_file: str, output_file: str = "mexc_koinly.csv",
+                               streaming: bool = False, tamanho_bloco: int = TAMANHO_BLOCO_PADRAO,
+                               usar_cache: bool = False, diretorio_cache: str = DIRETORIO_CACHE_PADRAO,
+                               incremental: bool = False, arquivo_delta: Optional[str] = None,
+                               comprimir: Optional[bool] = None, processos: Optional[int] = 1,
+                               instrumentacao: Optional[Instrumentacao] = None) -> Instrumentacao:
+    """
+    Converte um arquivo Excel do MEXC para o formato CSV do Koinly.
+    
+    Args:
+        input_file (str): Caminho do arquivo Excel de entrada
+        output_file (str): Caminho do arquivo CSV de saída
+        streaming (bool): Lê e converte o arquivo em blocos, com memória constante
+        tamanho_bloco (int): Número de linhas por bloco no modo streaming
+        usar_cache (bool): Reaproveita a leitura de execuções anteriores (ignorado no modo streaming)
+        diretorio_cache (str): Pasta do cache de leitura
+        incremental (bool): Converte só as transações a partir do último
+            timestamp do checkpoint salvo ao lado de output_file e as escreve
+            no final dele (ver _converter_incremental)
+        arquivo_delta (str): No modo incremental, grava as novas linhas neste
+            CSV separado em vez de acrescentá-las a output_file
+        comprimir (bool): Grava a saída com gzip (padrão: output_file terminado em .gz)
+        processos (int): Converte partições do extrato em paralelo neste número
+            de processos (None: número de CPUs; 1: conversão serial), com a
+            mesma saída da conversão serial (ver converter_em_particoes)
+        instrumentacao (Instrumentacao): Onde acumular tempos e contadores (opcional)
         
-        # Processar depósitos
-        depositos = df[df['Tipo de transação'] == 'Depositar']
-        print(f"\nNúmero de depósitos: {len(depositos)}")
-        for _, deposito in depositos.iterrows():
-            linha_koinly = {
-                'Date': f"{deposito['Data de criação(UTC+-3)']} UTC",
-                'Sent Amount': '',
-                'Sent Currency': '',
-                'Received Amount': str(abs(parse_float_value(deposito['Quantidade']))),
-                'Received Currency': deposito['Cripto'],
-                'Fee Amount': '',
-                'Fee Currency': '',
-                'Net Worth Amount': '',
-                'Net Worth Currency': '',
-                'Label': 'Deposit',
-                'Description': f"Depósito de {deposito['Cripto']}",
-                'TxHash': ''
-            }
-            linhas_koinly.append(linha_koinly)
-            
-        # Processar airdrops
-        airdrops = df[df['Tipo de transação'] == 'Airdrop']
-        print(f"\nNúmero de airdrops: {len(airdrops)}")
-        for _, airdrop in airdrops.iterrows():
-            linha_koinly = {
-                'Date': f"{airdrop['Data de criação(UTC+-3)']} UTC",
-                'Sent Amount': '',
-                'Sent Currency': '',
-                'Received Amount': str(abs(parse_float_value(airdrop['Quantidade']))),
-                'Received Currency': airdrop['Cripto'],
-                'Fee Amount': '',
-                'Fee Currency': '',
-                'Net Worth Amount': '',
-                'Net Worth Currency': '',
-                'Label': 'Airdrop',
-                'Description': f"Airdrop de {airdrop['Cripto']}",
-                'TxHash': ''
-            }
-            linhas_koinly.append(linha_koinly)
+    Returns:
+        Instrumentacao: Tempos por estágio e contadores da conversão
+    """
+    instrumentacao = instrumentacao or Instrumentacao()
+    try:
+        if streaming and incremental:
+            raise ValueError("O modo incremental não pode ser combinado com o modo streaming")
+        if streaming and processos != 1:
+            raise ValueError("A conversão paralela não pode ser combinada com o modo streaming")
+        if streaming:
+            total = _converter_em_blocos(input_file, output_file, tamanho_bloco, instrumentacao, comprimir)
+            instrumentacao.contar("linhas_escritas", total)
+            _avisar_pernas_sem_par(instrumentacao)
+            logger.info(f"Conversão finalizada: {output_file} (linhas: {total})")
+            return instrumentacao
+
+        # Só o cabeçalho é lido aqui: arquivos desconhecidos são rejeitados antes da
+        # leitura completa (e, com o cache, antes do SHA-256 do arquivo)
+        with instrumentacao.estagio("detect"):
+            formato, planilha = detectar_formato_arquivo(input_file)
+        if formato not in FORMATOS:
+            raise ValueError(f"Formato não suportado: {formato}")
+        with instrumentacao.estagio("read"):
+            if usar_cache:
+                df, _ = ler_mexc_com_cache(input_file, diretorio_cache)
+            else:
+                df = read_mexc_file(input_file, planilha)
+        instrumentacao.contar("linhas_lidas", len(df))
             
-        # Processar trades
-        trades_df = df[df['Tipo de transação'].isin(['Negociação Spot', 'Taxas de Negociação Spot'])]
-        print(f"\nNúmero total de trades e taxas: {len(trades_df)}")
+        logger.info(f"Formato detectado: {formato}")
+        
+        # Colunas e valores únicos só interessam (e só são calculados) no modo debug
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Colunas disponíveis: %s", df.columns.tolist())
+            logger.debug("Tipos de transações únicos: %s", df[FORMATOS[formato]["COL_TIPO"]].unique())
+            logger.debug("Direções únicas: %s", df[FORMATOS[formato]["COL_DIRECAO"]].unique())
         
-        timestamps = trades_df['Data de criação(UTC+-3)'].unique()
-        print(f"\nNúmero de timestamps únicos: {len(timestamps)}")
+        # Aplicar o mapeamento de colunas
+        mapeamento = FORMATOS[formato]
         
-        for timestamp in timestamps:
-            trades = df[
-                (df['Data de criação(UTC+-3)'] == timestamp) & 
-                (df['Tipo de transação'].isin(['Negociação Spot', 'Taxas de Negociação Spot']))
-            ]
-            print(f"\nProcessando timestamp {timestamp}:")
-            print(f"Número de trades neste timestamp: {len(trades)}")
+        if incremental:
+            destino, linhas = _converter_incremental(df, mapeamento, output_file, arquivo_delta, comprimir,
+                                                     processos, instrumentacao)
+        else:
+            # Escrever depósitos, airdrops e trades, nessa ordem, à medida que os trades são pareados
+            destino = output_file
+            with EscritorKoinly(output_file, comprimir=comprimir, instrumentacao=instrumentacao) as escritor:
+                _escrever_conversao(escritor, df, mapeamento, processos, instrumentacao)
+            linhas = escritor.linhas_escritas
+        instrumentacao.contar("linhas_escritas", linhas)
             
-            if len(trades) > 0:
-                novas_linhas = processar_trades_relacionados(trades, timestamp)
-                print(f"Número de linhas geradas: {len(novas_linhas)}")
-                linhas_koinly.extend(novas_linhas)
+        _avisar_pernas_sem_par(instrumentacao)
+        logger.info(f"Conversão finalizada: {destino} (linhas: {linhas})")
+        return instrumentacao
+        
+    except Exception as e:
+        logger.error(f"Erro durante a conversão: {str(e)}")
+        traceback.print_exc()
+        raise
+
+def listar_arquivos_lote(entrada: str) -> List[str]:
+    """
+    Lista os extratos de um lote: todos os .xlsx/.xls/.csv de uma pasta,
+    ou os arquivos que casam com um padrão glob (ex.: 'extratos/*.xlsx').
+    """
+    if os.path.isdir(entrada):
+        arquivos = [
+            os.path.join(entrada, nome) for nome in os.listdir(entrada)
+            if os.path.splitext(nome)[1].lower() in (".xlsx", ".xls", ".csv")
+        ]
+    else:
+        arquivos = glob.glob(entrada)
+    return sorted(arquivos)
+
+def _converter_arquivo_do_lote(input_file: str) -> pd.DataFrame:
+    """
+    Converte um arquivo do lote (executado em um processo do pool).
+    Retorna as linhas Koinly ordenadas por Date, com a coluna auxiliar
+    '_ocorrencia' numerando linhas idênticas dentro do mesmo arquivo.
+    """
+    formato, planilha = detectar_formato_arquivo(input_file)
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato não suportado em {input_file}: {formato}")
+    df = read_mexc_file(input_file, planilha)
+    depositos, airdrops, trades = converter_dataframe(df, FORMATOS[formato])
+    df_koinly = pd.concat([depositos, airdrops, trades_para_dataframe(trades)], ignore_index=True)
+    df_koinly = df_koinly.fillna('').astype(str).sort_values('Date', kind='stable')
+    df_koinly['_ocorrencia'] = df_koinly.groupby(COLUNAS_KOINLY, sort=False).cumcount()
+    return df_koinly
+
+def converter_lote(entrada: str, output_file: str = "mexc_koinly.csv", max_workers: Optional[int] = None,
+                   comprimir: Optional[bool] = None, instrumentacao: Optional[Instrumentacao] = None) -> int:
+    """
+    Converte vários extratos (subcontas, períodos diferentes) em um único CSV do Koinly.
+    Cada arquivo é convertido em um processo do pool; os resultados, já
+    ordenados por Date, são intercalados (k-way merge) e linhas repetidas entre
+    arquivos com períodos sobrepostos são descartadas. Linhas idênticas dentro
+    de um mesmo arquivo são mantidas.
+    
+    Args:
+        entrada (str): Pasta com os extratos ou padrão glob
+        output_file (str): Caminho do CSV de saída
+        max_workers (int): Número de processos (padrão: número de CPUs)
+        comprimir (bool): Grava a saída com gzip (padrão: output_file terminado em .gz)
+        instrumentacao (Instrumentacao): Recebe os tempos de conversão e de merge
+        
+    Returns:
+        int: Número de linhas escritas
+    """
+    instrumentacao = instrumentacao or Instrumentacao()
+    arquivos = listar_arquivos_lote(entrada)
+    if not arquivos:
+        raise ValueError(f"Nenhum extrato encontrado em: {entrada}")
+    logger.info(f"Convertendo {len(arquivos)} arquivos em lote")
+    instrumentacao.contar("arquivos", len(arquivos))
+
+    # Importado aqui para não pesar na inicialização dos outros modos
+    from concurrent.futures import ProcessPoolExecutor
+
+    with instrumentacao.estagio("convert"):
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            resultados = list(executor.map(_converter_arquivo_do_lote, arquivos))
+
+    colunas = COLUNAS_KOINLY + ['_ocorrencia']
+    fontes = [resultado[colunas].itertuples(index=False, name=None) for resultado in resultados]
+
+    def sem_repetidas(linhas):
+        # As linhas chegam ordenadas por Date, então só é preciso lembrar das da data atual
+        data_atual = None
+        vistas = set()
+        for linha in linhas:
+            if linha[0] != data_atual:
+                data_atual = linha[0]
+                vistas.clear()
+            if linha not in vistas:
+                vistas.add(linha)
+                yield linha[:-1]
+
+    with EscritorKoinly(output_file, comprimir=comprimir, instrumentacao=instrumentacao) as escritor:
+        escritor.escrever_linhas(sem_repetidas(heapq.merge(*fontes, key=lambda linha: linha[0])))
+    total = escritor.linhas_escritas
+
+    instrumentacao.contar("linhas_escritas", total)
+    logger.info(f"Conversão em lote finalizada: {output_file} (linhas: {total})")
+    return total
+
+def compressao_arquivo(caminho: str) -> Optional[str]:
+    """Retorna 'gzip' se o arquivo começa com a assinatura do gzip (qualquer que seja a extensão), senão None."""
+    with open(caminho, 'rb') as f:
+        return 'gzip' if f.read(2) == b'\x1f\x8b' else None
+
+# Data de uma linha do CSV do Koinly, como gravada por datas_para_koinly
+_DATA_KOINLY = r"\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2} UTC"
+
+def segundos_koinly(datas: pd.Series) -> np.ndarray:
+    """
+    Converte datas no formato do Koinly ('YYYY-MM-DD HH:MM:SS UTC') em
+    segundos desde 1970 (int64) pelos 19 primeiros bytes do texto, sem o
+    caminho lento de pd.to_datetime com o sufixo ' UTC'. Datas vazias viram
+    o menor int64 (NaT), assim como 'Invalid Date' (gravada por
+    datas_para_koinly para datas ilegíveis) e qualquer texto fora do
+    formato: nesse caso cada data distinta é validada e convertida uma vez.
+    """
+    texto = datas.fillna('').to_numpy(dtype=object)
+    try:
+        return texto.astype('S19').astype('datetime64[s]').view(np.int64)
+    except ValueError:
+        pass
+    codigos, unicos = pd.factorize(texto)
+    unicos = pd.Series(np.asarray(unicos, dtype=object), dtype=object)
+    validas = unicos.str.fullmatch(_DATA_KOINLY).fillna(False).astype(bool)
+    convertidas = pd.to_datetime(unicos.where(validas).str[:19], format="%Y-%m-%d %H:%M:%S", errors='coerce')
+    return convertidas.to_numpy(dtype='datetime64[s]').view(np.int64)[codigos]
+
+def ler_trecho_koinly(caminho: str, inicio: int = 0, fim: Optional[int] = None) -> pd.DataFrame:
+    """
+    Lê as colunas de COLUNAS_CONCILIACAO de um CSV do Koinly, compactado com
+    gzip ou não, tudo como texto: as quantidades seguem pelo caminho exato
+    (sem float) e só o campo vazio é ausente, para que moedas como "NA" ou
+    "NULL" não se percam. Com inicio (e fim), lê só as linhas entre essas
+    posições em bytes do arquivo, que devem ser um início de linha (com
+    gzip, de membro) e vêm sem cabeçalho.
+    """
+    opcoes = dict(usecols=COLUNAS_CONCILIACAO, encoding='utf-8-sig', dtype=str, keep_default_na=False, na_values=[''])
+    if inicio == 0 and fim is None:
+        return pd.read_csv(caminho, compression=compressao_arquivo(caminho), **opcoes)
+    with open(caminho, 'rb') as f:
+        f.seek(inicio)
+        dados = f.read() if fim is None else f.read(fim - inicio)
+    if compressao_arquivo(caminho) == 'gzip':
+        dados = gzip.decompress(dados)
+    if inicio > 0:
+        dados = (",".join(COLUNAS_KOINLY) + "\n").encode('utf-8') + dados
+    return pd.read_csv(io.BytesIO(dados), **opcoes)
+
+def _estado_conciliacao(df: pd.DataFrame, anterior: Optional[dict] = None) -> dict:
+    """
+    Concilia as linhas df de um CSV do Koinly (de ler_trecho_koinly)
+    continuando o estado anterior, das linhas que vêm antes delas no mesmo
+    CSV. O saldo de cada moeda (recebido menos enviado e taxas) é calculado
+    ao fim de cada timestamp com somas acumuladas de inteiros escalados:
+    exatas e vetorizadas, em uma ordenação e uma passada. Os saldos
+    anteriores entram como linhas de abertura antes de todos os timestamps.
+    
+    Returns:
+        dict: Estado serializável em JSON (linhas, saldos, saldos negativos,
+            taxas divergentes e trades incompletos), que conciliar_koinly
+            transforma no relatório e o modo incremental guarda no checkpoint
+    """
+    anterior = anterior or {
+        "linhas": 0, "saldos": {}, "saldos_negativos": {}, "taxas_divergentes": 0,
+        "por_motivo": {}, "exemplos": [], "trades_incompletos": 0
+    }
+    abertura = len(anterior["saldos"])
+    if abertura:
+        df = pd.concat([
+            pd.DataFrame({'Received Amount': list(anterior["saldos"].values()),
+                          'Received Currency': list(anterior["saldos"])}, columns=COLUNAS_CONCILIACAO, dtype=object),
+            df
+        ], ignore_index=True)
+    total_linhas = len(df)
+
+    # Cada linha vira até três movimentos: recebido (+), enviado (-) e taxa (-)
+    codigos_moeda, categorias = pd.factorize(np.concatenate([
+        df[coluna].to_numpy(dtype=object) for coluna in ('Received Currency', 'Sent Currency', 'Fee Currency')
+    ]))
+    codigos_moeda = codigos_moeda.astype(np.int64)
+    nomes = np.asarray(categorias, dtype=object).tolist()
+    mantissas, casas = parse_quantidades_exatas(pd.concat(
+        [df[coluna] for coluna in ('Received Amount', 'Sent Amount', 'Fee Amount')], ignore_index=True
+    ))
+    # Na escala de cada moeda, quantias da mesma moeda são comparáveis entre si
+    quantias, escalas = escalar_por_moeda(
+        mantissas, casas, pd.Series(pd.Categorical.from_codes(codigos_moeda, categorias))
+    )
+    recebido, enviado, taxa = quantias.reshape(3, total_linhas)
+    movimentos = (codigos_moeda >= 0) & np.asarray(quantias != 0, dtype=bool)
+    moedas = codigos_moeda[movimentos]
+    valores = quantias[movimentos] * np.repeat(np.array([1, -1, -1], dtype=np.int64), total_linhas)[movimentos]
+    escalas = escalas[movimentos]
+    escala_por_moeda = np.zeros(len(nomes), dtype=np.int64)
+    escala_por_moeda[moedas] = escalas
+
+    # Somas por (moeda, timestamp), em ordem de data dentro de cada moeda, e saldos acumulados.
+    # Datas inválidas vêm logo depois da abertura, no mesmo lugar que ocupam sem ela
+    segundos = segundos_koinly(df['Date'])
+    segundos[abertura:] = np.maximum(segundos[abertura:], np.iinfo(np.int64).min + 1)
+    codigos_data, unicos = pd.factorize(segundos, sort=True)
+    chaves = moedas.astype(np.int64) * max(len(unicos), 1) + np.tile(codigos_data, 3)[movimentos]
+    ordem = np.argsort(chaves, kind='stable')
+    chaves = chaves[ordem]
+    inicios = np.flatnonzero(np.r_[True, chaves[1:] != chaves[:-1]]) if len(chaves) else np.array([], dtype=np.int64)
+    somas = np.add.reduceat(valores[ordem], inicios) if len(inicios) else valores[:0]
+    moeda_grupo = chaves[inicios] // max(len(unicos), 1)
+    # O grupo de abertura (código de data 0) não é um timestamp do CSV
+    de_abertura = (chaves[inicios] % max(len(unicos), 1) == 0) & bool(abertura)
+    # Uma linha do CSV de cada grupo, de onde vem o texto da data
+    linha_grupo = np.flatnonzero(movimentos)[ordem][inicios] % max(total_linhas, 1)
+    datas = df['Date'].fillna('').to_numpy(dtype=object)
+    acumulado = np.cumsum(somas)
+    primeiros = np.flatnonzero(np.r_[True, moeda_grupo[1:] != moeda_grupo[:-1]]) if len(somas) else inicios
+    tamanhos = np.diff(np.r_[primeiros, len(somas)])
+    saldos = acumulado - np.repeat(acumulado[primeiros] - somas[primeiros], tamanhos)
+
+    saldos_finais = dict(anterior["saldos"])
+    saldos_finais.update(
+        (nomes[moeda], formatar_escalado(int(saldo), int(escala_por_moeda[moeda])) or '0')
+        for moeda, saldo in zip(moeda_grupo[primeiros].tolist(), saldos[primeiros + tamanhos - 1].tolist())
+    )
+    saldos_negativos = {moeda: dict(detalhe) for moeda, detalhe in anterior["saldos_negativos"].items()}
+    negativos = np.flatnonzero(np.asarray(saldos < 0, dtype=bool) & ~de_abertura)
+    if len(negativos):
+        tabela = pd.DataFrame({
+            'moeda': moeda_grupo[negativos], 'posicao': negativos, 'saldo': saldos[negativos].astype(float)
+        })
+        grupos = tabela.groupby('moeda')
+        menores = tabela['posicao'].to_numpy()[grupos['saldo'].idxmin().to_numpy()]
+        for moeda, primeira, menor, quantidade in zip(grupos['posicao'].min().index.tolist(),
+                                                      grupos['posicao'].min().tolist(),
+                                                      menores.tolist(), grupos.size().tolist()):
+            menor_saldo = formatar_escalado(int(saldos[menor]), int(escala_por_moeda[moeda]))
+            detalhe = saldos_negativos.get(nomes[moeda])
+            if detalhe is None:
+                saldos_negativos[nomes[moeda]] = {
+                    "primeira_data": datas[linha_grupo[primeira]],
+                    "menor_saldo": menor_saldo,
+                    "data_menor_saldo": datas[linha_grupo[menor]],
+                    "timestamps_negativos": quantidade
+                }
+                continue
+            detalhe["timestamps_negativos"] += quantidade
+            if Decimal(menor_saldo) < Decimal(detalhe["menor_saldo"]):
+                detalhe.update(menor_saldo=menor_saldo, data_menor_saldo=datas[linha_grupo[menor]])
+
+    # Taxas divergentes e trades de um lado só, linha a linha e vetorizados
+    moeda_recebida, moeda_enviada, moeda_taxa = codigos_moeda.reshape(3, total_linhas)
+    trade = (df['Label'] == 'Trade').to_numpy(dtype=bool)
+    com_taxa = moeda_taxa >= 0
+    motivos = {
+        "taxa_sem_moeda": (taxa != 0) & ~com_taxa,
+        "moeda_sem_taxa": (taxa == 0) & com_taxa,
+        "taxa_fora_do_par": trade & com_taxa & (moeda_taxa != moeda_recebida) & (moeda_taxa != moeda_enviada),
+        "taxa_maior_que_valor": (taxa > 0) & com_taxa & (
+            ((moeda_taxa == moeda_recebida) & (taxa >= recebido))
+            | ((moeda_taxa == moeda_enviada) & (taxa >= enviado))
+        )
+    }
+    motivos = {nome: np.asarray(mascara, dtype=bool) for nome, mascara in motivos.items()}
+    divergentes = np.zeros(total_linhas, dtype=bool)
+    texto_taxa = df['Fee Amount'].fillna('').to_numpy(dtype=object)
+    for mascara in motivos.values():
+        divergentes |= mascara
+    exemplos = list(anterior["exemplos"])
+    for i in np.flatnonzero(divergentes)[:LIMITE_TAXAS_DIVERGENTES_RELATORIO - len(exemplos)].tolist():
+        exemplos.append({
+            "linha": anterior["linhas"] + i - abertura + 2,
+            "date": datas[i],
+            "motivos": [nome for nome, mascara in motivos.items() if mascara[i]],
+            "sent_currency": nomes[moeda_enviada[i]] if moeda_enviada[i] >= 0 else '',
+            "received_currency": nomes[moeda_recebida[i]] if moeda_recebida[i] >= 0 else '',
+            "fee_amount": texto_taxa[i],
+            "fee_currency": nomes[moeda_taxa[i]] if com_taxa[i] else ''
+        })
+
+    return {
+        "linhas": anterior["linhas"] + total_linhas - abertura,
+        "saldos": saldos_finais,
+        "saldos_negativos": saldos_negativos,
+        "taxas_divergentes": anterior["taxas_divergentes"] + int(divergentes.sum()),
+        "por_motivo": {nome: anterior["por_motivo"].get(nome, 0) + int(mascara.sum()) for nome, mascara in motivos.items()},
+        "exemplos": exemplos,
+        "trades_incompletos": anterior["trades_incompletos"]
+                              + int((trade & ((moeda_recebida < 0) | (moeda_enviada < 0))).sum())
+    }
+
+def conciliar_koinly(caminho: str, instrumentacao: Optional[Instrumentacao] = None, incremental: bool = False) -> dict:
+    """
+    Concilia um CSV do Koinly já gravado (ver _estado_conciliacao). O
+    relatório aponta saldos negativos, pernas de trade que ficaram sem par
+    na conversão e taxas divergentes (valor sem moeda, moeda sem valor,
+    moeda fora do par do trade ou taxa que consome todo o valor da mesma
+    moeda na linha).
+    
+    Um extrato que não começa na abertura da conta não traz os saldos
+    anteriores: nesse caso o saldo negativo pode ser só histórico faltando,
+    e a primeira data negativa de cada moeda indica onde procurar.
+    
+    Args:
+        caminho (str): CSV do Koinly, compactado com gzip ou não
+        instrumentacao (Instrumentacao): Recebe o tempo no estágio "reconcile" e
+            fornece as pernas sem par da conversão que gerou o CSV
+        incremental (bool): Se o CSV foi gravado pelo modo incremental, parte
+            do estado da conciliação guardado no checkpoint e lê só as linhas
+            do último timestamp (o CSV inteiro se o checkpoint não servir)
+        
+    Returns:
+        dict: Relatório serializável em JSON; "ok" é False se algo foi apontado
+    """
+    instrumentacao = instrumentacao or Instrumentacao()
+    with instrumentacao.estagio("reconcile"):
+        estado = None
+        checkpoint = carregar_checkpoint(caminho_checkpoint(caminho)) if incremental else None
+        if checkpoint is not None and checkpoint["conciliacao"] is not None and not checkpoint.get("escrevendo"):
+            posicoes = localizar_fronteira(caminho, checkpoint)
+            if posicoes is not None:
+                estado = _estado_conciliacao(ler_trecho_koinly(caminho, *posicoes), checkpoint["conciliacao"])
+        if estado is None:
+            estado = _estado_conciliacao(ler_trecho_koinly(caminho))
+
+        sem_par_por_moeda: Dict[str, Dict[str, str]] = {}
+        for (moeda, lado), total in sorted(instrumentacao.totais_sem_par.items()):
+            sem_par_por_moeda.setdefault(moeda, {})[lado] = str(total)
+        total_sem_par = instrumentacao.contadores["pernas_sem_par"]
+
+    return {
+        "versao": VERSAO,
+        "arquivo": caminho,
+        "linhas": estado["linhas"],
+        "ok": not estado["saldos_negativos"] and not total_sem_par and not estado["trades_incompletos"]
+              and not estado["taxas_divergentes"],
+        "saldos_finais": dict(sorted(estado["saldos"].items())),
+        "saldos_negativos": dict(sorted(estado["saldos_negativos"].items())),
+        "pernas_sem_par": {
+            "total": total_sem_par,
+            "por_moeda": sem_par_por_moeda,
+            "trades_incompletos": estado["trades_incompletos"]
+        },
+        "taxas_divergentes": {
+            "total": estado["taxas_divergentes"],
+            "por_motivo": estado["por_motivo"],
+            "exemplos": estado["exemplos"]
+        }
+    }
+
+def salvar_conciliacao(relatorio: dict, caminho: str):
+    """Grava o relatório de conciliar_koinly em JSON e resume no log o que foi apontado."""
+    with open(caminho, 'w', encoding='utf-8') as f:
+        json.dump(relatorio, f, ensure_ascii=False, indent=2)
+    negativos = relatorio["saldos_negativos"]
+    if negativos:
+        moeda, detalhe = min(negativos.items(), key=lambda item: item[1]["primeira_data"])
+        logger.warning(
+            f"Saldo negativo em {len(negativos)} moedas (a primeira: {moeda} em {detalhe['primeira_data']})"
+        )
+    sem_par = relatorio["pernas_sem_par"]
+    if sem_par["trades_incompletos"]:
+        logger.warning(f"{sem_par['trades_incompletos']} linhas Trade sem moeda enviada ou recebida")
+    divergentes = relatorio["taxas_divergentes"]
+    if divergentes["total"]:
+        motivos = ", ".join(f"{nome}: {total}" for nome, total in divergentes["por_motivo"].items() if total)
+        logger.warning(f"{divergentes['total']} linhas com taxa divergente ({motivos})")
+    estado = "sem divergências" if relatorio["ok"] else "com divergências"
+    logger.info(f"Conciliação {estado} gravada em {caminho}")
+
+class TabelaPrecos:
+    """
+    Índice de preços por moeda, em memória, para preencher o Net Worth das
+    linhas do Koinly sem acesso à rede. Todas as moedas ficam em um único
+    vetor ordenado de chaves int64 (código da moeda * 2**34 + segundos UTC),
+    então a busca as-of (o último preço até o instante da linha) de milhões
+    de linhas é um único np.searchsorted.
+    
+    Args:
+        moedas (list): Nome da moeda de cada código
+        chaves (np.ndarray): Chaves int64 em ordem crescente, sem repetições
+        precos (np.ndarray): Preço de cada chave (float64), na moeda de referência
+    """
+
+    def __init__(self, moedas: List[str], chaves: np.ndarray, precos: np.ndarray):
+        self.moedas = list(moedas)
+        self.chaves = chaves
+        self.precos = precos
+
+    @classmethod
+    def de_dataframe(cls, moedas: pd.Series, segundos: np.ndarray, precos: np.ndarray) -> "TabelaPrecos":
+        """
+        Monta o índice a partir de colunas já lidas: moeda, instante (segundos
+        UTC; o menor int64 marca datas inválidas) e preço. Linhas sem moeda,
+        data ou preço são descartadas; se uma moeda tiver dois preços no mesmo
+        segundo, fica o último.
+        """
+        codigos, unicos = pd.factorize(moedas)
+        normalizadas = pd.Index(np.asarray(unicos, dtype=object)).astype(str).str.strip().str.upper()
+        remapeados, nomes = pd.factorize(normalizadas)
+        codigos = np.where(codigos >= 0, remapeados[codigos], -1)
+        validos = (
+            (codigos >= 0) & (segundos >= 0) & (segundos < _ESPACO_TEMPO_PRECOS)
+            & np.isfinite(precos) & (precos >= 0)
+        )
+        descartadas = int((~validos).sum())
+        if descartadas:
+            logger.warning(f"{descartadas} linhas da tabela de preços sem moeda, data ou preço válido foram ignoradas")
+        chaves = codigos[validos].astype(np.int64) * _ESPACO_TEMPO_PRECOS + segundos[validos]
+        ordem = np.argsort(chaves, kind='stable')
+        chaves, precos = chaves[ordem], precos[validos][ordem]
+        ultimos = np.r_[chaves[1:] != chaves[:-1], True] if len(chaves) else np.array([], dtype=bool)
+        return cls(np.asarray(nomes, dtype=object).tolist(), chaves[ultimos], precos[ultimos])
+
+    def cotar(self, moedas: pd.Series, segundos: np.ndarray, idade_maxima: int = IDADE_MAXIMA_PRECO_S) -> np.ndarray:
+        """
+        Retorna, para cada (moeda, instante), o último preço da tabela até o
+        instante (as-of), ou NaN se a moeda não está na tabela ou se o preço
+        mais recente tem mais de idade_maxima segundos.
         
-        print(f"\nNúmero total de linhas a serem escritas: {len(linhas_koinly)}")
+        Args:
+            moedas (pd.Series): Moeda de cada linha (de preferência category)
+            segundos (np.ndarray): Instante de cada linha, em segundos UTC (ver segundos_koinly)
+            idade_maxima (int): Idade máxima aceita para um preço, em segundos
+            
+        Returns:
+            np.ndarray: Preços (float64), na moeda de referência da tabela
+        """
+        codigos_linha, unicos = pd.factorize(moedas)
+        posicao_moeda = {moeda: codigo for codigo, moeda in enumerate(self.moedas)}
+        codigos = np.array(
+            [posicao_moeda.get(str(moeda).strip().upper(), -1) for moeda in np.asarray(unicos, dtype=object)] + [-1],
+            dtype=np.int64
+        )[codigos_linha]
+        chaves = codigos * _ESPACO_TEMPO_PRECOS + np.clip(segundos, 0, _ESPACO_TEMPO_PRECOS - 1)
+        posicoes = np.searchsorted(self.chaves, chaves, side='right') - 1
+        encontradas = self.chaves[np.maximum(posicoes, 0)] if len(self.chaves) else np.zeros(len(chaves), dtype=np.int64)
+        validos = (
+            (codigos >= 0) & (segundos >= 0) & (posicoes >= 0)
+            & (encontradas // _ESPACO_TEMPO_PRECOS == codigos) & (chaves - encontradas <= idade_maxima)
+        )
+        precos = np.full(len(chaves), np.nan)
+        precos[validos] = self.precos[posicoes[validos]]
+        return precos
+
+def colunas_tabela_precos(colunas) -> Dict[str, str]:
+    """
+    Encontra as colunas de moeda, data e preço de uma tabela de preços pelos
+    nomes aceitos em COLUNAS_PRECOS (sem diferenciar maiúsculas). Em tabelas
+    OHLC, o preço usado é o de fechamento (close).
+    """
+    por_nome = {str(coluna).strip().lower(): coluna for coluna in colunas}
+    encontradas = {}
+    for chave, nomes in COLUNAS_PRECOS.items():
+        coluna = next((por_nome[nome] for nome in nomes if nome in por_nome), None)
+        if coluna is None:
+            raise ValueError(f"Tabela de preços sem coluna de {chave} (nomes aceitos: {', '.join(nomes)})")
+        encontradas[chave] = coluna
+    return encontradas
+
+def segundos_utc(serie: pd.Series) -> np.ndarray:
+    """
+    Converte a coluna de datas de uma tabela de preços em segundos UTC
+    (int64): números são epoch em segundos, milissegundos, microssegundos ou
+    nanossegundos (pela ordem de grandeza) e textos são ISO 8601, em UTC
+    quando não trazem fuso. Datas inválidas viram o menor int64.
+    """
+    invalido = np.iinfo(np.int64).min
+    if pd.api.types.is_numeric_dtype(serie):
+        numeros = serie.to_numpy(dtype=float)
+        maior = np.nanmax(np.abs(numeros)) if np.isfinite(numeros).any() else 0.0
+        divisor = next((10.0 ** casas for casas, limite in ((0, 1e11), (3, 1e14), (6, 1e17)) if maior < limite), 1e9)
+        with np.errstate(invalid='ignore'):
+            return np.where(np.isfinite(numeros), np.floor(numeros / divisor), invalido).astype(np.int64)
+    datas = pd.to_datetime(serie, utc=True, format='ISO8601', errors='coerce')
+    segundos = np.asarray(datas.dt.tz_convert(None), dtype='datetime64[s]').view(np.int64)
+    return np.where(datas.notna().to_numpy(), segundos, invalido)
+
+def _ler_tabela_precos(caminho: str) -> pd.DataFrame:
+    """
+    Lê as colunas de moeda, data e preço de uma tabela de preços: CSV
+    (compactado com gzip ou não, separador e decimal descobertos como nos
+    extratos) ou colunar (.parquet e .feather, que exigem o pacote opcional
+    pyarrow). Retorna um DataFrame com as colunas 'moeda', 'data' e 'preco'.
+    """
+    ext = os.path.splitext(caminho[:-3] if caminho.endswith('.gz') else caminho)[1].lower()
+    if ext in (".parquet", ".feather"):
+        if find_spec("pyarrow") is None:
+            raise ValueError(f"Tabelas de preços {ext} exigem o pacote opcional pyarrow (pip install pyarrow)")
+        df = pd.read_parquet(caminho) if ext == ".parquet" else pd.read_feather(caminho)
+        colunas = colunas_tabela_precos(df.columns)
+        df = df[[colunas["moeda"], colunas["data"], colunas["preco"]]]
+    else:
+        compressao = compressao_arquivo(caminho)
+        with (gzip.open if compressao else open)(caminho, 'rt', encoding='utf-8-sig', newline='') as f:
+            amostra = f.read(TAMANHO_AMOSTRA_CSV)
+        delimitador, decimal = farejar_csv(amostra)
+        cabecalho = next(csv.reader(amostra.splitlines()[:1], delimiter=delimitador), [])
+        colunas = colunas_tabela_precos(cabecalho)
+        df = pd.read_csv(
+            caminho, sep=delimitador, decimal=decimal, encoding='utf-8-sig', compression=compressao,
+            usecols=[colunas["moeda"], colunas["data"], colunas["preco"]],
+            dtype={colunas["moeda"]: 'category', colunas["preco"]: float}
+        )
+    return df.rename(columns={colunas["moeda"]: "moeda", colunas["data"]: "data", colunas["preco"]: "preco"})
+
+def carregar_precos(caminho: str, diretorio_cache: str = DIRETORIO_CACHE_PADRAO, usar_cache: bool = True,
+                    tamanho_maximo: int = TAMANHO_MAXIMO_CACHE) -> TabelaPrecos:
+    """
+    Carrega uma tabela de preços local (uma linha por moeda e instante, com
+    o preço na moeda de referência) e monta o índice de TabelaPrecos. O
+    índice montado fica no cache de leitura, endereçado pelo SHA-256 da
+    tabela e pela VERSAO, e é reaproveitado nas próximas execuções.
+    
+    Args:
+        caminho (str): Tabela de preços (.csv, .csv.gz, .parquet ou .feather)
+        diretorio_cache (str): Pasta do cache
+        usar_cache (bool): Reaproveita (e grava) o índice no cache
+        tamanho_maximo (int): Tamanho máximo do cache em bytes
         
-        # Convert to DataFrame for better handling
-        df_koinly = pd.DataFrame(linhas_koinly)
+    Returns:
+        TabelaPrecos: Índice pronto para cotar
+    """
+    entrada_cache = None
+    if usar_cache:
+        entrada_cache = os.path.join(diretorio_cache, f"{VERSAO}-precos-{hash_arquivo(caminho)}.pkl")
+    if entrada_cache is not None and os.path.exists(entrada_cache):
+        try:
+            with open(entrada_cache, 'rb') as f:
+                entrada = pickle.load(f)
+            os.utime(entrada_cache)
+            logger.info(f"Índice de preços de {caminho} carregado do cache")
+            return TabelaPrecos(entrada["moedas"], entrada["chaves"], entrada["precos"])
+        except Exception as e:
+            logger.warning(f"Entrada de cache inválida, lendo a tabela de preços novamente: {str(e)}")
+            os.remove(entrada_cache)
+
+    df = _ler_tabela_precos(caminho)
+    tabela = TabelaPrecos.de_dataframe(df["moeda"], segundos_utc(df["data"]), df["preco"].to_numpy(dtype=float))
+    logger.info(f"Tabela de preços {caminho}: {len(tabela.chaves)} preços de {len(tabela.moedas)} moedas")
+    if entrada_cache is not None:
+        os.makedirs(diretorio_cache, exist_ok=True)
+        _gravar_no_cache(
+            entrada_cache, {"moedas": tabela.moedas, "chaves": tabela.chaves, "precos": tabela.precos},
+            diretorio_cache, tamanho_maximo
+        )
+    return tabela
+
+def _formatar_net_worth(valores: np.ndarray) -> List[str]:
+    """Formata valores na moeda de referência com até 8 casas, sem zeros à direita."""
+    return [f"{valor:.8f}".rstrip('0').rstrip('.') for valor in valores.tolist()]
+
+def preencher_net_worth(caminho: str, precos: TabelaPrecos, moeda_referencia: str = MOEDA_REFERENCIA_PADRAO,
+                        idade_maxima: int = IDADE_MAXIMA_PRECO_S, tamanho_bloco: int = TAMANHO_BLOCO_PADRAO,
+                        instrumentacao: Optional[Instrumentacao] = None) -> int:
+    """
+    Preenche Net Worth Amount e Net Worth Currency de um CSV do Koinly já
+    gravado com a tabela de preços local, sem acesso à rede, para que o
+    Koinly não precise procurar preços (lento e às vezes errado em tokens
+    pouco negociados). O valor é o da quantidade recebida ao preço as-of da
+    moeda recebida; se ela não tiver preço, vale a quantidade enviada.
+    Linhas que já têm Net Worth ou sem data válida ('Invalid Date') ficam
+    como estão. O CSV é relido e regravado
+    em blocos pelo EscritorKoinly (substituição atômica), com memória
+    limitada ao tamanho do bloco.
+    
+    Args:
+        caminho (str): CSV do Koinly, compactado com gzip ou não
+        precos (TabelaPrecos): Índice de carregar_precos
+        moeda_referencia (str): Moeda dos preços da tabela, gravada em Net Worth Currency
+        idade_maxima (int): Idade máxima aceita para um preço, em segundos
+        tamanho_bloco (int): Linhas relidas e regravadas por vez
+        instrumentacao (Instrumentacao): Recebe o tempo no estágio "prices" e o contador "net_worth"
         
-        # Ensure all columns are present
-        for col in COLUNAS_KOINLY:
-            if col not in df_koinly.columns:
-                df_koinly[col] = ''
-                
-        # Reorder columns
-        df_koinly = df_koinly[COLUNAS_KOINLY]
+    Returns:
+        int: Número de linhas que receberam Net Worth
+    """
+    instrumentacao = instrumentacao or Instrumentacao()
+    referencia = moeda_referencia.strip().upper()
+    preenchidas = total = 0
+    compressao = compressao_arquivo(caminho)
+    with instrumentacao.estagio("prices"):
+        # A regravação entra no estágio "prices", não no "write" da conversão
+        escritor = EscritorKoinly(caminho, comprimir=compressao is not None)
+        leitor = pd.read_csv(caminho, dtype=str, keep_default_na=False, encoding='utf-8-sig',
+                             compression=compressao, chunksize=tamanho_bloco)
+        # O leitor fecha antes de o escritor substituir o arquivo
+        with escritor, leitor:
+            for bloco in leitor:
+                segundos = segundos_koinly(bloco['Date'])
+                valor = np.full(len(bloco), np.nan)
+                for quantidade, moeda in (('Received Amount', 'Received Currency'), ('Sent Amount', 'Sent Currency')):
+                    pendentes = np.isnan(valor)
+                    moedas = bloco[moeda].astype('category')
+                    preco = np.where(
+                        (moedas.str.upper() == referencia).to_numpy(dtype=bool), 1.0,
+                        precos.cotar(moedas, segundos, idade_maxima)
+                    )
+                    quantias = pd.to_numeric(bloco[quantidade], errors='coerce').to_numpy(dtype=float)
+                    valor = np.where(pendentes, np.abs(quantias) * preco, valor)
+                # Sem data válida não há instante para cotar, nem mesmo a moeda de referência
+                novas = (
+                    np.isfinite(valor) & (segundos != np.iinfo(np.int64).min)
+                    & (bloco['Net Worth Amount'] == '').to_numpy(dtype=bool)
+                )
+                if novas.any():
+                    bloco.loc[novas, 'Net Worth Amount'] = _formatar_net_worth(valor[novas])
+                    bloco.loc[novas, 'Net Worth Currency'] = referencia
+                escritor.escrever_dataframe(bloco)
+                preenchidas += int(novas.sum())
+                total += len(bloco)
+    instrumentacao.contar("net_worth", preenchidas)
+    logger.info(f"Net Worth preenchido em {preenchidas} de {total} linhas ({caminho})")
+    return preenchidas
+
+class BancoTransacoes:
+    """
+    Banco local (SQLite) com as transações já convertidas de qualquer número
+    de extratos, para gerar CSVs do Koinly por período, moeda ou label sem
+    reler as planilhas.
+    
+    Cada linha guarda as colunas de COLUNAS_KOINLY e uma impressão digital
+    (hash de 64 bits da linha e da sua ocorrência dentro do extrato, como na
+    conversão em lote): importar o mesmo extrato de novo, ou extratos com
+    períodos sobrepostos, não duplica transações. Há índices por data, por
+    moeda (enviada, recebida e da taxa) e por label, e os extratos já
+    importados são reconhecidos pelo SHA-256 e nem chegam a ser convertidos.
+    
+    Args:
+        caminho (str): Arquivo do banco (criado se não existir)
+        instrumentacao (Instrumentacao): Recebe os tempos de conversão, gravação e escrita
+    """
+
+    def __init__(self, caminho: str, instrumentacao: Optional[Instrumentacao] = None):
+        # Importado aqui para não pesar na inicialização dos outros modos
+        import sqlite3
+
+        self.caminho = caminho
+        self.instrumentacao = instrumentacao or Instrumentacao()
+        self._conexao = sqlite3.connect(caminho)
+        self._conexao.execute("PRAGMA journal_mode=WAL")
+        self._conexao.execute("PRAGMA synchronous=NORMAL")
+        colunas = ", ".join(f"{coluna} TEXT NOT NULL" for coluna in COLUNAS_BANCO)
+        with self._conexao:
+            self._conexao.executescript(f"""
+                CREATE TABLE IF NOT EXISTS transacoes (
+                    id INTEGER PRIMARY KEY,
+                    impressao INTEGER NOT NULL UNIQUE,
+                    {colunas}
+                );
+                CREATE INDEX IF NOT EXISTS transacoes_data ON transacoes (date);
+                CREATE INDEX IF NOT EXISTS transacoes_enviada ON transacoes (sent_currency, date);
+                CREATE INDEX IF NOT EXISTS transacoes_recebida ON transacoes (received_currency, date);
+                CREATE INDEX IF NOT EXISTS transacoes_taxa ON transacoes (fee_currency, date);
+                CREATE INDEX IF NOT EXISTS transacoes_label ON transacoes (label, date);
+                CREATE TABLE IF NOT EXISTS extratos (
+                    hash TEXT PRIMARY KEY,
+                    caminho TEXT NOT NULL,
+                    versao TEXT NOT NULL,
+                    linhas INTEGER NOT NULL,
+                    novas INTEGER NOT NULL,
+                    importado_em TEXT NOT NULL
+                );
+            """)
+        versoes = [versao for (versao,) in self._conexao.execute("SELECT DISTINCT versao FROM extratos")]
+        if any(versao != VERSAO for versao in versoes):
+            logger.warning(
+                f"O banco {caminho} tem extratos importados pelas versões {', '.join(sorted(versoes))}; "
+                f"linhas convertidas de outra forma pela versão {VERSAO} não são reconhecidas como repetidas"
+            )
+
+    def __enter__(self) -> "BancoTransacoes":
+        return self
+
+    def __exit__(self, tipo, valor, rastreamento):
+        self.fechar()
+        return False
+
+    def fechar(self):
+        self._conexao.close()
+
+    def importar(self, arquivos: List[str], max_workers: Optional[int] = None) -> int:
+        """
+        Converte e grava no banco os extratos ainda não importados.
+        Vários extratos são convertidos em paralelo, como em converter_lote,
+        e gravados na ordem da lista.
         
-        # Write to CSV
-        df_koinly.to_csv(output_file, index=False, encoding='utf-8-sig')
+        Args:
+            arquivos (list): Extratos a importar
+            max_workers (int): Número de processos (padrão: número de CPUs)
             
-        logging.info(f"Conversão finalizada: {output_file} (linhas: {len(linhas_koinly)})")
-        print("Processo concluído!")
+        Returns:
+            int: Número de transações novas gravadas
+        """
+        hashes = {arquivo: hash_arquivo(arquivo) for arquivo in arquivos}
+        conhecidos = {
+            hash_extrato for (hash_extrato,) in
+            self._conexao.execute("SELECT hash FROM extratos WHERE versao = ?", (VERSAO,))
+        }
+        pendentes = [arquivo for arquivo in arquivos if hashes[arquivo] not in conhecidos]
+        for arquivo in arquivos:
+            if arquivo not in pendentes:
+                logger.info(f"Extrato já importado, ignorado: {arquivo}")
+        if not pendentes:
+            return 0
+
+        with self.instrumentacao.estagio("convert"):
+            if len(pendentes) == 1:
+                resultados = [_converter_arquivo_do_lote(pendentes[0])]
+            else:
+                # Importado aqui para não pesar na inicialização dos outros modos
+                from concurrent.futures import ProcessPoolExecutor
+
+                with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                    resultados = list(executor.map(_converter_arquivo_do_lote, pendentes))
+
+        total = 0
+        marcadores = ", ".join("?" * (len(COLUNAS_BANCO) + 1))
+        comando = f"INSERT OR IGNORE INTO transacoes (impressao, {', '.join(COLUNAS_BANCO)}) VALUES ({marcadores})"
+        with self.instrumentacao.estagio("store"), self._conexao:
+            for arquivo, df_koinly in zip(pendentes, resultados):
+                impressoes = pd.util.hash_pandas_object(
+                    df_koinly[COLUNAS_KOINLY + ['_ocorrencia']], index=False
+                ).to_numpy().view(np.int64)
+                antes = self._conexao.total_changes
+                self._conexao.executemany(comando, zip(
+                    impressoes.tolist(), *(df_koinly[coluna].tolist() for coluna in COLUNAS_KOINLY)
+                ))
+                novas = self._conexao.total_changes - antes
+                self._conexao.execute(
+                    "INSERT OR REPLACE INTO extratos VALUES (?, ?, ?, ?, ?, ?)",
+                    (hashes[arquivo], os.path.abspath(arquivo), VERSAO, len(df_koinly), novas,
+                     datetime.now().isoformat(timespec="seconds"))
+                )
+                logger.info(f"{arquivo}: {novas} transações novas de {len(df_koinly)}")
+                total += novas
+        self.instrumentacao.contar("transacoes_novas", total)
+        return total
+
+    def consultar(self, inicio: Optional[str] = None, fim: Optional[str] = None,
+                  moeda: Optional[str] = None, label: Optional[str] = None) -> Iterator[LinhaKoinly]:
+        """
+        Retorna as transações do banco, ordenadas por data (e, na mesma data,
+        pela ordem de importação), como LinhaKoinly.
+        As datas estão em UTC no formato do Koinly, então os limites são
+        comparados como texto.
         
-    except Exception as e:
-        logging.error(f"Erro durante a conversão: {str(e)}")
-        traceback.print_exc()
-        raise
+        Args:
+            inicio (str): Primeira data incluída, 'YYYY-MM-DD' ou 'YYYY-MM-DD HH:MM:SS' (UTC)
+            fim (str): Primeira data excluída, no mesmo formato
+            moeda (str): Só transações que enviam, recebem ou pagam taxa nesta moeda
+            label (str): Só transações com este label do Koinly (ex.: 'Deposit')
+            
+        Yields:
+            LinhaKoinly: Transações que passam pelos filtros
+        """
+        condicoes, parametros = [], []
+        if inicio is not None:
+            condicoes.append("date >= ?")
+            parametros.append(inicio)
+        if fim is not None:
+            condicoes.append("date < ?")
+            parametros.append(fim)
+        if moeda is not None:
+            condicoes.append("(sent_currency = ? OR received_currency = ? OR fee_currency = ?)")
+            parametros += [moeda] * 3
+        if label is not None:
+            condicoes.append("label = ?")
+            parametros.append(label)
+        filtro = f"WHERE {' AND '.join(condicoes)}" if condicoes else ""
+        cursor = self._conexao.execute(
+            f"SELECT {', '.join(COLUNAS_BANCO)} FROM transacoes {filtro} ORDER BY date, id", parametros
+        )
+        while True:
+            linhas = cursor.fetchmany(TAMANHO_BUFFER_ESCRITA)
+            if not linhas:
+                return
+            yield from map(LinhaKoinly._make, linhas)
+
+    def exportar(self, output_file: str, inicio: Optional[str] = None, fim: Optional[str] = None,
+                 moeda: Optional[str] = None, label: Optional[str] = None,
+                 comprimir: Optional[bool] = None) -> int:
+        """
+        Gera um CSV do Koinly com as transações do banco que passam pelos
+        filtros de consultar. Retorna o número de linhas escritas.
+        """
+        with EscritorKoinly(output_file, comprimir=comprimir, instrumentacao=self.instrumentacao) as escritor:
+            escritor.escrever_linhas(self.consultar(inicio, fim, moeda, label))
+        self.instrumentacao.contar("linhas_escritas", escritor.linhas_escritas)
+        logger.info(f"Exportação do banco finalizada: {output_file} (linhas: {escritor.linhas_escritas})")
+        return escritor.linhas_escritas
+
+def periodo_exportacao(ano: Optional[int] = None, de: Optional[str] = None,
+                       ate: Optional[str] = None) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Converte as opções de período da linha de comando nos limites de
+    BancoTransacoes.consultar: um ano fiscal inteiro, ou de/até como datas
+    'YYYY-MM-DD' (UTC) com os dois dias incluídos.
+    
+    Returns:
+        tuple: (início incluído, fim excluído), None quando não há limite
+    """
+    inicio = f"{ano:04d}-01-01" if ano is not None else None
+    fim = f"{ano + 1:04d}-01-01" if ano is not None else None
+    if de is not None:
+        inicio = max(inicio or de, datetime.strptime(de, "%Y-%m-%d").strftime("%Y-%m-%d"))
+    if ate is not None:
+        dia_seguinte = (datetime.strptime(ate, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
+        fim = min(fim or dia_seguinte, dia_seguinte)
+    return inicio, fim
+
+def main(argv: Optional[List[str]] = None):
+    """
+    Ponto de entrada da linha de comando.
+    A entrada pode ser um arquivo, uma pasta ou um padrão glob (lote).
+    """
+    parser = argparse.ArgumentParser(description="Converte extratos da MEXC para o CSV de importação do Koinly.")
+    parser.add_argument("entrada", nargs="?",
+                        help="Extrato (.xlsx/.csv), pasta ou padrão glob (padrão: mexc.xlsx)")
+    parser.add_argument("saida", nargs="?", help="CSV de saída (padrão: mexc_koinly.csv)")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Log detalhado, por timestamp e por linha gerada")
+    parser.add_argument("--streaming", action="store_true", help="Lê e converte em blocos, com memória constante")
+    parser.add_argument("--tamanho-bloco", type=int, default=TAMANHO_BLOCO_PADRAO, help="Linhas por bloco no modo streaming")
+    parser.add_argument("--cache", action="store_true", help="Reaproveita a leitura de execuções anteriores")
+    parser.add_argument("--incremental", action="store_true", help="Converte só as transações novas desde a última execução")
+    parser.add_argument("--delta", metavar="CSV", help="No modo incremental, grava as novas linhas neste CSV")
+    parser.add_argument("--processos", type=int, default=1, metavar="N",
+                        help="Converte partições do extrato em N processos (0: um por CPU)")
+    parser.add_argument("--gzip", action="store_true",
+                        help="Grava a saída compactada com gzip (acrescenta .gz ao nome; automático se a saída terminar em .gz)")
+    parser.add_argument("--profile", nargs="?", const="", metavar="JSON",
+                        help="Grava um relatório JSON com tempos por estágio e contadores (padrão: <saida>.profile.json)")
+    parser.add_argument("--cprofile", metavar="ARQUIVO", help="Grava também um dump do cProfile (ver pstats)")
+    parser.add_argument("--conciliacao", metavar="JSON",
+                        help="Relatório de conciliação de saldos (padrão: <saida>.conciliacao.json)")
+    parser.add_argument("--sem-conciliacao", action="store_true", help="Não concilia os saldos do CSV gerado")
+    banco = parser.add_argument_group("banco local", "Importa os extratos em um banco SQLite e exporta o CSV a partir dele")
+    banco.add_argument("--banco", metavar="ARQUIVO", help="Banco de transações (criado se não existir)")
+    banco.add_argument("--sem-importar", action="store_true", help="Só exporta do banco, sem ler a entrada")
+    banco.add_argument("--ano", type=int, help="Exporta só este ano (UTC)")
+    banco.add_argument("--de", metavar="AAAA-MM-DD", help="Exporta a partir desta data (UTC, incluída)")
+    banco.add_argument("--ate", metavar="AAAA-MM-DD", help="Exporta até esta data (UTC, incluída)")
+    banco.add_argument("--moeda", help="Exporta só transações que movimentam esta moeda")
+    banco.add_argument("--label", help="Exporta só transações com este label do Koinly (ex.: Deposit)")
+    precos = parser.add_argument_group("preços", "Preenche o Net Worth com uma tabela de preços local, sem acesso à rede")
+    precos.add_argument("--precos", metavar="ARQUIVO",
+                        help="Tabela de preços por moeda e data (.csv, .csv.gz, .parquet ou .feather)")
+    precos.add_argument("--moeda-referencia", default=MOEDA_REFERENCIA_PADRAO, metavar="MOEDA",
+                        help=f"Moeda dos preços da tabela (padrão: {MOEDA_REFERENCIA_PADRAO})")
+    precos.add_argument("--idade-maxima-preco", type=float, default=IDADE_MAXIMA_PRECO_S / 3600, metavar="HORAS",
+                        help="Ignora preços mais antigos que isto em relação à transação (padrão: 24)")
+    args = parser.parse_args(argv)
+    filtros = (args.sem_importar, args.ano, args.de, args.ate, args.moeda, args.label)
+    if args.banco is None and any(filtro not in (None, False) for filtro in filtros):
+        parser.error("--sem-importar, --ano, --de, --ate, --moeda e --label exigem --banco")
+    if args.sem_importar and args.saida is None:
+        # Sem importação não há entrada: um único argumento posicional é a saída
+        args.entrada, args.saida = None, args.entrada
+    args.entrada = args.entrada or "mexc.xlsx"
+    args.saida = args.saida or "mexc_koinly.csv"
+
+    # Configuração de logging
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s'
+    )
+    if args.verbose:
+        logger.setLevel(logging.DEBUG)
+    if args.gzip and not args.saida.endswith('.gz'):
+        args.saida += '.gz'
+
+    perfil = None
+    if args.cprofile:
+        import cProfile
+        perfil = cProfile.Profile()
+        perfil.enable()
+
+    instrumentacao = Instrumentacao()
+    try:
+        if args.banco is not None:
+            with BancoTransacoes(args.banco, instrumentacao) as banco_transacoes:
+                if not args.sem_importar:
+                    lote = os.path.isdir(args.entrada) or glob.has_magic(args.entrada)
+                    arquivos = listar_arquivos_lote(args.entrada) if lote else [args.entrada]
+                    if not arquivos:
+                        raise ValueError(f"Nenhum extrato encontrado em: {args.entrada}")
+                    banco_transacoes.importar(arquivos)
+                inicio, fim = periodo_exportacao(args.ano, args.de, args.ate)
+                banco_transacoes.exportar(args.saida, inicio, fim, args.moeda, args.label,
+                                          comprimir=args.gzip or None)
+        elif os.path.isdir(args.entrada) or glob.has_magic(args.entrada):
+            converter_lote(args.entrada, args.saida, comprimir=args.gzip or None, instrumentacao=instrumentacao)
+        else:
+            converter_mexc_para_koinly(
+                args.entrada, args.saida,
+                streaming=args.streaming, tamanho_bloco=args.tamanho_bloco,
+                usar_cache=args.cache, incremental=args.incremental, arquivo_delta=args.delta,
+                comprimir=args.gzip or None, processos=args.processos or None, instrumentacao=instrumentacao
+            )
+        if args.precos is not None:
+            with instrumentacao.estagio("prices"):
+                tabela_precos = carregar_precos(args.precos)
+            for caminho in dict.fromkeys(filter(None, (args.saida, args.delta))):
+                if os.path.exists(caminho):
+                    preencher_net_worth(caminho, tabela_precos, args.moeda_referencia,
+                                        int(args.idade_maxima_preco * 3600), instrumentacao=instrumentacao)
+        if not args.sem_conciliacao:
+            relatorio = conciliar_koinly(args.saida, instrumentacao, incremental=args.incremental)
+            salvar_conciliacao(relatorio, args.conciliacao or f"{args.saida}.conciliacao.json")
+    finally:
+        if perfil is not None:
+            perfil.disable()
+            perfil.dump_stats(args.cprofile)
+            logger.info(f"Dump do cProfile gravado em {args.cprofile}")
+
+    if args.profile is not None:
+        caminho = args.profile or f"{args.saida}.profile.json"
+        instrumentacao.salvar_relatorio(caminho)
+        logger.info(f"Relatório de desempenho gravado em {caminho}")
 
 if __name__ == "__main__":
-    input_file = "mexc.xlsx"
-    output_file = "mexc_koinly.csv"
-    converter_mexc_para_koinly(input_file, output_file)
+    main()
@@ -0,0 +1,361 @@
+import argparse
+import json
+import logging
+import os
+import signal
+import statistics
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing import get_context
+from typing import Dict, Optional
+from urllib.parse import parse_qs, urlparse
+
+import mexc_to_koinly as conversor
+
+logger = logging.getLogger(__name__)
+
+ENDERECO_PADRAO = "127.0.0.1"
+PORTA_PADRAO = 8765
+# Jobs aceitos e ainda não terminados (na fila ou em execução); além disso o serviço recusa com 503
+TAMANHO_FILA_PADRAO = 32
+# Jobs terminados guardados para consulta, e quantos entram nos percentis de latência
+LIMITE_JOBS_GUARDADOS = 10_000
+LIMITE_LATENCIAS = 1000
+# Tempo máximo de espera de GET /jobs/<id>?esperar=N, em segundos
+ESPERA_MAXIMA_S = 300
+
+# Opções de um job repassadas a converter_mexc_para_koinly
+OPCOES_CONVERSAO = ("streaming", "tamanho_bloco", "usar_cache", "incremental", "arquivo_delta", "comprimir")
+# Opções de um job tratadas pelo serviço, como na linha de comando
+OPCOES_SERVICO = ("precos", "moeda_referencia", "idade_maxima_preco", "conciliar")
+
+# Tabelas de preços já carregadas em cada processo do pool, por (caminho, mtime, tamanho)
+_TABELAS_PRECOS: Dict[tuple, "conversor.TabelaPrecos"] = {}
+_LIMITE_TABELAS_PRECOS = 4
+
+def _aquecer():
+    """
+    Inicializador dos processos do pool: carrega pandas, numpy e openpyxl
+    antes do primeiro job, que assim não paga as importações.
+    """
+    import numpy  # noqa: F401
+    import openpyxl  # noqa: F401
+    import pandas  # noqa: F401
+
+def _pronto(_indice: int) -> int:
+    return os.getpid()
+
+def _tabela_precos(caminho: str) -> "conversor.TabelaPrecos":
+    """Retorna a tabela de preços do processo, recarregando-a só se o arquivo mudou."""
+    estado = os.stat(caminho)
+    chave = (os.path.abspath(caminho), estado.st_mtime_ns, estado.st_size)
+    if chave not in _TABELAS_PRECOS:
+        if len(_TABELAS_PRECOS) >= _LIMITE_TABELAS_PRECOS:
+            _TABELAS_PRECOS.clear()
+        _TABELAS_PRECOS[chave] = conversor.carregar_precos(caminho)
+    return _TABELAS_PRECOS[chave]
+
+def executar_job(entrada: str, saida: str, opcoes: dict) -> dict:
+    """
+    Converte um extrato (executado em um processo do pool) pelo mesmo
+    caminho da linha de comando: converter_mexc_para_koinly, o Net Worth
+    da tabela de preços (se houver) e a conciliação de saldos.
+
+    Returns:
+        dict: Início e fim da execução (time.time()), linhas escritas,
+            tempos por estágio, contadores e o resultado da conciliação
+    """
+    inicio = time.time()
+    instrumentacao = conversor.Instrumentacao()
+    conversao = {chave: valor for chave, valor in opcoes.items() if chave in OPCOES_CONVERSAO}
+    conversor.converter_mexc_para_koinly(entrada, saida, processos=1, instrumentacao=instrumentacao, **conversao)
+    if opcoes.get("precos"):
+        with instrumentacao.estagio("prices"):
+            tabela = _tabela_precos(opcoes["precos"])
+        idade_maxima = int(opcoes.get("idade_maxima_preco", conversor.IDADE_MAXIMA_PRECO_S / 3600) * 3600)
+        conversor.preencher_net_worth(
+            saida, tabela, opcoes.get("moeda_referencia", conversor.MOEDA_REFERENCIA_PADRAO),
+            idade_maxima, instrumentacao=instrumentacao
+        )
+    conciliacao = None
+    if opcoes.get("conciliar", True):
+        relatorio = conversor.conciliar_koinly(saida, instrumentacao, incremental=opcoes.get("incremental", False))
+        conciliacao = {"ok": relatorio["ok"], "relatorio": f"{saida}.conciliacao.json"}
+        conversor.salvar_conciliacao(relatorio, conciliacao["relatorio"])
+    return {
+        "inicio": inicio,
+        "fim": time.time(),
+        "linhas": instrumentacao.contadores["linhas_escritas"],
+        "estagios_s": {nome: round(tempo, 6) for nome, tempo in instrumentacao.estagios.items()},
+        "contadores": dict(instrumentacao.contadores),
+        "conciliacao": conciliacao
+    }
+
+def _percentis(valores) -> dict:
+    if not valores:
+        return {}
+    ordenados = sorted(valores)
+    def percentil(p):
+        return round(ordenados[min(len(ordenados) - 1, int(p / 100 * len(ordenados)))], 6)
+    return {
+        "p50": percentil(50), "p95": percentil(95), "p99": percentil(99),
+        "media": round(statistics.fmean(ordenados), 6), "max": round(ordenados[-1], 6)
+    }
+
+class ServicoConversao:
+    """
+    Serviço de conversão residente. Um pool de processos já aquecidos
+    (pandas, numpy e openpyxl importados, tabelas de preços em memória)
+    executa os jobs em paralelo; a fila é limitada a tamanho_fila jobs
+    aceitos e ainda não terminados, e enviar recusa os demais em vez de
+    acumulá-los. Cada job guarda a latência de espera na fila, de execução
+    e total, resumidas em percentis por metricas(). Se um processo do pool
+    morre (falta de memória, sinal), o pool inteiro fica quebrado: os jobs
+    afetados falham e o pool é recriado para os próximos.
+
+    Args:
+        processos (int): Número de processos do pool (padrão: número de CPUs)
+        tamanho_fila (int): Máximo de jobs na fila ou em execução
+    """
+
+    def __init__(self, processos: Optional[int] = None, tamanho_fila: int = TAMANHO_FILA_PADRAO):
+        self.processos = processos or os.cpu_count() or 1
+        self.tamanho_fila = tamanho_fila
+        self._executor = self._criar_executor()
+        self._trava_executor = threading.Lock()
+        self._vagas = threading.BoundedSemaphore(tamanho_fila)
+        self._trava = threading.Lock()
+        self._jobs: Dict[str, dict] = {}
+        self._terminados: deque = deque()
+        self._eventos: Dict[str, threading.Event] = {}
+        self._latencias = {nome: deque(maxlen=LIMITE_LATENCIAS) for nome in ("espera_s", "execucao_s", "total_s")}
+        self._contadores = {"aceitos": 0, "concluidos": 0, "falhas": 0, "recusados": 0}
+        self._pools_recriados = 0
+        # Sobe todos os processos antes do primeiro job
+        list(self._executor.map(_pronto, range(self.processos)))
+
+    def _criar_executor(self) -> ProcessPoolExecutor:
+        # spawn: os processos não herdam as threads do servidor HTTP
+        return ProcessPoolExecutor(max_workers=self.processos, mp_context=get_context("spawn"),
+                                   initializer=_aquecer)
+
+    def _recriar_executor(self, quebrado: ProcessPoolExecutor):
+        """Troca o pool quebrado por um novo, uma única vez mesmo que vários jobs o vejam quebrado."""
+        with self._trava_executor:
+            if self._executor is not quebrado:
+                return
+            logger.warning("Um processo do pool morreu; recriando o pool")
+            self._executor = self._criar_executor()
+            self._pools_recriados += 1
+        quebrado.shutdown(wait=False, cancel_futures=True)
+
+    def enviar(self, entrada: str, saida: str, opcoes: Optional[dict] = None) -> Optional[str]:
+        """
+        Coloca um job na fila.
+
+        Args:
+            entrada (str): Extrato a converter (caminho no servidor)
+            saida (str): CSV do Koinly a gravar (caminho no servidor)
+            opcoes (dict): Opções de OPCOES_CONVERSAO e OPCOES_SERVICO
+
+        Returns:
+            str: Identificador do job, ou None se a fila estiver cheia
+
+        Raises:
+            BrokenProcessPool: Se o pool estava quebrado; o job é marcado
+                como falhou e o pool é recriado para os próximos envios
+        """
+        opcoes = dict(opcoes or {})
+        desconhecidas = set(opcoes) - set(OPCOES_CONVERSAO) - set(OPCOES_SERVICO)
+        if desconhecidas:
+            raise ValueError(f"Opções desconhecidas: {', '.join(sorted(desconhecidas))}")
+        if not self._vagas.acquire(blocking=False):
+            with self._trava:
+                self._contadores["recusados"] += 1
+            return None
+        identificador = uuid.uuid4().hex
+        job = {"id": identificador, "estado": "na_fila", "entrada": entrada, "saida": saida,
+               "opcoes": opcoes, "recebido_em": time.time()}
+        with self._trava:
+            self._jobs[identificador] = job
+            self._eventos[identificador] = threading.Event()
+            self._contadores["aceitos"] += 1
+        executor = self._executor
+        try:
+            futuro = executor.submit(executar_job, entrada, saida, opcoes)
+        except Exception as e:
+            # O job já foi contado como aceito: termina como falha, liberando a vaga
+            falha = Future()
+            falha.set_exception(e)
+            self._concluir(identificador, falha, executor)
+            raise
+        futuro.add_done_callback(lambda futuro: self._concluir(identificador, futuro, executor))
+        return identificador
+
+    def _concluir(self, identificador: str, futuro, executor: ProcessPoolExecutor):
+        concluido = time.time()
+        if isinstance(futuro.exception(), BrokenProcessPool):
+            self._recriar_executor(executor)
+        with self._trava:
+            job = self._jobs[identificador]
+            latencia = {"total_s": concluido - job["recebido_em"]}
+            try:
+                resultado = futuro.result()
+            except Exception as e:
+                job.update(estado="falhou", erro=f"{type(e).__name__}: {e}")
+                self._contadores["falhas"] += 1
+            else:
+                inicio, fim = resultado.pop("inicio"), resultado.pop("fim")
+                latencia["espera_s"] = max(inicio - job["recebido_em"], 0.0)
+                latencia["execucao_s"] = fim - inicio
+                for nome, valor in latencia.items():
+                    self._latencias[nome].append(valor)
+                job.update(estado="concluido", resultado=resultado)
+                self._contadores["concluidos"] += 1
+            job["latencia"] = {nome: round(valor, 6) for nome, valor in latencia.items()}
+            self._terminados.append(identificador)
+            while len(self._terminados) > LIMITE_JOBS_GUARDADOS:
+                antigo = self._terminados.popleft()
+                self._jobs.pop(antigo, None)
+                self._eventos.pop(antigo, None)
+            evento = self._eventos[identificador]
+        self._vagas.release()
+        evento.set()
+
+    def consultar(self, identificador: str, esperar: float = 0) -> Optional[dict]:
+        """Retorna uma cópia do job (None se não existir), esperando até esperar segundos que ele termine."""
+        with self._trava:
+            evento = self._eventos.get(identificador)
+        if evento is not None and esperar > 0:
+            evento.wait(min(esperar, ESPERA_MAXIMA_S))
+        with self._trava:
+            job = self._jobs.get(identificador)
+            return json.loads(json.dumps(job)) if job is not None else None
+
+    def metricas(self) -> dict:
+        """Contadores de jobs, ocupação da fila e percentis de latência dos últimos jobs concluídos."""
+        with self._trava:
+            em_andamento = self._contadores["aceitos"] - self._contadores["concluidos"] - self._contadores["falhas"]
+            return {
+                "versao": conversor.VERSAO,
+                "processos": self.processos,
+                "tamanho_fila": self.tamanho_fila,
+                "em_andamento": em_andamento,
+                "pools_recriados": self._pools_recriados,
+                "jobs": dict(self._contadores),
+                "latencia": {nome: _percentis(valores) for nome, valores in self._latencias.items()}
+            }
+
+    def encerrar(self):
+        """Espera os jobs em andamento e encerra o pool."""
+        with self._trava_executor:
+            executor = self._executor
+        executor.shutdown(wait=True)
+
+class _ManipuladorHTTP(BaseHTTPRequestHandler):
+    """
+    API HTTP do serviço (JSON):
+        POST /jobs            {"entrada": ..., "saida": ..., "opcoes": {...}} -> 202 {"id": ...}; 503 com a fila
+                              cheia ou com o pool sendo recriado; 500 se o serviço estiver encerrando
+        GET  /jobs/<id>       estado do job; ?esperar=N espera até N segundos que ele termine
+        GET  /metricas        contadores, fila e percentis de latência
+        GET  /saude           {"ok": true}
+    """
+
+    def _responder(self, status: int, corpo: dict):
+        dados = json.dumps(corpo, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(dados)))
+        self.end_headers()
+        self.wfile.write(dados)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        servico: ServicoConversao = self.server.servico
+        if url.path == "/saude":
+            self._responder(200, {"ok": True})
+        elif url.path == "/metricas":
+            self._responder(200, servico.metricas())
+        elif url.path.startswith("/jobs/"):
+            try:
+                esperar = float(parse_qs(url.query).get("esperar", ["0"])[0])
+            except ValueError:
+                self._responder(400, {"erro": "esperar deve ser um número de segundos"})
+                return
+            job = servico.consultar(url.path[len("/jobs/"):], esperar)
+            if job is None:
+                self._responder(404, {"erro": "job não encontrado"})
+            else:
+                self._responder(200, job)
+        else:
+            self._responder(404, {"erro": "rota não encontrada"})
+
+    def do_POST(self):
+        if urlparse(self.path).path != "/jobs":
+            self._responder(404, {"erro": "rota não encontrada"})
+            return
+        try:
+            tamanho = int(self.headers.get("Content-Length", 0))
+            pedido = json.loads(self.rfile.read(tamanho) or b"{}")
+            identificador = self.server.servico.enviar(pedido["entrada"], pedido["saida"], pedido.get("opcoes"))
+        except KeyError as e:
+            self._responder(400, {"erro": f"campo obrigatório ausente: {e.args[0]}"})
+            return
+        except (ValueError, TypeError, AttributeError) as e:
+            self._responder(400, {"erro": str(e)})
+            return
+        except BrokenProcessPool:
+            self._responder(503, {"erro": "um processo do pool morreu e o pool foi recriado, tente novamente"})
+            return
+        except RuntimeError as e:
+            # submit depois de encerrar() (SIGTERM com a requisição em andamento)
+            self._responder(500, {"erro": str(e)})
+            return
+        if identificador is None:
+            self._responder(503, {"erro": "fila cheia, tente novamente mais tarde"})
+        else:
+            self._responder(202, {"id": identificador, "estado": "na_fila"})
+
+    def log_message(self, formato, *args):
+        logger.debug("%s - %s", self.address_string(), formato % args)
+
+def iniciar_servidor(servico: ServicoConversao, endereco: str = ENDERECO_PADRAO,
+                     porta: int = PORTA_PADRAO) -> ThreadingHTTPServer:
+    """Cria o servidor HTTP do serviço (porta 0 escolhe uma porta livre); use serve_forever() para atender."""
+    servidor = ThreadingHTTPServer((endereco, porta), _ManipuladorHTTP)
+    servidor.daemon_threads = True
+    servidor.servico = servico
+    return servidor
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serviço residente de conversão MEXC -> Koinly (API HTTP local).")
+    parser.add_argument("--endereco", default=ENDERECO_PADRAO, help=f"Endereço de escuta (padrão: {ENDERECO_PADRAO})")
+    parser.add_argument("--porta", type=int, default=PORTA_PADRAO, help=f"Porta (padrão: {PORTA_PADRAO}; 0 escolhe uma livre)")
+    parser.add_argument("--processos", type=int, default=0, metavar="N", help="Processos do pool (0: um por CPU)")
+    parser.add_argument("--fila", type=int, default=TAMANHO_FILA_PADRAO, metavar="N",
+                        help="Máximo de jobs na fila ou em execução; os demais são recusados com 503")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Log detalhado, incluindo cada requisição")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+    servico = ServicoConversao(args.processos or None, args.fila)
+    servidor = iniciar_servidor(servico, args.endereco, args.porta)
+    # SIGTERM encerra como Ctrl+C: para de aceitar jobs e espera os que estão em andamento
+    signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=servidor.shutdown).start())
+    logger.info(f"Serviço ouvindo em http://{servidor.server_address[0]}:{servidor.server_address[1]} "
+                f"({servico.processos} processos, fila de {servico.tamanho_fila})")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+        servico.encerrar()
+        logger.info("Serviço encerrado")
@@ -0,0 +1,23 @@
+import os
+import sys
+
+import pytest
+
+# Os scripts ficam na raiz do repositório, sem pacote instalável
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gerar_extrato_sintetico import gerar_extrato  # noqa: E402
+
+@pytest.fixture(scope="session")
+def extrato_formato_2(tmp_path_factory) -> str:
+    """Extrato sintético pequeno no FORMATO_2 (depósitos, airdrops e trades com vários fills por segundo)."""
+    caminho = str(tmp_path_factory.mktemp("extratos") / "formato_2.csv")
+    gerar_extrato(caminho, formato="FORMATO_2", linhas=600, semente=7)
+    return caminho
+
+@pytest.fixture(scope="session")
+def extrato_formato_1(tmp_path_factory) -> str:
+    """Extrato sintético pequeno no FORMATO_1 (histórico de ordens, sem taxas)."""
+    caminho = str(tmp_path_factory.mktemp("extratos") / "formato_1.csv")
+    gerar_extrato(caminho, formato="FORMATO_1", linhas=500, semente=7)
+    return caminho
@@ -0,0 +1,61 @@
+import mexc_to_koinly as conversor
+
+CABECALHO = ",".join(conversor.COLUNAS_KOINLY)
+
+def gravar_koinly(caminho, linhas) -> str:
+    """Grava um CSV do Koinly a partir de linhas (date, sent, sent_currency, received, received_currency, fee, fee_currency, label)."""
+    with open(caminho, 'w', encoding='utf-8') as f:
+        f.write(CABECALHO + "\n")
+        for data, enviado, moeda_enviada, recebido, moeda_recebida, taxa, moeda_taxa, label in linhas:
+            f.write(f"{data},{enviado},{moeda_enviada},{recebido},{moeda_recebida},{taxa},{moeda_taxa},,,{label},,\n")
+    return str(caminho)
+
+def test_coluna_de_taxa_vazia(extrato_formato_1, tmp_path):
+    """O FORMATO_1 não tem taxas: a coluna Fee Currency inteira fica vazia."""
+    saida = str(tmp_path / "formato_1.csv")
+    conversor.converter_mexc_para_koinly(extrato_formato_1, saida)
+    relatorio = conversor.conciliar_koinly(saida)
+    assert relatorio["linhas"] > 0
+    assert relatorio["saldos_finais"]
+    assert relatorio["taxas_divergentes"]["total"] == 0
+
+def test_so_depositos(tmp_path):
+    caminho = gravar_koinly(tmp_path / "depositos.csv", [
+        ("2024-01-01 00:00:00 UTC", "", "", "10", "USDT", "", "", "Deposit"),
+        ("2024-01-02 00:00:00 UTC", "", "", "0.5", "BTC", "", "", "Deposit"),
+    ])
+    relatorio = conversor.conciliar_koinly(caminho)
+    assert relatorio["ok"]
+    assert relatorio["saldos_finais"] == {"BTC": "0.5", "USDT": "10"}
+
+def test_data_invalida(tmp_path):
+    """'Invalid Date' (gravada por datas_para_koinly para datas ilegíveis) não interrompe a conciliação."""
+    caminho = gravar_koinly(tmp_path / "datas.csv", [
+        ("Invalid Date", "", "", "10", "USDT", "", "", "Deposit"),
+        ("2024-01-01 00:00:00 UTC", "5", "USDT", "1", "BTC", "0.1", "USDT", "Trade"),
+    ])
+    relatorio = conversor.conciliar_koinly(caminho)
+    assert relatorio["saldos_finais"] == {"BTC": "1", "USDT": "4.9"}
+    assert not relatorio["saldos_negativos"]
+
+def test_saldos_exatos_com_18_casas(tmp_path):
+    """Quantidades com mais dígitos do que um float guarda somam exatamente zero."""
+    caminho = gravar_koinly(tmp_path / "pepe.csv", [
+        ("2024-01-01 00:00:00 UTC", "", "", "0.123456789012345678", "PEPE", "", "", "Deposit"),
+        ("2024-01-01 00:00:01 UTC", "", "", "0.876543210987654322", "PEPE", "", "", "Deposit"),
+        ("2024-01-01 00:00:02 UTC", "0.9", "PEPE", "", "", "0.1", "PEPE", "Withdrawal"),
+    ])
+    relatorio = conversor.conciliar_koinly(caminho)
+    assert relatorio["saldos_finais"] == {"PEPE": "0"}
+    assert not relatorio["saldos_negativos"]
+    assert relatorio["ok"]
+
+def test_taxa_divergente_mostra_o_texto_da_taxa(tmp_path):
+    caminho = gravar_koinly(tmp_path / "taxa.csv", [
+        ("2024-01-01 00:00:00 UTC", "", "", "100", "USDT", "", "", "Deposit"),
+        ("2024-01-01 00:00:01 UTC", "5", "USDT", "1", "BTC", "0.000000000000000001", "MX", "Trade"),
+    ])
+    exemplos = conversor.conciliar_koinly(caminho)["taxas_divergentes"]["exemplos"]
+    assert [(e["linha"], e["motivos"], e["fee_amount"]) for e in exemplos] == [
+        (3, ["taxa_fora_do_par"], "0.000000000000000001")
+    ]
@@ -0,0 +1,234 @@
+import json
+import os
+from decimal import Decimal
+
+import pandas as pd
+
+import mexc_to_koinly as conversor
+from gerar_extrato_sintetico import gerar_extrato
+
+def _trades_do_baseline(df, timestamp):
+    """
+    Cópia congelada da parte de trades de processar_trades_relacionados da
+    versão original (antes do pareamento em uma passada), sem os prints. Não
+    deve acompanhar mudanças do conversor: é a referência do comportamento antigo.
+    """
+    def parse_float_value(value):
+        if isinstance(value, float):
+            return value
+        elif isinstance(value, str):
+            return float(value.replace(',', '.'))
+        return 0.0
+
+    linhas_koinly = []
+    trades = df[
+        (df['Data de criação(UTC+-3)'] == timestamp) &
+        (df['Tipo de transação'].isin(['Negociação Spot', 'Taxas de Negociação Spot']))
+    ]
+    if len(trades) > 0:
+        spot_trades = trades[trades['Tipo de transação'] == 'Negociação Spot']
+        trades_por_cripto = {}
+        for _, trade in spot_trades.iterrows():
+            cripto = trade['Cripto']
+            if cripto not in trades_por_cripto:
+                trades_por_cripto[cripto] = {'entrada': [], 'saida': []}
+            if trade['Direção'] == 'Fluxo de entrada':
+                trades_por_cripto[cripto]['entrada'].append(trade)
+            else:
+                trades_por_cripto[cripto]['saida'].append(trade)
+        moedas = list(trades_por_cripto.keys())
+        for i in range(0, len(moedas), 2):
+            moeda1 = moedas[i]
+            moeda2 = moedas[i + 1] if i + 1 < len(moedas) else None
+            if moeda2 is None:
+                continue
+            trades1 = trades_por_cripto[moeda1]
+            trades2 = trades_por_cripto[moeda2]
+            total1_entrada = sum(abs(parse_float_value(t['Quantidade'])) for t in trades1['entrada'])
+            total1_saida = sum(abs(parse_float_value(t['Quantidade'])) for t in trades1['saida'])
+            total2_entrada = sum(abs(parse_float_value(t['Quantidade'])) for t in trades2['entrada'])
+            total2_saida = sum(abs(parse_float_value(t['Quantidade'])) for t in trades2['saida'])
+            fee = trades[
+                (trades['Tipo de transação'] == 'Taxas de Negociação Spot') &
+                (trades['Cripto'] == 'USDT')
+            ]
+            fee_amount = str(abs(parse_float_value(fee['Quantidade'].sum()))) if not fee.empty else ''
+            if total1_entrada > 0 and total2_saida > 0:
+                linhas_koinly.append({
+                    'Date': f"{timestamp} UTC", 'Sent Amount': str(total2_saida), 'Sent Currency': moeda2,
+                    'Received Amount': str(total1_entrada), 'Received Currency': moeda1,
+                    'Fee Amount': fee_amount, 'Fee Currency': 'USDT' if fee_amount else '',
+                    'Label': 'Trade', 'Description': f"Trade: {moeda2} -> {moeda1}"
+                })
+            elif total1_saida > 0 and total2_entrada > 0:
+                linhas_koinly.append({
+                    'Date': f"{timestamp} UTC", 'Sent Amount': str(total1_saida), 'Sent Currency': moeda1,
+                    'Received Amount': str(total2_entrada), 'Received Currency': moeda2,
+                    'Fee Amount': fee_amount, 'Fee Currency': 'USDT' if fee_amount else '',
+                    'Label': 'Trade', 'Description': f"Trade: {moeda1} -> {moeda2}"
+                })
+    return linhas_koinly
+
+def _comparavel(linha):
+    """Campos de uma linha Trade com as quantidades arredondadas a 8 casas (o baseline somava em float)."""
+    def valor(texto):
+        return Decimal(texto).quantize(Decimal('1e-8')) if texto else None
+    return (linha['Date'], valor(linha['Sent Amount']), linha['Sent Currency'],
+            valor(linha['Received Amount']), linha['Received Currency'],
+            valor(linha['Fee Amount']), linha['Fee Currency'], linha['Label'], linha['Description'])
+
+def test_grupos_em_uma_passada_iguais_ao_baseline_por_timestamp(tmp_path):
+    """Os trades pareados de uma vez batem com o algoritmo original, aplicado timestamp a timestamp."""
+    # Só pares cotados em USDT e um par por segundo: os casos que o baseline já tratava certo
+    extrato = str(tmp_path / "usdt.csv")
+    gerar_extrato(extrato, formato="FORMATO_2", linhas=600, pares=9, semente=7)
+    mapeamento = conversor.FORMATOS["FORMATO_2"]
+    _, _, trades = conversor.converter_dataframe(conversor.read_mexc_file(extrato), mapeamento)
+    em_uma_passada = [_comparavel(dict(zip(conversor.COLUNAS_KOINLY, linha))) for bloco in trades for linha in bloco]
+
+    bruto = pd.read_csv(extrato, delimiter=';')
+    por_timestamp = [linha for timestamp in bruto['Data de criação(UTC+-3)'].unique()
+                     for linha in _trades_do_baseline(bruto, timestamp)]
+    # O baseline não convertia o horário do extrato (UTC-3) para UTC
+    datas_utc = conversor.datas_para_koinly(pd.Series([linha['Date'][:-4] for linha in por_timestamp]))
+    for linha, data in zip(por_timestamp, datas_utc):
+        linha['Date'] = data
+
+    assert len(em_uma_passada) > 50
+    assert em_uma_passada == [_comparavel(linha) for linha in por_timestamp]
+
+def test_checkpoint_de_outra_versao_reconverte_tudo(extrato_formato_2, tmp_path):
+    """Um CSV incremental gerado por outra versão é regravado inteiro, não acrescentado."""
+    saida = str(tmp_path / "koinly.csv")
+    conversor.converter_mexc_para_koinly(extrato_formato_2, saida, incremental=True)
+    with open(saida, 'rb') as f:
+        completo = f.read()
+    checkpoint = conversor.caminho_checkpoint(saida)
+    with open(checkpoint, encoding='utf-8') as f:
+        dados = json.load(f)
+    dados["versao"] = "0.0.0"
+    dados["ultimo_timestamp"] = "2000-01-01 00:00:00"
+    with open(checkpoint, 'w', encoding='utf-8') as f:
+        json.dump(dados, f)
+
+    conversor.converter_mexc_para_koinly(extrato_formato_2, saida, incremental=True)
+    with open(saida, 'rb') as f:
+        assert f.read() == completo
+    assert conversor.carregar_checkpoint(checkpoint)["versao"] == conversor.VERSAO
+
+def test_quantidades_longas_depois_da_amostra_csv(tmp_path):
+    """Quantidades com 18 dígitos depois da amostra farejada do CSV chegam exatas à saída, inteira e em streaming."""
+    extrato = str(tmp_path / "longo.csv")
+    gerar_extrato(extrato, formato="FORMATO_2", linhas=3000, semente=3)
+    assert os.path.getsize(extrato) > conversor.TAMANHO_AMOSTRA_CSV
+    with open(extrato, 'a', encoding='utf-8') as f:
+        f.write("2030-01-01 00:00:00;PEPE;Depositar;Fluxo de entrada;123456789.123456789\n")
+        f.write("2030-01-01 00:00:01;PEPE;Depositar;Fluxo de entrada;0.123456789012345678\n")
+
+    for streaming in (False, True):
+        saida = str(tmp_path / f"koinly_{streaming}.csv")
+        conversor.converter_mexc_para_koinly(extrato, saida, streaming=streaming)
+        with open(saida, encoding='utf-8-sig') as f:
+            recebidas = [linha.split(',')[3] for linha in f if ',PEPE,' in linha and '2030-01-01' in linha]
+        assert recebidas == ["123456789.123456789", "0.123456789012345678"]
+
+def test_instrumentacao_mede_memoria_ao_final_de_cada_estagio():
+    """Cada estágio guarda o pico de RSS lido ao sair dele, não o do final da conversão."""
+    leituras = iter([10.0, 20.0, 30.0])
+    instrumentacao = conversor.Instrumentacao(memoria=lambda: next(leituras))
+    with instrumentacao.estagio("read"):
+        pass
+    with instrumentacao.estagio("match"):
+        pass
+    with instrumentacao.estagio("read"):
+        pass
+    assert instrumentacao.rss_pico_mb == {"read": 30.0, "match": 20.0}
+    assert conversor.Instrumentacao().rss_pico_mb == {}
+
+def test_extrato_so_com_cabecalho_e_incremental_sem_novidades(extrato_formato_2, tmp_path):
+    """Um extrato só com cabeçalho gera um CSV só com cabeçalho, e um incremental sem linhas novas mantém a saída."""
+    vazio = str(tmp_path / "vazio.csv")
+    with open(extrato_formato_2, encoding='utf-8') as origem, open(vazio, 'w', encoding='utf-8') as destino:
+        destino.write(origem.readline())
+    saida_vazia = str(tmp_path / "koinly_vazio.csv")
+    conversor.converter_mexc_para_koinly(vazio, saida_vazia)
+    with open(saida_vazia, encoding='utf-8-sig') as f:
+        assert f.read().splitlines() == [",".join(conversor.COLUNAS_KOINLY)]
+
+    saida = str(tmp_path / "koinly.csv")
+    conversor.converter_mexc_para_koinly(extrato_formato_2, saida, incremental=True)
+    with open(saida, 'rb') as f:
+        completo = f.read()
+    conversor.converter_mexc_para_koinly(extrato_formato_2, saida, incremental=True)
+    with open(saida, 'rb') as f:
+        assert f.read() == completo
+
+def _exportacao_parcial(extrato, destino, corte):
+    """Grava em destino o cabeçalho e as primeiras corte linhas do extrato, como uma exportação feita mais cedo."""
+    with open(extrato, encoding='utf-8') as f:
+        linhas = f.readlines()
+    with open(destino, 'w', encoding='utf-8') as f:
+        f.writelines(linhas[:corte + 1])
+    return linhas[1:]
+
+def _linhas_ordenadas(caminho):
+    """Linhas de dados de um CSV do Koinly, sem o cabeçalho, em ordem (a conversão incremental muda a ordem das linhas)."""
+    with open(caminho, encoding='utf-8-sig') as f:
+        return sorted(f.read().splitlines()[1:])
+
+def _corte_no_meio_de_um_trade(extrato):
+    """Índice (sem o cabeçalho) logo após a primeira perna de um trade com taxa, perto do meio do extrato."""
+    with open(extrato, encoding='utf-8') as f:
+        linhas = f.readlines()[1:]
+    datas = [linha.split(';', 1)[0] for linha in linhas]
+    for indice in range(len(linhas) // 2, len(linhas)):
+        grupo = [linha for linha, data in zip(linhas, datas) if data == datas[indice]]
+        if indice == datas.index(datas[indice]) and any('Taxas' in linha for linha in grupo[1:]):
+            return indice + 1
+    raise AssertionError("extrato sem trade com taxa na segunda metade")
+
+def test_trade_dividido_entre_duas_exportacoes(extrato_formato_2, tmp_path):
+    """Um trade com pernas em duas exportações sai pareado por inteiro, com a taxa completa, e a conciliação do trecho novo bate com a completa."""
+    primeira = str(tmp_path / "primeira.csv")
+    _exportacao_parcial(extrato_formato_2, primeira, _corte_no_meio_de_um_trade(extrato_formato_2))
+    saida = str(tmp_path / "koinly.csv")
+    conversor.converter_mexc_para_koinly(primeira, saida, incremental=True)
+    conversor.converter_mexc_para_koinly(extrato_formato_2, saida, incremental=True)
+
+    completa = str(tmp_path / "completa.csv")
+    conversor.converter_mexc_para_koinly(extrato_formato_2, completa)
+    assert _linhas_ordenadas(saida) == _linhas_ordenadas(completa)
+    relatorio = conversor.conciliar_koinly(saida, incremental=True)
+    esperado = conversor.conciliar_koinly(completa)
+    assert relatorio["taxas_divergentes"]["total"] == 0
+    assert dict(relatorio, arquivo=None) == dict(esperado, arquivo=None)
+
+def test_delta_retem_o_ultimo_timestamp(extrato_formato_2, tmp_path):
+    """Com arquivo delta, o último segundo de cada exportação só é entregue na execução seguinte, já com todas as pernas."""
+    primeira = str(tmp_path / "primeira.csv")
+    corte = _corte_no_meio_de_um_trade(extrato_formato_2)
+    linhas = _exportacao_parcial(extrato_formato_2, primeira, corte)
+    saida, delta = str(tmp_path / "koinly.csv"), str(tmp_path / "novas.csv")
+    conversor.converter_mexc_para_koinly(primeira, saida, incremental=True, arquivo_delta=delta)
+    conversor.converter_mexc_para_koinly(extrato_formato_2, saida, incremental=True, arquivo_delta=delta)
+
+    ultima_data = linhas[-1].split(';', 1)[0]
+    sem_ultimo = str(tmp_path / "sem_ultimo.csv")
+    _exportacao_parcial(extrato_formato_2, sem_ultimo,
+                        sum(1 for linha in linhas if not linha.startswith(ultima_data + ';')))
+    esperado = str(tmp_path / "esperado.csv")
+    conversor.converter_mexc_para_koinly(sem_ultimo, esperado)
+    assert sorted(_linhas_ordenadas(saida) + _linhas_ordenadas(delta)) == _linhas_ordenadas(esperado)
+
+def test_limpar_cache_so_remove_entradas_do_conversor(tmp_path):
+    """Outros .pkl na pasta do cache não são apagados, nem por versão nem pelo limite de tamanho."""
+    atual, atual_precos = f"{conversor.VERSAO}-{'a' * 64}.pkl", f"{conversor.VERSAO}-precos-{'b' * 64}.pkl"
+    antigas = [f"1.0.0-{'c' * 64}.pkl", f"1.0.0-precos-{'d' * 64}.pkl"]
+    alheios = ["modelo.pkl", "1.0.0-notas.pkl", f"{'e' * 64}.pkl", f"1.0.0-{'f' * 64}.pkl.bak"]
+    for nome in [atual, atual_precos] + antigas + alheios:
+        (tmp_path / nome).write_bytes(b"x" * 10)
+
+    conversor.limpar_cache(str(tmp_path))
+    assert sorted(os.listdir(tmp_path)) == sorted([atual, atual_precos] + alheios)
+    conversor.limpar_cache(str(tmp_path), tamanho_maximo=0)
+    assert sorted(os.listdir(tmp_path)) == sorted(alheios)
@@ -0,0 +1,39 @@
+from datetime import datetime
+
+import pandas as pd
+
+import mexc_to_koinly as conversor
+
+def test_utc_menos_3_vira_o_dia_e_o_ano():
+    datas = pd.Series(["2023-12-31 22:30:00", "2023-12-31 20:59:59", "2024-02-28 21:00:00", "2024-02-29 23:00:00"],
+                      index=[10, 11, 12, 13])
+    convertidas = conversor.datas_para_koinly(datas, -3)
+    assert convertidas.tolist() == [
+        "2024-01-01 01:30:00 UTC", "2023-12-31 23:59:59 UTC", "2024-02-29 00:00:00 UTC", "2024-03-01 02:00:00 UTC"
+    ]
+    assert convertidas.index.tolist() == [10, 11, 12, 13]
+    assert conversor.parse_datetime_to_koinly("2023-12-31 22:30:00", -3) == "2024-01-01 01:30:00 UTC"
+
+def test_categorias_datetime_e_datas_invalidas():
+    """Texto categórico, datetime do Excel e datas ilegíveis ou vazias dão o mesmo resultado que parse_datetime_to_koinly."""
+    texto = pd.Series([" 2023-12-31 22:30:00", "31/12/2023", None, " 2023-12-31 22:30:00"], dtype="category")
+    assert conversor.datas_para_koinly(texto).tolist() == [
+        "2024-01-01 01:30:00 UTC", "Invalid Date", "Invalid Date", "2024-01-01 01:30:00 UTC"
+    ]
+    excel = pd.Series([datetime(2023, 12, 31, 22, 30), pd.NaT])
+    assert conversor.datas_para_koinly(excel).tolist() == ["2024-01-01 01:30:00 UTC", "Invalid Date"]
+    assert conversor.parse_datetime_to_koinly("31/12/2023") == "Invalid Date"
+
+def test_fuso_positivo_volta_o_dia():
+    assert conversor.datas_para_koinly(pd.Series(["2024-01-01 05:00:00"]), 8).tolist() == ["2023-12-31 21:00:00 UTC"]
+
+def test_fuso_da_coluna():
+    assert conversor.fuso_da_coluna("Data de criação(UTC+-3)") == -3
+    assert conversor.fuso_da_coluna("Time(UTC+8)") == 8
+    assert conversor.fuso_da_coluna("Time(UTC-5)") == -5
+    assert conversor.fuso_da_coluna("Hora (UTC+5,5)") == 5.5
+    assert conversor.fuso_da_coluna(conversor.FORMATOS["FORMATO_2"]["COL_DATA"]) == -3
+
+def test_fuso_da_coluna_sem_indicacao_usa_o_padrao():
+    assert conversor.fuso_da_coluna("Data de criação") == conversor.FUSO_ORIGEM_PADRAO_HORAS
+    assert conversor.fuso_da_coluna("Horário") == conversor.FUSO_ORIGEM_PADRAO_HORAS
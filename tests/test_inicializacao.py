@@ -0,0 +1,33 @@
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from benchmark import MODULOS_PESADOS, ORCAMENTO_INICIALIZACAO_S
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "mexc_to_koinly.py")
+
+def test_help_nao_importa_modulos_pesados():
+    """--help roda o script inteiro como __main__ e termina sem carregar pandas, numpy nem openpyxl."""
+    verificacao = (
+        "import runpy, sys\n"
+        f"sys.argv = [{SCRIPT!r}, '--help']\n"
+        "try:\n"
+        f"    runpy.run_path({SCRIPT!r}, run_name='__main__')\n"
+        "except SystemExit:\n"
+        "    pass\n"
+        f"print('carregados:', ','.join(m for m in {MODULOS_PESADOS!r} if m in sys.modules))\n"
+    )
+    saida = subprocess.run([sys.executable, "-c", verificacao], check=True, capture_output=True, text=True)
+    assert "--incremental" in saida.stdout
+    assert saida.stdout.splitlines()[-1] == "carregados: "
+
+def test_help_dentro_do_orcamento():
+    """Mediana de --help em processos novos; o limite é folgado (o dobro do orçamento) para máquinas de CI lentas."""
+    tempos = []
+    for _ in range(5):
+        inicio = time.perf_counter()
+        subprocess.run([sys.executable, SCRIPT, "--help"], check=True, capture_output=True)
+        tempos.append(time.perf_counter() - inicio)
+    assert statistics.median(tempos) <= 2 * ORCAMENTO_INICIALIZACAO_S
@@ -0,0 +1,82 @@
+import pandas as pd
+
+import mexc_to_koinly as conversor
+from gerar_extrato_sintetico import gerar_extrato
+
+TIMESTAMP = "2024-01-01 00:00:00"
+
+def grupo(*pernas) -> pd.DataFrame:
+    """Trades e taxas de um único timestamp no FORMATO_2, a partir de (cripto, tipo, quantidade com sinal)."""
+    tipos = {"spot": "Negociação Spot", "taxa": "Taxas de Negociação Spot"}
+    return pd.DataFrame(
+        [(TIMESTAMP, cripto, tipos[tipo], "Fluxo de entrada" if not quantidade.startswith('-') else "Fluxo de saída",
+          quantidade) for cripto, tipo, quantidade in pernas],
+        columns=list(conversor.FORMATOS["FORMATO_2"].values())
+    )
+
+def trades(df, instrumentacao=None):
+    """Linhas Trade do grupo como (enviado, moeda enviada, recebido, moeda recebida, taxa, moeda da taxa)."""
+    return [
+        (linha.sent_amount, linha.sent_currency, linha.received_amount, linha.received_currency,
+         linha.fee_amount, linha.fee_currency)
+        for linha in conversor.processar_grupo_trades(df, TIMESTAMP, instrumentacao)
+    ]
+
+def test_dois_pares_no_mesmo_segundo_com_as_suas_taxas():
+    df = grupo(
+        ("BTC", "spot", "0.1"), ("USDT", "spot", "-5000"), ("USDT", "taxa", "-5"),
+        ("ETH", "spot", "-2"), ("USDT", "spot", "3000"), ("USDT", "taxa", "-3"),
+    )
+    assert trades(df) == [
+        ("5000", "USDT", "0.1", "BTC", "5", "USDT"),
+        ("2", "ETH", "3000", "USDT", "3", "USDT"),
+    ]
+
+def test_parear_pernas_indexa_as_taxas_pelo_par():
+    """Direto em parear_pernas: uma taxa que chega antes do par da sua moeda espera por ele."""
+    instrumentacao = conversor.Instrumentacao()
+    pares = conversor.parear_pernas([
+        ("ETH", True, False, 1),
+        ("BTC", False, True, 10), ("USDT", False, False, 500), ("USDT", True, False, 5),
+        ("ETH", False, False, 20), ("USDT", False, True, 300),
+    ], TIMESTAMP, {"BTC": 0, "ETH": 0, "USDT": 0}, instrumentacao)
+    assert pares == {
+        ("BTC", "USDT"): [10, 500, {"USDT": 5}],
+        ("USDT", "ETH"): [300, 20, {"ETH": 1}],
+    }
+    assert instrumentacao.contadores["pernas_sem_par"] == 0
+
+def test_taxa_na_moeda_base_e_fora_de_usdt():
+    """Taxas em BTC (moeda recebida) e em ETH (par cotado em BTC) vão para o par de cada uma."""
+    um_par = grupo(("BTC", "spot", "0.1"), ("USDT", "spot", "-5000"), ("BTC", "taxa", "-0.0001"))
+    assert trades(um_par) == [("5000", "USDT", "0.1", "BTC", "0.0001", "BTC")]
+
+    dois_pares = grupo(
+        ("BTC", "spot", "0.1"), ("USDT", "spot", "-5000"), ("BTC", "taxa", "-0.0001"),
+        ("ETH", "spot", "2"), ("BTC", "spot", "-0.08"), ("ETH", "taxa", "-0.002"),
+    )
+    assert trades(dois_pares) == [
+        ("5000", "USDT", "0.1", "BTC", "0.0001", "BTC"),
+        ("0.08", "BTC", "2", "ETH", "0.002", "ETH"),
+    ]
+
+def test_numero_impar_de_pernas_registra_a_que_sobra():
+    instrumentacao = conversor.Instrumentacao()
+    df = grupo(("BTC", "spot", "0.1"), ("USDT", "spot", "-5000"), ("ETH", "spot", "2"), ("USDT", "taxa", "-5"))
+    assert trades(df, instrumentacao) == [("5000", "USDT", "0.1", "BTC", "5", "USDT")]
+    assert instrumentacao.contadores["pernas_sem_par"] == 1
+    assert instrumentacao.pernas_sem_par == [
+        {"timestamp": TIMESTAMP, "moeda": "ETH", "lado": "entrada", "quantidade": "2"}
+    ]
+
+def test_extrato_com_pares_simultaneos(tmp_path):
+    """Com vários pares por segundo, todas as pernas do gerador são pareadas e cada taxa fica no seu par."""
+    extrato = str(tmp_path / "simultaneos.csv")
+    gerar_extrato(extrato, formato="FORMATO_2", linhas=1500, semente=3, pares_por_segundo=3)
+    saida = str(tmp_path / "koinly.csv")
+    instrumentacao = conversor.converter_mexc_para_koinly(extrato, saida)
+    assert instrumentacao.contadores["grupos_com_varios_pares"] > 0
+    assert instrumentacao.contadores["pernas_sem_par"] == 0
+    relatorio = conversor.conciliar_koinly(saida)
+    assert relatorio["taxas_divergentes"]["total"] == 0
+    assert relatorio["pernas_sem_par"]["trades_incompletos"] == 0
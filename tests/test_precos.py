@@ -0,0 +1,22 @@
+import numpy as np
+import pandas as pd
+
+import mexc_to_koinly as conversor
+
+def test_net_worth_ignora_datas_invalidas(tmp_path):
+    """Linhas com 'Invalid Date' ficam sem preço, inclusive na moeda de referência, e não interrompem a regravação."""
+    caminho = tmp_path / "koinly.csv"
+    caminho.write_text(
+        ",".join(conversor.COLUNAS_KOINLY) + "\n"
+        "Invalid Date,,,10,USD,,,,,Deposit,,\n"
+        "Invalid Date,,,1,BTC,,,,,Deposit,,\n"
+        "2024-01-01 00:00:00 UTC,,,1,BTC,,,,,Deposit,,\n",
+        encoding='utf-8'
+    )
+    precos = conversor.TabelaPrecos.de_dataframe(
+        pd.Series(["BTC"]), np.array([1704067200 - 60]), np.array([40000.0])
+    )
+    assert conversor.preencher_net_worth(str(caminho), precos) == 1
+    resultado = pd.read_csv(caminho, dtype=str, keep_default_na=False, encoding='utf-8-sig')
+    assert resultado['Net Worth Amount'].tolist() == ['', '', '40000']
+    assert resultado['Net Worth Currency'].tolist() == ['', '', 'USD']
@@ -0,0 +1,34 @@
+from decimal import Decimal
+
+import numpy as np
+import pandas as pd
+
+import mexc_to_koinly as conversor
+
+def como_decimais(mantissas, casas):
+    return [Decimal(int(m)).scaleb(-int(c)) for m, c in zip(mantissas.tolist(), casas.tolist())]
+
+def test_floats_usam_o_decimal_de_repr():
+    """Floats do Excel viram o decimal curto de repr, inclusive com mais de 15 dígitos significativos."""
+    valores = [123456789.12345679, 0.1, 1e-17, 0.30000000000000004, 1e20, 12345.678,
+               0.12345678901234568, 9007199254740992.0, -2.5, 0.0]
+    mantissas, casas = conversor.parse_quantidades_exatas(pd.Series(valores))
+    assert como_decimais(mantissas, casas) == [Decimal(repr(valor)) for valor in valores]
+
+def test_floats_aleatorios_usam_o_decimal_de_repr():
+    rng = np.random.default_rng(0)
+    valores = np.concatenate([rng.uniform(0, 1e6, 2000), np.round(rng.uniform(0, 50, 2000), 8)])
+    mantissas, casas = conversor.parse_quantidades_exatas(pd.Series(valores))
+    assert como_decimais(mantissas, casas) == [Decimal(repr(valor)) for valor in valores.tolist()]
+
+def test_texto_exato_com_virgula_e_muitas_casas():
+    serie = pd.Series(["0,123456789012345678", " 2.50 ", "", None, "-1e-3", "123456789012345678901.5"], dtype=object)
+    mantissas, casas = conversor.parse_quantidades_exatas(serie)
+    assert como_decimais(mantissas, casas) == [
+        Decimal("0.123456789012345678"), Decimal("2.5"), 0, 0, Decimal("-0.001"), Decimal("123456789012345678901.5")
+    ]
+
+def test_serie_vazia():
+    for serie in (pd.Series([], dtype=object), pd.Series([], dtype=str), pd.Series([], dtype=float)):
+        mantissas, casas = conversor.parse_quantidades_exatas(serie)
+        assert len(mantissas) == len(casas) == 0
@@ -0,0 +1,79 @@
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+import servico_koinly
+from servico_koinly import ServicoConversao
+
+def test_processo_morto_recria_o_pool(extrato_formato_2, tmp_path):
+    """Um processo morto quebra o pool: o job enviado a ele falha, nada fica na fila e o próximo job roda num pool novo."""
+    servico = ServicoConversao(processos=1, tamanho_fila=2)
+    try:
+        with pytest.raises(BrokenProcessPool):
+            servico._executor.submit(os._exit, 1).result()
+
+        with pytest.raises(BrokenProcessPool):
+            servico.enviar(extrato_formato_2, str(tmp_path / "perdido.csv"))
+        metricas = servico.metricas()
+        assert metricas["em_andamento"] == 0
+        assert metricas["jobs"]["falhas"] == 1
+        assert metricas["pools_recriados"] == 1
+
+        identificador = servico.enviar(extrato_formato_2, str(tmp_path / "koinly.csv"))
+        job = servico.consultar(identificador, esperar=servico_koinly.ESPERA_MAXIMA_S)
+        assert job["estado"] == "concluido", job.get("erro")
+        assert servico.metricas()["em_andamento"] == 0
+    finally:
+        servico.encerrar()
+
+def _requisitar(url, corpo=None):
+    """Faz GET (ou POST com corpo JSON) e retorna (status, JSON da resposta), inclusive para respostas de erro."""
+    dados = json.dumps(corpo).encode('utf-8') if corpo is not None else None
+    pedido = urllib.request.Request(url, data=dados, headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(pedido, timeout=servico_koinly.ESPERA_MAXIMA_S) as resposta:
+            return resposta.status, json.loads(resposta.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+def test_contrato_http(extrato_formato_2, tmp_path):
+    """POST /jobs, GET /jobs/<id>?esperar=, /metricas com percentis e 503 com a fila cheia, pela API HTTP."""
+    servico = ServicoConversao(processos=1, tamanho_fila=1)
+    servidor = servico_koinly.iniciar_servidor(servico, porta=0)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    base = f"http://{servidor.server_address[0]}:{servidor.server_address[1]}"
+    try:
+        # O único processo fica ocupado: o job aceito continua na fila e ocupa a única vaga
+        ocupado = servico._executor.submit(time.sleep, 1)
+        status, corpo = _requisitar(f"{base}/jobs", {"entrada": extrato_formato_2, "saida": str(tmp_path / "koinly.csv")})
+        assert status == 202 and corpo["estado"] == "na_fila"
+        identificador = corpo["id"]
+
+        status, corpo = _requisitar(f"{base}/jobs", {"entrada": extrato_formato_2, "saida": str(tmp_path / "outro.csv")})
+        assert status == 503
+        ocupado.result()
+
+        status, job = _requisitar(f"{base}/jobs/{identificador}?esperar={servico_koinly.ESPERA_MAXIMA_S}")
+        assert status == 200
+        assert job["estado"] == "concluido", job.get("erro")
+        assert job["resultado"]["conciliacao"]["relatorio"].endswith(".conciliacao.json")
+        assert os.path.exists(tmp_path / "koinly.csv")
+
+        status, metricas = _requisitar(f"{base}/metricas")
+        assert status == 200
+        assert metricas["jobs"] == {"aceitos": 1, "concluidos": 1, "falhas": 0, "recusados": 1}
+        for nome in ("espera_s", "execucao_s", "total_s"):
+            assert {"p50", "p95", "p99"} <= set(metricas["latencia"][nome])
+
+        assert _requisitar(f"{base}/jobs/inexistente")[0] == 404
+        assert _requisitar(f"{base}/jobs", {"saida": "x.csv"})[0] == 400
+    finally:
+        servidor.shutdown()
+        servidor.server_close()
+        servico.encerrar()